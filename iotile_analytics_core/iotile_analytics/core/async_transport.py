@@ -0,0 +1,509 @@
+"""An asyncio based transport for making many concurrent requests to iotile.cloud.
+
+CloudSession normally makes parallel requests from a pool of threads, with
+one thread blocked on each request in flight.  The AsyncTransport in this
+module makes requests from a single event loop using aiohttp instead, so
+the number of requests in flight is not tied to the number of threads.
+
+It shares the login, response cache, retry policy and concurrency control
+of the CloudSession that created it, so you can mix calls to both freely.
+You can await its methods from a running event loop, such as the one in a
+Jupyter notebook, or call them synchronously through run(), which is what
+CloudSession does when you select the 'asyncio' transport with
+CloudSession.set_transport().  Synchronous calls from any thread are all run
+on a single background event loop owned by the transport so that they share
+its connections.
+
+This module requires python 3.5 or later and the aiohttp package.
+"""
+
+import io
+import json
+import math
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+
+from typedargs.exceptions import ArgumentError
+from .exceptions import MissingPackageError
+from .interaction import ProgressBar
+from .utilities.url_routines import pack_url, native_headers, get_transport_settings
+from .utilities.throttle import AdaptiveLimiter, classify_error, request_class
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class AsyncTransport(object):
+    """Make concurrent requests to iotile.cloud from an asyncio event loop.
+
+    You should normally create an AsyncTransport by calling
+    CloudSession.async_transport() rather than directly.
+
+    Identical GET requests that are in flight at the same time on the same
+    event loop are only sent once and share their result.
+
+    Every request waits for a slot from the transport's own AdaptiveLimiter,
+    which starts at max_concurrency requests in flight and shrinks when the
+    server slows down or fails.  Its parent is the limiter that CloudSession
+    uses for the domain, so rate limits set with CloudSession.set_rate_limit()
+    and pauses after a Retry-After header apply to both transports, and
+    throttling seen by either one makes the domain back off.
+
+    Args:
+        session (CloudSession): The logged in session whose credentials, cache and
+            retry settings should be used.
+        max_concurrency (int): The maximum number of requests in flight at once.
+            Defaults to DEFAULT_CONCURRENCY.
+    """
+
+    DEFAULT_CONCURRENCY = 256
+
+    LIMITER_THREADS = 4
+    """The number of threads that wait for slots from the transport's limiter."""
+
+    CACHE_THREADS = 4
+    """The number of threads that read and write the session's response cache."""
+
+    def __init__(self, session, max_concurrency=None):
+        if aiohttp is None:
+            raise MissingPackageError("Missing required package aiohttp", package="aiohttp", suggestion="pip install aiohttp")
+
+        if max_concurrency is None:
+            max_concurrency = self.DEFAULT_CONCURRENCY
+
+        if max_concurrency < 1:
+            raise ArgumentError("You must allow at least one request in flight", max_concurrency=max_concurrency)
+
+        self.max_concurrency = max_concurrency
+        self.logger = logging.getLogger(__name__)
+
+        self._session = session
+        self._limiter = AdaptiveLimiter(initial=max_concurrency, minimum=1, maximum=max_concurrency,
+                                        parent=session._login_cache[session.domain]['limiter'])  #pylint:disable=protected-access
+
+        # aiohttp sessions and futures can only be used from the loop that created
+        # them, so we keep a client and the requests in flight for each loop.
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._inflight = {}
+
+        self._runner = None
+        self._runner_thread = None
+        self._limiter_pool = ThreadPoolExecutor(max_workers=self.LIMITER_THREADS)
+        self._cache_pool = ThreadPoolExecutor(max_workers=self.CACHE_THREADS)
+
+        self._requests = 0
+        self._coalesced = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def close(self):
+        """Close the connections this transport holds on the running event loop."""
+
+        loop = asyncio.get_event_loop()
+
+        with self._lock:
+            client = self._clients.pop(loop, None)
+
+        if client is not None and not client.closed:
+            await client.close()
+
+    def shutdown(self):
+        """Stop the background event loop and close all of its connections.
+
+        The transport cannot be used anymore once it has been shut down.  You
+        must not call this method from inside one of the transport's coroutines.
+        """
+
+        with self._lock:
+            loop, thread = self._runner, self._runner_thread
+            self._runner = None
+            self._runner_thread = None
+
+        if loop is not None:
+            asyncio.run_coroutine_threadsafe(self.close(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+
+        self._limiter_pool.shutdown(wait=False)
+        self._cache_pool.shutdown(wait=False)
+
+    def run(self, func, *args, **kwargs):
+        """Synchronously run one of this transport's coroutine methods.
+
+        The call is run on a background event loop that is started the first
+        time it is needed and shared by all threads, so connections are kept
+        alive and reused between calls.  This method blocks the calling thread
+        until the call finishes, even if an event loop is running in it, for
+        example inside a Jupyter notebook.
+
+        If it is called from a coroutine running on the background loop itself,
+        for instance from a postprocess function, the call is run on a new loop
+        in a separate thread instead since the background loop is busy.
+
+        Args:
+            func (callable): A coroutine function such as self.fetch_multiple.
+            *args: Positional arguments passed to func.
+            **kwargs: Keyword arguments passed to func.
+
+        Returns:
+            object: The return value of func.
+        """
+
+        with self._lock:
+            runner_thread = self._runner_thread
+
+        if threading.current_thread() is not runner_thread:
+            future = asyncio.run_coroutine_threadsafe(func(*args, **kwargs), self._ensure_runner())
+            return future.result()
+
+        async def _run_and_close():
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                await self.close()
+
+        def _run_in_new_loop():
+            loop = asyncio.new_event_loop()
+            try:
+                return loop.run_until_complete(_run_and_close())
+            finally:
+                loop.close()
+
+        outcome = {}
+
+        def _thread_main():
+            try:
+                outcome['result'] = _run_in_new_loop()
+            except BaseException as err:  # pylint:disable=W0703; we reraise this in the calling thread
+                outcome['error'] = err
+
+        thread = threading.Thread(target=_thread_main)
+        thread.start()
+        thread.join()
+
+        if 'error' in outcome:
+            raise outcome['error']
+
+        return outcome['result']
+
+    async def fetch_multiple(self, resources, per_call_kw=None, postprocess=None, message=None, postprocess_args=None,
+                             allow_partial=False, **kwargs):
+        """Fetch multiple resources concurrently.
+
+        This is the coroutine version of CloudSession.fetch_multiple and takes
+        the same arguments.
+
+        Returns:
+            dict[]: A list of the results for each resource.
+
+            If allow_partial is True, a tuple of that list, with None in place of
+            each failed result, and a list of FailedRequest objects.
+        """
+
+        calls = self._session._prepare_fetches(resources, per_call_kw, postprocess, postprocess_args, kwargs)  #pylint:disable=protected-access
+
+        with ProgressBar(total=len(resources), message=message, leave=False) as progbar:
+            wrapped_results = await asyncio.gather(*[self._fetch_resource(resource, query, progbar, postprocess, i, extra_args)
+                                                     for i, (resource, query, extra_args) in enumerate(calls)])
+
+        return self._session._collect_results(wrapped_results, allow_partial)  #pylint:disable=protected-access
+
+    async def fetch_all(self, resource, page_size=100, message=None, allow_partial=False, **kwargs):
+        """Fetch and concatenate all pages of a given resource concurrently.
+
+        This is the coroutine version of CloudSession.fetch_all and takes the
+        same arguments.
+
+        Returns:
+            dict[]: A list of the results concatenated from all pages.
+
+            If allow_partial is True, a tuple of that list, which skips any failed
+            pages, and a list of FailedRequest objects whose key is the failed page
+            number.
+        """
+
+        from .session import FailedRequest
+
+        with ProgressBar(total=1, leave=False, message=message) as progbar:
+            first, err = await self._fetch_page(resource, 1, page_size, kwargs, progbar)
+            if err is not None:
+                raise self._session._translate_error(err, msg="Error fetching resource from IOTile.cloud", url=resource.url())  #pylint:disable=protected-access
+
+            results = list(first.get('results', []))
+            failed = []
+
+            pages = int(math.ceil(first['count'] / float(page_size)))
+            if pages > 1:
+                progbar.total = pages
+
+                page_numbers = list(range(2, pages + 1))
+                wrapped_results = await asyncio.gather(*[self._fetch_page(resource, page, page_size, kwargs, progbar)
+                                                         for page in page_numbers])
+
+                for page, (result, err) in zip(page_numbers, wrapped_results):
+                    if err is None:
+                        results.extend(result.get('results'))
+                        continue
+
+                    if not allow_partial:
+                        raise self._session._translate_error(err, msg="Error fetching resource from IOTile.cloud",  #pylint:disable=protected-access
+                                                             url=resource.url(), page=page)
+
+                    failed.append(FailedRequest(page, err))
+
+        if allow_partial:
+            return results, failed
+
+        return results
+
+    async def post_multiple(self, urls, datas, headers=None, message=None, include_auth=True):
+        """Make multiple concurrent posts to urls with the contents as given by datas.
+
+        This is the coroutine version of CloudSession.post_multiple and takes
+        the same arguments.  Posts are never retried.
+
+        Returns:
+            list of str: A list of the actual responses to each post.
+        """
+
+        datas, headers = self._session._prepare_posts(urls, datas, headers, include_auth)  #pylint:disable=protected-access
+
+        with ProgressBar(total=len(urls), leave=False, message=message) as progbar:
+            wrapped_results = await asyncio.gather(*[self._post(url, data, url_headers, progbar)
+                                                     for url, data, url_headers in zip(urls, datas, headers)])
+
+        return self._session._collect_results(wrapped_results, False)  #pylint:disable=protected-access
+
+    def stats(self):
+        """Return statistics about requests made by this transport.
+
+        Returns:
+            dict: The total number of uncached GET requests, how many of them were
+                coalesced with an identical request already in flight, how many
+                distinct requests are currently in flight and, under throttle, the
+                statistics of the transport's limiter, see AdaptiveLimiter.stats().
+        """
+
+        with self._lock:
+            in_flight = sum(len(tasks) for tasks in self._inflight.values())
+
+        return {
+            'requests': self._requests,
+            'coalesced': self._coalesced,
+            'in_flight': in_flight,
+            'throttle': self._limiter.stats()
+        }
+
+    def _ensure_runner(self):
+        """Start the background event loop used by run() the first time it is needed."""
+
+        with self._lock:
+            if self._runner is None:
+                loop = asyncio.new_event_loop()
+
+                thread = threading.Thread(target=_run_forever, args=(loop,), name="AsyncTransport")
+                thread.daemon = True
+                thread.start()
+
+                self._runner = loop
+                self._runner_thread = thread
+
+            return self._runner
+
+    async def _fetch_resource(self, resource, query, progress, postprocess, i, postprocess_args):
+        try:
+            request = self._pack(resource, query)
+            result = await self._fetch_request(request)
+
+            if postprocess is not None:
+                result = postprocess(i, result, *postprocess_args)
+
+            progress.update(1)
+            return result, None
+        except Exception as err:  # pylint:disable=W0703; we do the exception processing in the calling function
+            self.logger.exception("Error fetching resource")
+            return None, err
+
+    async def _fetch_page(self, resource, page, page_size, kwargs, progress):
+        try:
+            query = kwargs.copy()
+            query['page_size'] = page_size
+            query['page'] = page
+
+            result = await self._fetch_request(self._pack(resource, query))
+
+            progress.update(1)
+            return result, None
+        except Exception as err:  # pylint:disable=W0703; we do the exception processing in the calling function
+            return None, err
+
+    async def _post(self, url, data, headers, progress):
+        try:
+            request = pack_url(url, headers=headers, verify=self._session.verify)
+            result = await self._request('POST', request.url, request, body=data)
+
+            progress.update(1)
+            return result.decode('utf-8'), None
+        except Exception as err:  # pylint:disable=W0703; we do the exception processing in the calling function
+            self.logger.exception("Error posting to url %s, headers=%s", url, headers)
+            return None, err
+
+    def _pack(self, resource, query):
+        session = self._session
+        return pack_url(resource.url(), query, token=session.token, token_type=session.token_type, verify=session.verify)
+
+    async def _in_thread(self, pool, func, *args):
+        """Run a blocking function in one of our thread pools so it does not stall the loop."""
+
+        return await asyncio.get_event_loop().run_in_executor(pool, func, *args)
+
+    async def _fetch_request(self, request):
+        """Get a request from the cache or make it, sharing any identical request in flight."""
+
+        key = request.request_key
+
+        result = await self._in_thread(self._cache_pool, self._session._check_cache, key)  #pylint:disable=protected-access
+        if result is not None:
+            return result
+
+        loop = asyncio.get_event_loop()
+
+        with self._lock:
+            self._requests += 1
+            inflight = self._inflight.setdefault(loop, {})
+
+            task = inflight.get(key)
+            if task is None:
+                task = asyncio.ensure_future(self._fetch_uncached(request))
+                inflight[key] = task
+                task.add_done_callback(lambda _task: self._finish_inflight(loop, key))
+            else:
+                self._coalesced += 1
+
+        return await asyncio.shield(task)
+
+    def _finish_inflight(self, loop, key):
+        with self._lock:
+            inflight = self._inflight.get(loop, {})
+            inflight.pop(key, None)
+
+            if len(inflight) == 0:
+                self._inflight.pop(loop, None)
+
+    async def _fetch_uncached(self, request):
+        result = await self._get_with_retries(request)
+        await self._in_thread(self._cache_pool, self._session._cache_result, request.request_key, result)  #pylint:disable=protected-access
+        return result
+
+    async def _get_with_retries(self, request):
+        """Fetch a url, retrying with exponential backoff on transient errors."""
+
+        session = self._session
+        attempt = 0
+
+        while True:
+            try:
+                data = await self._request('GET', request.request_key, request)
+                return json.loads(data.decode('utf-8'))
+            except (HTTPError, URLError) as err:
+                outcome, retry_after = classify_error(err)
+                if outcome not in ('throttled', 'error') or attempt >= session.MAX_RETRIES:
+                    raise
+
+                delay = session._retry_delay(attempt, retry_after)  #pylint:disable=protected-access
+                attempt += 1
+
+                self.logger.info("Retrying %s in %.1f seconds after error (attempt %d of %d): %s",
+                                 request.url, delay, attempt, session.MAX_RETRIES, err)
+                await asyncio.sleep(delay)
+
+    async def _request(self, method, url, request, body=None):
+        """Make a request once our limiter allows it and return the response body.
+
+        Errors are translated into the same HTTPError and URLError exceptions
+        raised by the thread based transport.
+        """
+
+        client = self._ensure_client()
+        headers = native_headers(request.headers)
+        limiter = self._limiter
+
+        await self._acquire(limiter)
+
+        start = time.time()
+        error = None
+
+        try:
+            try:
+                async with client.request(method, url, data=body, headers=headers) as resp:
+                    data = await resp.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+                raise URLError(err)
+
+            if resp.status >= 400:
+                raise HTTPError(url, resp.status, resp.reason, resp.headers, io.BytesIO(data))
+
+            return data
+        except Exception as err:  # pylint:disable=W0703; we just record the error and reraise it
+            error = err
+            raise
+        finally:
+            limiter.release(time.time() - start, error, request_class=request_class(request))
+
+    async def _acquire(self, limiter):
+        """Wait for a slot from a limiter without blocking the event loop."""
+
+        future = self._limiter_pool.submit(limiter.acquire)
+
+        try:
+            await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # If we were cancelled after the limiter gave us a slot, give it back
+            def _return_slot(acquired):
+                if not acquired.cancelled() and acquired.exception() is None:
+                    limiter.release(0.0, asyncio.CancelledError())
+
+            future.add_done_callback(_return_slot)
+            raise
+
+    def _ensure_client(self):
+        """Create an aiohttp session the first time one is needed on the running event loop."""
+
+        loop = asyncio.get_event_loop()
+
+        with self._lock:
+            client = self._clients.get(loop)
+            if client is not None and not client.closed:
+                return client
+
+            settings = get_transport_settings()
+            timeout = aiohttp.ClientTimeout(sock_connect=settings['connect_timeout'], sock_read=settings['read_timeout'])
+
+            ssl = None if self._session.verify is not False else False
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, ssl=ssl)
+
+            client = aiohttp.ClientSession(connector=connector, timeout=timeout)
+            self._clients[loop] = client
+            return client
+
+
+def _run_forever(loop):
+    """Run the background event loop of an AsyncTransport until it is stopped."""
+
+    asyncio.set_event_loop(loop)
+
+    try:
+        loop.run_forever()
+    finally:
+        loop.close()
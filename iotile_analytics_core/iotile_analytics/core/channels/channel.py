@@ -1,6 +1,17 @@
 """Methods by which AnalysisGroup objects can find and download streams."""
 
+from ..utilities.chunking import chunk_ranges
+
+
 class ChannelCaching(object):
+    """Caching policies that can be passed to AnalysisGroupChannel.set_caching.
+
+    - UNLIMITED: Cache all fetched data for the lifetime of the process.
+    - LRU: Cache fetched data up to a memory budget in bytes, evicting the least
+      recently used data first.
+    - NONE: Do not cache any data.
+    """
+
     UNLIMITED = 0
     LRU = 1
     NONE = 2
@@ -14,8 +25,16 @@ class AnalysisGroupChannel(object):
     AnalysisGroups delegate requests for streams to their internal
     AnalysisGroupChannel so that you can access IOTile data that is either
     stored locally or remotely.
+
+    Methods that fetch data or events take optional start and end arguments
+    that restrict the result to the half open time range [start, end).
+    Channels should filter as close to the data as possible so that only the
+    requested range is transferred.  See utilities.time_range.
     """
 
+    ITER_CHUNK_ROWS = 100000
+    """The default number of data points in each chunk yielded by iter_datapoints."""
+
     def list_streams(self):
         """Return a list of all streams.
 
@@ -29,6 +48,20 @@ class AnalysisGroupChannel(object):
 
         raise NotImplementedError()
 
+    def fetch_group_info(self):
+        """Fetch the metadata needed to create an AnalysisGroup.
+
+        Channels that can make these requests concurrently should override
+        this method.  The default implementation calls list_streams,
+        fetch_source_info and fetch_properties one after another.
+
+        Returns:
+            (list, dict, dict): The results of list_streams, fetch_source_info
+                and fetch_properties.
+        """
+
+        return self.list_streams(), self.fetch_source_info(), self.fetch_properties()
+
     def count_streams(self, slugs):
         """Count the number of events and data points in a stream.
 
@@ -55,7 +88,7 @@ class AnalysisGroupChannel(object):
 
         raise NotImplementedError()
 
-    def fetch_events(self, slug):
+    def fetch_events(self, slug, start=None, end=None):
         """Fetch all events for a given stream.
 
         These are the event metadata dictionaries, not the raw
@@ -64,6 +97,8 @@ class AnalysisGroupChannel(object):
         Args:
             slug (str): The slug of the stream that we should fetch
                 events for.
+            start (pd.Timestamp): Only fetch events at or after this UTC time.
+            end (pd.Timestamp): Only fetch events before this UTC time.
 
         Returns:
             pd.DataFrame: All of the events.
@@ -71,7 +106,7 @@ class AnalysisGroupChannel(object):
 
         raise NotImplementedError()
 
-    def fetch_raw_events(self, slug, postprocess=None):
+    def fetch_raw_events(self, slug, postprocess=None, start=None, end=None):
         """Fetch all raw event data for this stream.
 
         These are the raw json dictionaries that are stored for
@@ -83,6 +118,8 @@ class AnalysisGroupChannel(object):
             postprocess (callable): Function that should be applied to each
                 raw event before adding to the dataframe.  This should
                 take in a dict and return a dict.
+            start (pd.Timestamp): Only fetch events at or after this UTC time.
+            end (pd.Timestamp): Only fetch events before this UTC time.
 
         Returns:
             pd.DataFrame: All of the raw events.
@@ -90,6 +127,29 @@ class AnalysisGroupChannel(object):
 
         raise NotImplementedError()
 
+    def fetch_events_with_raw(self, slug, postprocess=None, start=None, end=None):
+        """Fetch the events of a stream along with their raw event data.
+
+        Channels that can fetch both in a single pass should override this
+        method.  The default implementation calls fetch_events and then
+        fetch_raw_events.
+
+        Args:
+            slug (str): The slug of the stream that we should fetch
+                events for.
+            postprocess (callable): Function that should be applied to each
+                raw event, as in fetch_raw_events.
+            start (pd.Timestamp): Only fetch events at or after this UTC time.
+            end (pd.Timestamp): Only fetch events before this UTC time.
+
+        Returns:
+            (pd.DataFrame, pd.DataFrame): All of the events and all of the raw events.
+        """
+
+        events = self.fetch_events(slug, start=start, end=end)
+        raw_events = self.fetch_raw_events(slug, postprocess=postprocess, start=start, end=end)
+        return events, raw_events
+
     def fetch_source_info(self):
         """Fetch the record associated to the channel object (project, device or datablock)
 
@@ -110,7 +170,7 @@ class AnalysisGroupChannel(object):
 
         raise NotImplementedError()
 
-    def fetch_datapoints(self, slug, direct=False):
+    def fetch_datapoints(self, slug, direct=False, start=None, end=None):
         """Fetch all data points for this stream.
 
         These are time, value data pairs stored in the stream.
@@ -120,6 +180,8 @@ class AnalysisGroupChannel(object):
                 raw events for.
             direct (bool): Access the data directly without needing a
                 stream object to perform unit conversion.
+            start (pd.Timestamp): Only fetch data points at or after this UTC time.
+            end (pd.Timestamp): Only fetch data points before this UTC time.
 
         Returns:
             StreamSeries: A data fame with internal value as floating
@@ -128,13 +190,49 @@ class AnalysisGroupChannel(object):
 
         raise NotImplementedError()
 
+    def iter_datapoints(self, slug, chunk_rows=None, overlap=0, start=None, end=None):
+        """Iterate over the data points of a stream in chunks.
+
+        Channels that can read part of a stream at a time should override
+        this method so that the whole stream is never in memory at once.
+        The default implementation calls fetch_datapoints and splits the
+        result.
+
+        Args:
+            slug (str): The slug of the stream that we should fetch
+                data points for.
+            chunk_rows (int): The number of new data points in each chunk.
+                Defaults to ITER_CHUNK_ROWS.
+            overlap (int): The number of data points at the end of each chunk
+                to repeat at the start of the next one.
+            start (pd.Timestamp): Only fetch data points at or after this UTC time.
+            end (pd.Timestamp): Only fetch data points before this UTC time.
+
+        Yields:
+            StreamSeries: Consecutive chunks of the stream's data points.
+        """
+
+        if chunk_rows is None:
+            chunk_rows = self.ITER_CHUNK_ROWS
+
+        # Check the chunk arguments before downloading anything
+        chunk_ranges(0, 0, chunk_rows, overlap)
+
+        data = self.fetch_datapoints(slug, start=start, end=end)
+        ranges = chunk_ranges(0, len(data), chunk_rows, overlap)
+
+        for first, last in ranges:
+            yield data.iloc[first:last]
+
     def set_caching(self, policy, param=None):
         """Configure how this channel handling caching data that has been fetched.
 
         Args:
-            policy (int): One of UNLIMITED_CACHE, LRU_CACHE or NO_CACHE.
+            policy (int): One of ChannelCaching.UNLIMITED, ChannelCaching.LRU or
+                ChannelCaching.NONE.
             param (object): Optional parameter that can configure the behavior of
-                the caching mode chosen.
+                the caching mode chosen.  For ChannelCaching.LRU this is the memory
+                budget in bytes.
         """
 
         raise NotImplementedError()
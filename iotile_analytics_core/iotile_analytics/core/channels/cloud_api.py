@@ -5,6 +5,9 @@ from __future__ import (absolute_import, division,
 from builtins import *
 from future.utils import viewitems
 
+import io
+from multiprocessing.pool import ThreadPool
+import numpy as np
 import pandas as pd
 from iotile_cloud.api.exceptions import RestHttpBaseException
 from typedargs.exceptions import ArgumentError
@@ -13,6 +16,11 @@ from ..session import CloudSession
 from ..interaction import ProgressBar
 from ..stream_series import StreamSeries
 from ..exceptions import CloudError
+from ..utilities.time_range import parse_time_range, format_cloud_time, select_time_range
+
+
+# pandas 2.0 no longer infers a separate format for each timestamp unless asked to
+_ISO8601_FORMAT = 'ISO8601' if int(pd.__version__.split('.')[0]) >= 2 else None
 
 
 class IOTileCloudChannel(AnalysisGroupChannel):
@@ -21,19 +29,26 @@ class IOTileCloudChannel(AnalysisGroupChannel):
     Args:
         domain (str): The domain of the iotile.cloud instance that
             you want to fetch data from.
-        cloud_id (str): The slug or id of the object to be enumerated to
+        cloud_id (str or list(str)): The slug or id of the object to be enumerated to
             create this cloud channel.  If you do not want to enumerate
-            any object, you can pass None here.
+            any object, you can pass None here.  You can also pass a list of
+            device slugs to enumerate the streams of all of those devices.
         include_system (bool): Include hidden system streams when query device
             objects.  This defaults to False.
+        stream_page_size (int): The number of streams to request per page when
+            listing streams.  Defaults to STREAM_PAGE_SIZE.
     """
 
-    def __init__(self, cloud_id, domain, include_system=False):
+    STREAM_PAGE_SIZE = 1000
+    """The default number of streams to list per request."""
+
+    def __init__(self, cloud_id, domain, include_system=False, stream_page_size=None):
         super(IOTileCloudChannel, self).__init__()
 
         stream_finders = {
             'project': self._find_project_streams,
             'device': self._find_device_streams,
+            'devices': self._find_multiple_device_streams,
             'datablock': self._find_archive_streams
         }
 
@@ -51,13 +66,39 @@ class IOTileCloudChannel(AnalysisGroupChannel):
         self._session = CloudSession(domain=domain)
         self._api = self._session.get_api()
         self._cloud_id = cloud_id
+        self._domain = domain
         self._include_system = include_system
         self._source_type = source_type
         self._stream_finder = stream_finder
         self._stream_counter = stream_counters.get(source_type, self._count_generic_streams)
 
+        if stream_page_size is None:
+            stream_page_size = self.STREAM_PAGE_SIZE
+
+        if stream_page_size < 1:
+            raise ArgumentError("The stream page size must be at least 1", stream_page_size=stream_page_size)
+
+        self.stream_page_size = stream_page_size
+
+    def source_args(self):
+        """Return the arguments needed to create an identical channel.
+
+        Returns:
+            dict: The cloud_id, domain and include_system arguments that this
+                channel was created with.
+        """
+
+        return {'cloud_id': self._cloud_id, 'domain': self._domain, 'include_system': self._include_system}
+
     @classmethod
     def _classify_object(cls, cloud_id):
+        if isinstance(cloud_id, (list, tuple)):
+            invalid = [x for x in cloud_id if not x.startswith('d--')]
+            if len(cloud_id) == 0 or len(invalid) > 0:
+                raise ArgumentError("A list of objects must contain one or more device slugs", invalid=invalid)
+
+            return 'devices'
+
         if cloud_id.startswith('p--'):
             return 'project'
 
@@ -68,7 +109,7 @@ class IOTileCloudChannel(AnalysisGroupChannel):
             return 'datablock'
 
         raise ArgumentError("Invalid source type", cloud_id=cloud_id, supported_sources=('project', 'device', 'datablock'),
-                            suggestion="Try using one of the convenience functions for creating an AnalysisGroup like FromDevice or FromProject")
+                            suggestion="Try using one of the convenience functions for creating an AnalysisGroup like FromDevice, FromDevices or FromProject")
 
     def list_streams(self):
         """Return a list of all streams.
@@ -93,6 +134,29 @@ class IOTileCloudChannel(AnalysisGroupChannel):
 
         return self._stream_finder(self._cloud_id)
 
+    def fetch_group_info(self):
+        """Fetch the metadata needed to create an AnalysisGroup.
+
+        The stream list, source info and properties come from independent
+        iotile.cloud requests so they are fetched concurrently.  Each runs in
+        its own short lived thread rather than on CloudSession.pool because
+        they make parallel requests through that pool themselves.
+
+        Returns:
+            (list, dict, dict): The results of list_streams, fetch_source_info
+                and fetch_properties.
+        """
+
+        calls = [self.list_streams, self.fetch_source_info, self.fetch_properties]
+        pool = ThreadPool(len(calls))
+
+        try:
+            pending = [pool.apply_async(call) for call in calls]
+            return tuple(x.get() for x in pending)
+        finally:
+            pool.terminate()
+            pool.join()
+
     def fetch_source_info(self):
         """Fetch the record associated to the channel object (project, device or datablock)
 
@@ -105,11 +169,16 @@ class IOTileCloudChannel(AnalysisGroupChannel):
 
         Returns:
             dict: The raw source object that our analytics group was generated from.
+                For a list of devices, this is a dict with the comma separated
+                slugs of all of the devices.
         """
 
         if self._cloud_id is None:
             return {}
 
+        if self._source_type == 'devices':
+            return {'devices': ', '.join(self._cloud_id)}
+
         resource = getattr(self._api, self._source_type)
         try:
             data = resource(self._cloud_id).get()
@@ -127,7 +196,8 @@ class IOTileCloudChannel(AnalysisGroupChannel):
 
         data = {}
 
-        if self._cloud_id is None:
+        # Properties belong to each device so a group of devices has none of its own
+        if self._cloud_id is None or self._source_type == 'devices':
             return {}
 
         try:
@@ -164,7 +234,7 @@ class IOTileCloudChannel(AnalysisGroupChannel):
         # since those corresponds with normal streams like app only streams.
         normal_streams = [slug for slug in slugs if stream_table.get(slug, {}).get('has_streamid') is not False]
 
-        normal_counts = self._count_generic_streams(normal_streams)
+        normal_counts = self._count_individual_streams({slug: {} for slug in normal_streams})
 
         results = {}
         for slug in slugs:
@@ -178,14 +248,93 @@ class IOTileCloudChannel(AnalysisGroupChannel):
         return results
 
     def _count_generic_streams(self, slugs):
-        resources = [self._api.stream(x).data for x in slugs]
-        ts_results = self._session.fetch_multiple(resources, message='Counting Data in Streams', page_size=1)
+        """Count the data points and events in the streams of a project or archive.
+
+        Streams are grouped by the device they come from and each device with
+        more than one stream is checked in bulk, with one request for the
+        stream counts of the device and one for its total number of events.
+        If a device has no events, none of its streams need their events
+        counted.  Like _count_device_streams, the stream counts of a device
+        are only trusted for streams without a stream id, since the counts of
+        normal streams may be missing or out of date.  iotile.cloud has no
+        other aggregate count of data points, so the points of normal streams
+        are still counted with one request per stream.  Whatever cannot be
+        counted in bulk, like normal streams and streams in archives, is
+        counted with per stream requests in a single parallel batch.
+        """
+
+        device_slugs = {}
+        for slug in slugs:
+            device = self._stream_device(slug)
+            if device is not None:
+                device_slugs.setdefault(device, []).append(slug)
+
+        devices = sorted(device for device, members in viewitems(device_slugs) if len(members) > 1)
+        counts = {slug: {} for slug in slugs}
+
+        if len(devices) > 0:
+            extras, _failed = self._session.fetch_multiple([self._api.device(x).extra for x in devices], allow_partial=True,
+                                                           message='Counting Data in Devices')
+            totals, _failed = self._session.fetch_multiple([self._api.event for x in devices], [{'filter': x} for x in devices],
+                                                           page_size=1, allow_partial=True, message='Counting Events in Devices')
+
+            for device, extra, total in zip(devices, extras, totals):
+                stream_table = None
+                if extra is not None:
+                    stream_table = extra.get('stream_counts')
+
+                for slug in device_slugs[device]:
+                    info = None
+                    if stream_table is not None:
+                        info = stream_table.get(slug)
+
+                    # Note the specific logic here of is False, see _count_device_streams
+                    if info is not None and info.get('has_streamid') is False:
+                        counts[slug]['points'] = info.get('data_cnt', 0)
+
+                        if 'event_cnt' in info:
+                            counts[slug]['events'] = info['event_cnt']
 
-        event_resources = [self._api.event for x in slugs]
-        event_args = [{"filter": x} for x in slugs]
+                    if total is not None and total['count'] == 0:
+                        counts[slug]['events'] = 0
 
-        event_results = self._session.fetch_multiple(event_resources, event_args, message='Counting Events in Streams', page_size=1)
-        return {slug: {'points': ts['count'], 'events': event['count']} for slug, ts, event in zip(slugs, ts_results, event_results)}
+        return self._count_individual_streams(counts)
+
+    def _count_individual_streams(self, counts):
+        """Count the data points and events missing from counts with one request each."""
+
+        point_slugs = [slug for slug, count in viewitems(counts) if 'points' not in count]
+        event_slugs = [slug for slug, count in viewitems(counts) if 'events' not in count]
+
+        resources = [self._api.stream(x).data for x in point_slugs] + [self._api.event for x in event_slugs]
+        per_call_kw = [{} for x in point_slugs] + [{"filter": x} for x in event_slugs]
+
+        if len(resources) > 0:
+            results = self._session.fetch_multiple(resources, per_call_kw, message='Counting Data in Streams', page_size=1)
+
+            for slug, result in zip(point_slugs, results[:len(point_slugs)]):
+                counts[slug]['points'] = result['count']
+
+            for slug, result in zip(event_slugs, results[len(point_slugs):]):
+                counts[slug]['events'] = result['count']
+
+        return counts
+
+    @classmethod
+    def _stream_device(cls, slug):
+        """Get the slug of the device that a stream comes from or None if it is not from a device."""
+
+        parts = slug.split('--')
+        if len(parts) != 4 or parts[0] != 's':
+            return None
+
+        device = parts[2]
+
+        # Archived streams have a nonzero block number in place of the first part of the device id
+        if not device.startswith('0000-') or device == '0000-0000-0000-0000':
+            return None
+
+        return 'd--' + device
 
     def fetch_variable_types(self, slugs):
         """Fetch variable type information for a list of variable slugs.
@@ -202,37 +351,37 @@ class IOTileCloudChannel(AnalysisGroupChannel):
 
         return {x['slug']: x for x in variables}
 
-    def fetch_events(self, slug):
+    def fetch_events(self, slug, start=None, end=None):
         """Fetch all events for a given stream.
 
         These are the event metadata dictionaries, not the raw
         event data that may be stored along with the metadata.
 
+        If you pass start or end, only events in that range are requested
+        from iotile.cloud.
+
         Args:
             slug (str): The slug of the stream that we should fetch
                 events for.
+            start (pd.Timestamp): Only fetch events at or after this UTC time.
+            end (pd.Timestamp): Only fetch events before this UTC time.
 
         Returns:
             pd.DataFrame: A data frame with all of the events in this
                 stream.
         """
 
-        try:
-            resource = self._api.event
-            data = self._session.fetch_all(resource, page_size=1000, message="Downloading Events", filter=slug, mask=1)
+        start, end = parse_time_range(start, end)
 
-            dt_index = pd.to_datetime([x['timestamp'] for x in data])
-            extra_data = [x['extra_data'] for x in data]
+        timestamps = []
+        extra_data = []
 
-            for i, event in enumerate(data):
-                extra_data[i]['event_id'] = event['id']
-                extra_data[i]['has_raw_data'] = event.get('has_raw_data', False)
+        for page in self._iter_event_pages(slug, start, end):
+            self._parse_event_page(page, timestamps, extra_data)
 
-            return pd.DataFrame(extra_data, index=dt_index)
-        except RestHttpBaseException as exc:
-            raise CloudError("Error fetching events from stream", exception=exc, response=exc.response.status_code)
+        return self._build_event_frame(timestamps, extra_data, start, end)
 
-    def fetch_raw_events(self, slug, postprocess=None):
+    def fetch_raw_events(self, slug, postprocess=None, start=None, end=None):
         """Fetch all raw event data for this stream.
 
         These are the raw json dictionaries that may be stored for each event.
@@ -249,53 +398,111 @@ class IOTileCloudChannel(AnalysisGroupChannel):
                 postprocess(i, data, event) where i is the index of the row in
                 the output dataframe, data is the raw event data and event is
                 the summary event data.
+            start (pd.Timestamp): Only fetch events at or after this UTC time.
+            end (pd.Timestamp): Only fetch events before this UTC time.
 
         Returns:
             pd.DataFrame: All of the raw events.  This will be empty if
                 there are no raw events.
         """
 
-        events = self.fetch_events(slug)
-        if len(events) == 0:
-            return pd.DataFrame()
+        _events, raw_events = self.fetch_events_with_raw(slug, postprocess=postprocess, start=start, end=end)
+        return raw_events
 
-        event_ids = events['event_id'].values
-        # event.has_raw_data is true if there is an associated raw JSON file stored on S3 for this event
-        event_has_data = events['has_raw_data'].values
-        indexes = events.index
-        resources = []
-        new_index = []
+    def fetch_events_with_raw(self, slug, postprocess=None, start=None, end=None):
+        """Fetch the events of a stream along with their raw event data.
 
-        postprocess_args = None
-        if postprocess is not None:
-            postprocess_args = []
+        This returns the same results as calling fetch_events and then
+        fetch_raw_events but only pages through the event metadata once.
+        The raw data for the events on each page starts downloading as soon
+        as that page arrives, while later pages are still being fetched.
+
+        Args:
+            slug (str): The slug of the stream that we should fetch
+                events for.
+            postprocess (callable): Function that should be applied to each
+                raw event, with the same signature as in fetch_raw_events.
+            start (pd.Timestamp): Only fetch events at or after this UTC time.
+            end (pd.Timestamp): Only fetch events before this UTC time.
+
+        Returns:
+            (pd.DataFrame, pd.DataFrame): The events, as returned by fetch_events, and
+                the raw events, as returned by fetch_raw_events.
+        """
+
+        start, end = parse_time_range(start, end)
+
+        timestamps = []
+        extra_data = []
+        pending = []
+
+        with ProgressBar(total=0, message="Downloading Raw Event Data", leave=False) as progbar:
+            for page in self._iter_event_pages(slug, start, end):
+                first = len(extra_data)
+                self._parse_event_page(page, timestamps, extra_data)
+
+                rows = [i for i in range(first, len(extra_data)) if extra_data[i]['has_raw_data']]
+                if len(rows) == 0:
+                    continue
+
+                progbar.total += len(rows)
+                resources = [self._api.event(extra_data[i]['event_id']).data for i in rows]
+                pending.append((rows, self._session.fetch_multiple_async(resources, progress=progbar)))
 
-        for index in range(len(event_ids)):
-            if event_has_data[index]:
-                resources.append(self._api.event(event_ids[index]).data)
-                new_index.append(indexes[index])
+            events = self._build_event_frame(timestamps, extra_data, start, end)
+            if len(events) == 0:
+                return events, pd.DataFrame()
 
-                if postprocess is not None:
-                    postprocess_args.append((events.iloc[index],))
+            # Events outside of [start, end) are dropped by _build_event_frame so
+            # we look up where each fetched raw event ended up by its id.
+            row_map = {event_id: i for i, event_id in enumerate(events['event_id'].values)}
+            raw_rows = []
+            data = []
 
-        data = self._session.fetch_multiple(resources, postprocess=postprocess, postprocess_args=postprocess_args, message="Downloading Raw Event Data")
+            for rows, fetches in pending:
+                for i, value in zip(rows, fetches.get()):
+                    row = row_map.get(extra_data[i]['event_id'])
+                    if row is not None:
+                        raw_rows.append(row)
+                        data.append(value)
 
         if postprocess is not None:
-            to_remove = set()
+            data = [postprocess(i, value, events.iloc[row]) for i, (row, value) in enumerate(zip(raw_rows, data))]
 
-            for i, value in enumerate(data):
-                if value is None:
-                    to_remove.add(i)
+            keep = [i for i, value in enumerate(data) if value is not None]
+            raw_rows = [raw_rows[i] for i in keep]
+            data = [data[i] for i in keep]
 
-            if len(to_remove) > 0:
-                new_index = [x for i, x in enumerate(new_index) if i not in to_remove]
-                data = [x for i, x in enumerate(data) if i not in to_remove]
+        # raw_rows includes all events with actual data
+        new_index = pd.to_datetime(events.index[raw_rows])
+        return events, pd.DataFrame(data, index=new_index)
 
-        # new_index includes all indexes with actual data
-        new_index = pd.to_datetime(new_index)
-        return pd.DataFrame(data, index=new_index)
+    def _iter_event_pages(self, slug, start, end):
+        """Iterate over the pages of event metadata for a stream."""
 
-    def fetch_datapoints(self, slug):
+        try:
+            for page in self._session.iter_pages(self._api.event, page_size=1000, message="Downloading Events", filter=slug,
+                                                 mask=1, **self._range_query(start, end)):
+                yield page
+        except RestHttpBaseException as exc:
+            raise CloudError("Error fetching events from stream", exception=exc, response=exc.response.status_code)
+
+    @classmethod
+    def _parse_event_page(cls, page, timestamps, extra_data):
+        for event in page:
+            extra = event['extra_data']
+            extra['event_id'] = event['id']
+            extra['has_raw_data'] = event.get('has_raw_data', False)
+
+            timestamps.append(event['timestamp'])
+            extra_data.append(extra)
+
+    @classmethod
+    def _build_event_frame(cls, timestamps, extra_data, start, end):
+        dt_index = cls.parse_timestamps(timestamps)
+        return select_time_range(pd.DataFrame(extra_data, index=dt_index), start, end)
+
+    def fetch_datapoints(self, slug, start=None, end=None):
         """Fetch all data points for this stream.
 
         These are time, value data pairs stored in the stream. Internal
@@ -303,94 +510,213 @@ class IOTileCloudChannel(AnalysisGroupChannel):
         pandas Series subclass with additional functionality to support unit
         conversion.
 
+        If you pass start or end, only data points in that range are
+        requested from iotile.cloud.
+
         Args:
             slug (str): The slug of the stream that we should fetch
                 raw data points for.
+            start (pd.Timestamp): Only fetch data points at or after this UTC time.
+            end (pd.Timestamp): Only fetch data points before this UTC time.
 
         Returns:
             StreamSeries: A data fame with internal value as floating
                 point data.
         """
 
-        use_data_api = False
+        start, end = parse_time_range(start, end)
+        range_query = self._range_query(start, end)
 
         with ProgressBar(1, "Fetching %s" % slug, leave=False) as prog:
-            raw_data = self._api.df.get(filter=slug, format='csv', mask=1)
+            raw_data = self._api.df.get(filter=slug, format='csv', mask=1, **range_query)
+            series = self.parse_datapoint_csv(raw_data)
+            prog.update(1)
 
-            str_data = raw_data.decode('utf-8')
-            rows = str_data.splitlines()
-            data = [x.split(',') for x in rows]
-            data = data[1:]  # There is a single header line
+        if series is not None:
+            return select_time_range(series, start, end)
 
-            # FIXME: Hack to work around issue returning int_value for these objects
-            if len(data) > 0 and data[0][1] == '':
-                use_data_api = True
-            else:
-                dt_index = pd.to_datetime([x[0] for x in data])
+        resource = self._api.data
+        timestamps = []
+        data = []
 
-            prog.update(1)
+        for page in self._session.iter_pages(resource, page_size=10000, message="Downloading Data", filter=slug, mask=1,
+                                             **range_query):
+            timestamps.extend(x['timestamp'] for x in page)
+            data.extend(x['int_value'] for x in page)
 
-        if not use_data_api:
-            return StreamSeries([float(x[1]) for x in data], index=dt_index)
+        dt_index = self.parse_timestamps(timestamps)
+        return select_time_range(StreamSeries(data, index=dt_index), start, end)
 
-        resource = self._api.data
-        raw_json = self._session.fetch_all(resource, page_size=10000, message="Downloading Data", filter=slug, mask=1)
+    @classmethod
+    def _range_query(cls, start, end):
+        """Build the query arguments that ask iotile.cloud to filter by time."""
+
+        query = {}
+        if start is not None:
+            query['start'] = format_cloud_time(start)
+        if end is not None:
+            query['end'] = format_cloud_time(end)
+
+        return query
+
+    @classmethod
+    def parse_datapoint_csv(cls, raw_data):
+        """Parse the CSV returned by the iotile.cloud df API into a StreamSeries.
+
+        The response is parsed directly from bytes by pandas' C CSV reader
+        into a float64 array of values and the timestamps are converted in
+        bulk by parse_timestamps, without building python lists of rows.
+
+        Args:
+            raw_data (bytes): The raw CSV response with a single header line.  The
+                first column is the timestamp and the second is the value.  An
+                empty response is parsed as a stream with no data points.
+
+        Returns:
+            StreamSeries: The parsed data points, or None if the CSV does not contain
+                values, which happens for some streams whose values must be fetched
+                from the data API instead.
+        """
+
+        try:
+            frame = pd.read_csv(io.BytesIO(raw_data), usecols=[0, 1], header=0, names=['timestamp', 'value'],
+                                dtype={'timestamp': object, 'value': np.float64}, skipinitialspace=True)
+        except pd.errors.EmptyDataError:
+            # A stream with no data in the requested range may come back as an empty body
+            frame = pd.DataFrame({'timestamp': np.array([], dtype=object), 'value': np.array([], dtype=np.float64)})
+
+        # FIXME: Hack to work around issue returning int_value for these objects
+        if len(frame) > 0 and np.isnan(frame['value'].values[0]):
+            return None
+
+        dt_index = cls.parse_timestamps(frame['timestamp'].values)
+        return StreamSeries(frame['value'].values, index=dt_index)
+
+    @classmethod
+    def parse_timestamps(cls, timestamps):
+        """Convert iotile.cloud timestamp strings into a UTC DatetimeIndex.
 
-        dt_index = pd.to_datetime([x['timestamp'] for x in raw_json])
-        data = [x['int_value'] for x in raw_json]
+        iotile.cloud returns UTC timestamps in ISO 8601 format with a trailing
+        Z, which numpy can parse in bulk once the Z is removed.  This is many
+        times faster than pandas' generic parser.  If any timestamp is not in
+        that format, we fall back to pandas.
 
-        return StreamSeries(data, index=dt_index)
+        The result always has nanosecond resolution, whatever resolution
+        the installed version of pandas would infer, so that timestamps can be
+        stored and compared as integer nanoseconds.
+
+        Args:
+            timestamps (list or ndarray of str): The timestamps to convert.
+
+        Returns:
+            DatetimeIndex: The parsed timestamps.
+        """
+
+        try:
+            stamps = np.asarray(timestamps, dtype=object).astype(bytes)
+            if np.char.endswith(stamps, b'Z').all():
+                parsed = np.char.rstrip(stamps, b'Z').astype('datetime64[us]').astype('datetime64[ns]')
+                return pd.DatetimeIndex(parsed).tz_localize('UTC')
+        except (ValueError, TypeError, UnicodeError):
+            pass
+
+        parsed = pd.to_datetime(timestamps, format=_ISO8601_FORMAT, utc=True)
+        return pd.DatetimeIndex(parsed).astype('datetime64[ns, UTC]')
 
     def _find_device_streams(self, device_slug):
         """Find all streams for a device by its slug."""
 
-        try:
-            results = self._api.stream.get(device=device_slug)
-            streams = results['results']
+        streams = self._list_streams(device=device_slug)
 
-            if self._include_system:
+        if self._include_system:
+            try:
                 hidden_results = self._api.device(device_slug).extra.get()
-                hidden_streams = [slug for slug, data in viewitems(hidden_results.get('stream_counts', {})) if data.get('has_streamid') is False]
+            except RestHttpBaseException as exc:
+                raise CloudError("Error calling method on iotile.cloud", exception=exc, response=exc.response.status_code)
 
-                streams += hidden_streams
+            hidden_streams = [slug for slug, data in viewitems(hidden_results.get('stream_counts', {})) if data.get('has_streamid') is False]
+            streams += hidden_streams
 
-            return streams
-        except RestHttpBaseException as exc:
-            raise CloudError("Error calling method on iotile.cloud", exception=exc, response=exc.response.status_code)
+        return streams
+
+    def _find_multiple_device_streams(self, device_slugs):
+        """Find all streams for a list of devices by their slugs.
+
+        The first page of streams for every device is requested in a single
+        parallel batch, which for most devices is all of their streams.  Any
+        further pages are then fetched in parallel for the few devices that
+        need them.
+        """
+
+        page_size = self.stream_page_size
+        resources = [self._api.stream for x in device_slugs]
+        first_pages = self._session.fetch_multiple(resources, [{'device': x} for x in device_slugs], page_size=page_size,
+                                                   message="Listing Streams in Devices")
+
+        streams = []
+        for device_slug, first_page in zip(device_slugs, first_pages):
+            streams.extend(first_page['results'])
+
+            page_count = (first_page['count'] + page_size - 1) // page_size
+            if page_count > 1:
+                pages = self._session.fetch_pages(self._api.stream, list(range(2, page_count + 1)), page_size=page_size,
+                                                  message="Listing Streams", device=device_slug)
+                for page in pages:
+                    streams.extend(page)
+
+        if self._include_system:
+            extras = self._session.fetch_multiple([self._api.device(x).extra for x in device_slugs],
+                                                  message="Listing System Streams")
+
+            for extra in extras:
+                streams.extend(slug for slug, data in viewitems(extra.get('stream_counts', {})) if data.get('has_streamid') is False)
+
+        return streams
 
     def _find_archive_streams(self, archive_slug):
         """Find all streams for an archive by its slug."""
 
-        try:
-            results = self._api.stream.get(block=archive_slug, all=1)
-            return results['results']
-        except RestHttpBaseException as exc:
-            raise CloudError("Error calling method on iotile.cloud", exception=exc, response=exc.response.status_code)
+        return self._list_streams(block=archive_slug, all=1)
 
     def _find_project_streams(self, project_id):
         """Find all streams in a project by its uuid."""
 
-        try:
-            results = self._api.stream.get(project=project_id)
-            return results['results']
-        except RestHttpBaseException as exc:
-            raise CloudError("Error calling method on iotile.cloud", exception=exc, response=exc.response.status_code)
+        return self._list_streams(project=project_id)
+
+    def _list_streams(self, **kwargs):
+        """List all pages of the stream API in parallel."""
+
+        return self._session.fetch_all(self._api.stream, page_size=self.stream_page_size, message="Listing Streams", **kwargs)
 
     def set_caching(self, policy, param=None):
         """Configure how this channel handling caching data that has been fetched.
 
+        The LRU policy requires a param with the maximum number of bytes of
+        responses to keep in memory.  The cache is shared by all channels that
+        talk to the same iotile.cloud domain so this limit applies to all of
+        them.
+
         Args:
-            policy (int): One of UNLIMITED_CACHE, LRU_CACHE or NO_CACHE.
+            policy (int): One of ChannelCaching.UNLIMITED, ChannelCaching.LRU or
+                ChannelCaching.NONE.
             param (object): Optional parameter that can configure the behavior of
-                the caching mode chosen.
+                the caching mode chosen.  For ChannelCaching.LRU this is the memory
+                budget in bytes.
         """
 
-        if policy not in (ChannelCaching.UNLIMITED, ChannelCaching.NONE):
+        if policy not in (ChannelCaching.UNLIMITED, ChannelCaching.LRU, ChannelCaching.NONE):
             raise ArgumentError("Unsupported cache policy type", policy=policy)
 
+        if policy == ChannelCaching.LRU and param is None:
+            raise ArgumentError("You must pass a memory budget in bytes as param to use an LRU cache", policy=policy)
+
         self._cache_policy = policy
 
         if policy == ChannelCaching.UNLIMITED:
             self._session.enable_cache = True
+            self._session.set_cache_limit(None)
+        elif policy == ChannelCaching.LRU:
+            self._session.enable_cache = True
+            self._session.set_cache_limit(param)
         else:
             self._session.enable_cache = False
@@ -10,15 +10,61 @@ from __future__ import (absolute_import, division,
 from builtins import *
 from future.utils import viewitems, viewvalues
 from past.builtins import basestring
+import gzip
+import inspect
+import json
+import logging
+import threading
+from collections import deque
+from multiprocessing.pool import ThreadPool
 import pkg_resources
 import pandas as pd
 from iotile_cloud.api.connection import DOMAIN_NAME
 from iotile_cloud.api.exceptions import RestHttpBaseException
 from iotile_cloud.stream.data import StreamData
+from iotile_cloud.utils.gid import IOTileDeviceSlug
 from typedargs.exceptions import ArgumentError
 from .exceptions import CloudError
 from .session import CloudSession
 from .channels import IOTileCloudChannel
+from .utilities.time_range import parse_time_range
+from .utilities.stream_index import StreamIndex
+from .utilities.memory_cache import MemoryCache
+
+try:
+    #python2
+    from Queue import Queue
+except ImportError:
+    #python3
+    from queue import Queue
+
+
+def _accepts_keyword(func, name):
+    """Check if a callable can be passed the given keyword argument.
+
+    Callables whose signature cannot be inspected are assumed to accept it.
+    """
+
+    try:
+        signature = inspect.signature(func)
+    except AttributeError:
+        #python2
+        try:
+            spec = inspect.getargspec(func)
+        except TypeError:
+            return True
+
+        return name in spec.args or spec.keywords is not None
+    except (TypeError, ValueError):
+        return True
+
+    for param in signature.parameters.values():
+        if param.kind == param.VAR_KEYWORD:
+            return True
+        if param.name == name and param.kind in (param.POSITIONAL_OR_KEYWORD, param.KEYWORD_ONLY):
+            return True
+
+    return False
 
 
 class AnalysisGroup(object):
@@ -37,27 +83,88 @@ class AnalysisGroup(object):
     If you use FromArchive you should pass a slug for the archive
     that you want to fetch streams from.
 
-    If you use FromProject, you should pass the UUID of the project
+    If you use FromProject, you should pass the slug or UUID of the project
     that you want to fetch streams from.
 
+    If you use FromDevices, you should pass a list of slugs for the devices
+    that you want to fetch streams from.  Groups with streams from more than
+    one device can tell you which device each stream comes from using
+    get_stream_device().
+
     Args:
         channel (AnalysisGroupChannel): The channel by which we can
             find and download streams.
+        metadata (dict): Optional metadata about the group that was already
+            fetched from the channel, for example by FromSnapshot, so that it
+            does not need to be fetched again.  It must contain streams,
+            source_info and properties keys and may also contain stream_counts
+            and variable_types.
     """
 
-    def __init__(self, channel):
+    SAVE_CONCURRENCY = 4
+    """The default number of streams fetched at once by save()."""
+
+    SNAPSHOT_VERSION = 1
+    """The version of the file format written by snapshot_metadata()."""
+
+    def __init__(self, channel, metadata=None):
         self._channel = channel
+        self._lazy_lock = threading.RLock()
+        self._revalidation = None
+        self._frame_cache = None
+
+        if metadata is None:
+            stream_list, source_info, properties = channel.fetch_group_info()
+            metadata = {'streams': stream_list, 'source_info': source_info, 'properties': properties}
 
-        stream_list = channel.list_streams()
-        self.source_info = channel.fetch_source_info()
-        self.properties = channel.fetch_properties()
-        self.streams = self._parse_stream_list(stream_list)
-        self.stream_counts = channel.count_streams([x for x in self.streams])
+        self._set_metadata(metadata)
 
-        var_type_slugs = set([x['var_type'] for x in viewvalues(self.streams) if x is not None and x.get('var_type') is not None])
+    def _set_metadata(self, metadata):
+        """Replace all of the metadata describing this group.
 
-        self.variable_types = channel.fetch_variable_types(var_type_slugs)
-        self._stream_table = [(slug.lower(), self.get_stream_name(slug).lower()) for slug in self.streams]
+        Stream counts and variable types that are not included are fetched
+        the first time they are needed.
+        """
+
+        streams = self._parse_stream_list(metadata['streams'])
+        stream_index = StreamIndex((slug.lower(), self._stream_name(slug, stream).lower()) for slug, stream in viewitems(streams))
+
+        with self._lazy_lock:
+            self.source_info = metadata['source_info']
+            self.properties = metadata['properties']
+            self.streams = streams
+            self._stream_index = stream_index
+            self._stream_counts = dict(metadata.get('stream_counts', {}))
+            self._variable_types = metadata.get('variable_types')
+
+        if self._frame_cache is not None:
+            self._frame_cache.clear()
+
+    @property
+    def stream_counts(self):
+        """dict(<slug>: {'points': int, 'events': int}): The size of every stream.
+
+        Streams are counted the first time this is accessed, which can take
+        a while for groups with many streams.  stream_empty() only counts
+        the stream you ask about.
+        """
+
+        self._count_streams(self.streams)
+        return self._stream_counts
+
+    @property
+    def variable_types(self):
+        """dict(<slug>: dict): The variable types of all streams, fetched on first access."""
+
+        with self._lazy_lock:
+            if self._variable_types is None:
+                self._variable_types = self._channel.fetch_variable_types(self._vartype_slugs(self.streams))
+
+            return self._variable_types
+
+    @classmethod
+    def _vartype_slugs(cls, streams):
+        return set([x['var_type'] for x in viewvalues(streams) if x is not None and x.get('var_type') is not None])
 
     def stream_empty(self, slug):
         """Check if a stream is empty.
@@ -72,9 +179,19 @@ class AnalysisGroup(object):
             bool: True if the stream is empty, otherwise false.
         """
 
-        counts = self.stream_counts[slug]
+        counts = self._count_streams([slug])[slug]
         return counts['points'] == 0 and counts['events'] == 0
 
+    def _count_streams(self, slugs):
+        """Count any of the given streams that have not been counted yet, all at once."""
+
+        with self._lazy_lock:
+            missing = [slug for slug in slugs if slug not in self._stream_counts]
+            if len(missing) > 0:
+                self._stream_counts.update(self._channel.count_streams(missing))
+
+            return self._stream_counts
+
     def print_source_info(self):
         """Print a table with source object info
 
@@ -103,6 +220,9 @@ class AnalysisGroup(object):
             include_empty (bool): Also show streams that have no data.
         """
 
+        if not include_empty:
+            self._count_streams(self.streams)
+
         print("{:40s} {:s}".format("Name", "Slug"))
         print("{:40s} {:s}".format("----", "----"))
 
@@ -126,7 +246,41 @@ class AnalysisGroup(object):
             str: The name of the stream
         """
 
+        return self._stream_name(slug, self.streams.get(slug))
+
+    def get_stream_device(self, slug):
+        """Get the slug of the device that a stream comes from.
+
+        Args:
+            slug (str): The slug of the stream.
+
+        Returns:
+            str: The slug of the device or None if the stream does not come
+                from a device.
+        """
+
         stream = self.streams.get(slug)
+        if stream is not None and stream.get('device') is not None:
+            return stream['device']
+
+        return IOTileCloudChannel._stream_device(slug)
+
+    def streams_by_device(self):
+        """Group the streams in this AnalysisGroup by the device they come from.
+
+        Returns:
+            dict(<device slug>: list(str)): The sorted slugs of the streams from
+                each device.  Streams that do not come from a device are under None.
+        """
+
+        devices = {}
+        for slug in sorted(self.streams):
+            devices.setdefault(self.get_stream_device(slug), []).append(slug)
+
+        return devices
+
+    @classmethod
+    def _stream_name(cls, slug, stream):
         if stream is None:
             return "System Data %s" % (slug[-4:].upper())
 
@@ -148,7 +302,9 @@ class AnalysisGroup(object):
         uniquely match exactly one stream in this analysis project or an
         exception will be thrown.
 
-        Matching is done in a case insensitive fashion.
+        Matching is done in a case insensitive fashion.  Streams are looked
+        up in an index of their slugs and names, which is built when the
+        group is created, so this is fast even for groups with many streams.
 
         By default, only streams that are not empty are searched.  You can
         override this by passing include_empty=True.  This behavior is the
@@ -178,7 +334,11 @@ class AnalysisGroup(object):
 
         partial = partial.lower()
 
-        found = [slug for slug, stream in self._stream_table if (partial in slug or partial in stream) and (include_empty or not self.stream_empty(slug))]
+        found = self._stream_index.search(partial)
+        if not include_empty:
+            self._count_streams(found)
+            found = [slug for slug in found if not self.stream_empty(slug)]
+
         if len(found) == 0:
             raise ArgumentError("No stream found matching given partial identifier", partial=partial)
         elif len(found) > 1:
@@ -186,7 +346,7 @@ class AnalysisGroup(object):
 
         return found[0]
 
-    def fetch_stream(self, slug_or_name, allow_empty=False):
+    def fetch_stream(self, slug_or_name, allow_empty=False, start=None, end=None):
         """Fetch data from a stream by its slug or name.
 
         For example say you have the following stream in this analysis project:
@@ -205,28 +365,85 @@ class AnalysisGroup(object):
                 that find_stream accepts will be accepted here.
             allow_empty (bool): Allow fetching an empty stream.  If allow_empty is False or
                 not passed, an ArgumentError will be raised if the target stream is empty.
+            start (str, datetime or pd.Timestamp): Only fetch data points at or after this
+                time.  Times without a timezone are treated as UTC.
+            end (str, datetime or pd.Timestamp): Only fetch data points before this time.
+                Times without a timezone are treated as UTC.
 
         Returns:
             StreamSeries: A pandas DataFrame subclass containing the data points as columns.
                 The index of the dataframe is time in UTC.
         """
 
+        start, end = parse_time_range(start, end)
+
         slug = self.find_stream(slug_or_name, include_empty=allow_empty)
+
+        key = ('points', slug, start, end)
+        cached = self._get_cached_frame(key)
+        if cached is not None:
+            return cached
+
+        raw = self._channel.fetch_datapoints(slug, start=start, end=end)
+        self._attach_metadata(slug, raw)
+
+        self._cache_frame(key, raw)
+        return raw
+
+    def iter_stream(self, slug_or_name, chunk_rows=None, overlap=0, allow_empty=False, start=None, end=None):
+        """Iterate over the data in a stream in chunks.
+
+        This lets you process streams that are too large to fit in memory.
+        When the group comes from a saved file, each chunk is read from the
+        file as you ask for it, so only one chunk is in memory at a time.
+        Other channels may have to fetch the whole stream first.
+
+        Each chunk is a StreamSeries with the same metadata as one returned
+        by fetch_stream.  For example, you can build an envelope of a whole
+        stream with envelope_create() and then one envelope_update() call per
+        chunk.
+
+        Args:
+            slug_or_name (str): The stream that we want to fetch.  This is passed to
+                find_stream so anything that find_stream accepts will be accepted here.
+            chunk_rows (int): The number of new data points in each chunk.  Defaults to
+                a value chosen by the group's channel.
+            overlap (int): The number of data points at the end of each chunk to repeat
+                at the start of the next one, for calculations that need to look at
+                neighboring points.
+            allow_empty (bool): Allow iterating over an empty stream, which yields nothing.
+            start (str, datetime or pd.Timestamp): Only fetch data points at or after this
+                time.  Times without a timezone are treated as UTC.
+            end (str, datetime or pd.Timestamp): Only fetch data points before this time.
+                Times without a timezone are treated as UTC.
+
+        Yields:
+            StreamSeries: Consecutive chunks of the stream's data points.
+        """
+
+        start, end = parse_time_range(start, end)
+
+        slug = self.find_stream(slug_or_name, include_empty=allow_empty)
+
+        for chunk in self._channel.iter_datapoints(slug, chunk_rows=chunk_rows, overlap=overlap, start=start, end=end):
+            self._attach_metadata(slug, chunk)
+            yield chunk
+
+    def _attach_metadata(self, slug, series):
+        """Attach stream and variable type metadata to a StreamSeries."""
+
         stream = self.streams[slug]
-        raw = self._channel.fetch_datapoints(slug)
 
         if stream is not None:
-            raw.set_stream(stream)
+            series.set_stream(stream)
 
             vartype_slug = stream['var_type']
 
             if vartype_slug is not None:
                 vartype = self.variable_types[stream['var_type']]
-                raw.set_vartype(vartype)
-
-        return raw
+                series.set_vartype(vartype)
 
-    def fetch_events(self, slug_or_name):
+    def fetch_events(self, slug_or_name, start=None, end=None):
         """Fetch event metadata from a stream by its slug or name.
 
         This function will return a Pandas DataFrame with all of the
@@ -243,16 +460,30 @@ class AnalysisGroup(object):
                 can be a partial match to a full stream slug or name so long
                 as it uniquely matches.  This is passed to find_stream so anything
                 that find_stream accepts will be accepted here.
+            start (str, datetime or pd.Timestamp): Only fetch events at or after this
+                time.  Times without a timezone are treated as UTC.
+            end (str, datetime or pd.Timestamp): Only fetch events before this time.
+                Times without a timezone are treated as UTC.
 
         Returns:
             DataFrame: All of the extra_data associated with the event as a
                 Pandas DataFrame.
         """
 
+        start, end = parse_time_range(start, end)
+
         slug = self.find_stream(slug_or_name)
-        return self._channel.fetch_events(slug)
 
-    def fetch_raw_events(self, slug_or_name, subkey=None, postprocess=None):
+        key = ('events', slug, start, end)
+        cached = self._get_cached_frame(key)
+        if cached is not None:
+            return cached
+
+        events = self._channel.fetch_events(slug, start=start, end=end)
+        self._cache_frame(key, events)
+        return events
+
+    def fetch_raw_events(self, slug_or_name, subkey=None, postprocess=None, start=None, end=None):
         """Fetch multiple raw events by numeric id.
 
         Args:
@@ -266,20 +497,129 @@ class AnalysisGroup(object):
                 adding it to the dataframe.  The function will be called as:
                 postprocess(i, data), where i is the index of the row in the final dataframe
                 and data is the raw data (or data[subkey] if subkey is not None) fetched.
+            start (str, datetime or pd.Timestamp): Only fetch events at or after this
+                time.  Times without a timezone are treated as UTC.
+            end (str, datetime or pd.Timestamp): Only fetch events before this time.
+                Times without a timezone are treated as UTC.
 
         Returns:
             pd.DataFrame: The raw event object data fetched from iotile.cloud.
         """
 
+        start, end = parse_time_range(start, end)
+
+        slug = self.find_stream(slug_or_name)
+        return self._channel.fetch_raw_events(slug, postprocess=self._combine_postprocess(subkey, postprocess),
+                                              start=start, end=end)
+
+    def fetch_events_with_raw(self, slug_or_name, subkey=None, postprocess=None, start=None, end=None):
+        """Fetch event metadata and raw event data from a stream together.
+
+        This returns the same results as calling fetch_events and
+        fetch_raw_events but lets the channel fetch both at once, which for
+        iotile.cloud means only downloading the event metadata once.
+
+        Args:
+            slug_or_name (str): The stream that we want to fetch.  This is passed to
+                find_stream so anything that find_stream accepts will be accepted here.
+            subkey (str): Only include a single key of each raw event.
+            postprocess (callable): (Optional) function to call on each raw event, as in
+                fetch_raw_events.
+            start (str, datetime or pd.Timestamp): Only fetch events at or after this
+                time.  Times without a timezone are treated as UTC.
+            end (str, datetime or pd.Timestamp): Only fetch events before this time.
+                Times without a timezone are treated as UTC.
+
+        Returns:
+            (pd.DataFrame, pd.DataFrame): The events, as returned by fetch_events, and
+                the raw events, as returned by fetch_raw_events.
+        """
+
+        start, end = parse_time_range(start, end)
+
+        slug = self.find_stream(slug_or_name)
+        return self._channel.fetch_events_with_raw(slug, postprocess=self._combine_postprocess(subkey, postprocess),
+                                                   start=start, end=end)
+
+    def enable_frame_cache(self, max_size):
+        """Keep the results of fetch_stream and fetch_events in memory.
+
+        Fetching a stream normally parses the data and attaches its metadata
+        every time, even if the channel has cached the underlying data.  With
+        the frame cache enabled, the StreamSeries and event DataFrames that
+        this group returns are kept, keyed by stream and time range, up to
+        a memory budget.  The least recently used results are evicted first
+        once the budget is exceeded.
+
+        Each call returns a copy of the cached result so you can modify it
+        freely.  The cache is cleared if the group's metadata is refreshed.
+        Calling this again with a different budget keeps the cached results
+        that fit in it.
+
+        Args:
+            max_size (int): The maximum number of bytes of results to keep.
+        """
+
+        if max_size is None or max_size < 0:
+            raise ArgumentError("You must pass a memory budget in bytes to enable the frame cache", max_size=max_size)
+
+        if self._frame_cache is None:
+            self._frame_cache = MemoryCache(max_size, shards=1, sizer=self._frame_size)
+        else:
+            self._frame_cache.set_max_size(max_size)
+
+    def disable_frame_cache(self):
+        """Stop caching fetched results and drop all cached results."""
+
+        self._frame_cache = None
+
+    def frame_cache_stats(self):
+        """Return statistics about the frame cache.
+
+        Returns:
+            dict: The number of cached results, their size in bytes, the size
+                budget and the number of hits, misses and evictions, or None if
+                the frame cache is not enabled.  See MemoryCache.stats().
+        """
+
+        if self._frame_cache is None:
+            return None
+
+        return self._frame_cache.stats()
+
+    def _get_cached_frame(self, key):
+        cache = self._frame_cache
+        if cache is None:
+            return None
+
+        frame = cache.get(key)
+        if frame is None:
+            return None
+
+        return frame.copy()
+
+    def _cache_frame(self, key, frame):
+        cache = self._frame_cache
+        if cache is not None:
+            cache.put(key, frame.copy())
+
+    @classmethod
+    def _frame_size(cls, frame):
+        size = frame.memory_usage(deep=True)
+        if isinstance(size, pd.Series):
+            size = size.sum()
+
+        return int(size)
+
+    @classmethod
+    def _combine_postprocess(cls, subkey, postprocess):
         if postprocess is None:
             postprocess = lambda i, x, event: x
 
-        combined_postprocess = postprocess
-        if subkey is not None:
-            combined_postprocess = lambda i, x, event: postprocess(i, x[subkey], event)
+        if subkey is None:
+            return postprocess
 
-        slug = self.find_stream(slug_or_name)
-        return self._channel.fetch_raw_events(slug, postprocess=combined_postprocess)
+        return lambda i, x, event: postprocess(i, x[subkey], event)
 
     @classmethod
     def _parse_stream_list(cls, stream_list):
@@ -344,6 +684,186 @@ class AnalysisGroup(object):
         channel = IOTileCloudChannel(slug, domain=domain)
         return AnalysisGroup(channel)
 
+    @classmethod
+    def FromProject(cls, slug, domain=DOMAIN_NAME):
+        """Create a new AnalysisGroup from all of the devices in a project.
+
+        All of the project's streams are listed with parallel paginated
+        requests and they are counted in bulk, with a few requests per
+        device, so large projects open in about the same time as a few
+        devices.
+
+        Args:
+            slug (str): the slug of the project that we want, starting with
+                'p--', or its UUID.
+            domain (str): Optional iotile.cloud domain to connect to (defaults to
+                https://iotile.cloud).
+        """
+
+        if not slug.startswith('p--'):
+            session = CloudSession(domain=domain)
+
+            try:
+                slug = session.get_api().project(slug).get()['slug']
+            except RestHttpBaseException as exc:
+                raise CloudError("Could not find project", project=slug, exception=exc, response=exc.response.status_code)
+
+        channel = IOTileCloudChannel(slug, domain=domain)
+        return AnalysisGroup(channel)
+
+    @classmethod
+    def FromDevices(cls, slugs, domain=DOMAIN_NAME, include_system=False):
+        """Create a new AnalysisGroup from a list of devices.
+
+        The streams of all of the devices are listed in a single parallel
+        batch of requests and counted in bulk, with a few requests per
+        device, rather than creating one AnalysisGroup per device.
+
+        Args:
+            slugs (list(str)): The slugs of the devices that we want.  These can
+                either be short slugs with leading zeros omitted or long slugs.
+            domain (str): Optional iotile.cloud domain to connect to (defaults to
+                https://iotile.cloud).
+            include_system (bool): Also include hidden system streams when fetching data
+                for these devices.  System streams are not generally useful so this defaults
+                to False.
+        """
+
+        devices = []
+        for slug in slugs:
+            device = str(IOTileDeviceSlug(slug))
+            if device not in devices:
+                devices.append(device)
+
+        channel = IOTileCloudChannel(devices, domain=domain, include_system=include_system)
+        return AnalysisGroup(channel)
+
+    @classmethod
+    def FromSnapshot(cls, path, revalidate=False):
+        """Reopen an AnalysisGroup from a metadata snapshot.
+
+        The snapshot must have been created by calling snapshot_metadata()
+        on an AnalysisGroup from iotile.cloud.  The group is created without
+        fetching anything from iotile.cloud, so it opens instantly, but its
+        stream list and counts are only as recent as the snapshot.  Stream
+        data is still fetched from iotile.cloud when you ask for it.
+
+        Args:
+            path (str): The path to the snapshot file.
+            revalidate (bool): Refresh the metadata from iotile.cloud in a
+                background thread.  The group uses the snapshot until the
+                refresh finishes.  See revalidate().
+
+        Returns:
+            AnalysisGroup: The reopened AnalysisGroup.
+        """
+
+        with gzip.open(path, 'rb') as infile:
+            snapshot = json.loads(infile.read().decode('utf-8'))
+
+        version = snapshot.get('version')
+        if version != cls.SNAPSHOT_VERSION:
+            raise ArgumentError("Unsupported AnalysisGroup snapshot version", version=version,
+                                supported_version=cls.SNAPSHOT_VERSION, path=path)
+
+        source = snapshot['source']
+        channel = IOTileCloudChannel(source['cloud_id'], domain=source['domain'], include_system=source['include_system'])
+        group = AnalysisGroup(channel, metadata=snapshot)
+
+        if revalidate:
+            group.revalidate(background=True)
+
+        return group
+
+    def snapshot_metadata(self, path):
+        """Save the metadata needed to reopen this AnalysisGroup instantly.
+
+        All of the information that is fetched from iotile.cloud when an
+        AnalysisGroup is created, including stream counts and variable
+        types, is written to a compressed file.  You can reopen the group
+        from it by calling AnalysisGroup.FromSnapshot(path).  No stream data
+        is saved; use save() to save an AnalysisGroup for offline use.
+
+        Only AnalysisGroups created from iotile.cloud can be snapshotted.
+
+        Args:
+            path (str): The path of the snapshot file to create.  An existing
+                file is overwritten.
+        """
+
+        if not isinstance(self._channel, IOTileCloudChannel):
+            raise ArgumentError("Only AnalysisGroups from iotile.cloud support metadata snapshots")
+
+        with self._lazy_lock:
+            snapshot = {
+                'version': self.SNAPSHOT_VERSION,
+                'source': self._channel.source_args(),
+                'streams': [slug if stream is None else stream for slug, stream in viewitems(self.streams)],
+                'source_info': self.source_info,
+                'properties': self.properties,
+                'stream_counts': self.stream_counts,
+                'variable_types': self.variable_types
+            }
+
+        with gzip.open(path, 'wb') as outfile:
+            outfile.write(json.dumps(snapshot).encode('utf-8'))
+
+    def revalidate(self, background=False):
+        """Refresh this group's metadata from its channel.
+
+        The stream list, source info, properties, stream counts and
+        variable types are all fetched again and then replace the current
+        metadata at once.  This is mainly useful for groups reopened from a
+        snapshot with FromSnapshot.
+
+        Args:
+            background (bool): Refresh in a background thread and return
+                immediately.  Errors are logged rather than raised.  You can
+                wait for the refresh with wait_revalidation().
+        """
+
+        if background:
+            self._revalidation = threading.Thread(target=self._revalidate_in_background, name="AnalysisGroup revalidation")
+            self._revalidation.daemon = True
+            self._revalidation.start()
+            return
+
+        stream_list, source_info, properties = self._channel.fetch_group_info()
+        streams = self._parse_stream_list(stream_list)
+
+        metadata = {
+            'streams': stream_list,
+            'source_info': source_info,
+            'properties': properties,
+            'stream_counts': self._channel.count_streams(list(streams)),
+            'variable_types': self._channel.fetch_variable_types(self._vartype_slugs(streams))
+        }
+
+        self._set_metadata(metadata)
+
+    def wait_revalidation(self, timeout=None):
+        """Wait for a background revalidation to finish.
+
+        Args:
+            timeout (float): The maximum number of seconds to wait or None to
+                wait forever.
+
+        Returns:
+            bool: True if no background revalidation is still running.
+        """
+
+        if self._revalidation is None:
+            return True
+
+        self._revalidation.join(timeout)
+        return not self._revalidation.is_alive()
+
+    def _revalidate_in_background(self):
+        try:
+            self.revalidate()
+        except Exception:  # pylint:disable=W0703; there is no caller to raise the exception to
+            logging.getLogger(__name__).exception("Error revalidating AnalysisGroup metadata")
+
     @classmethod
     def FromSaved(cls, identifier, format_name):
         """Load a saved AnalysisGroup.
@@ -371,7 +891,7 @@ class AnalysisGroup(object):
         channel = loader(identifier)
         return AnalysisGroup(channel)
 
-    def save(self, identifier, format_name):
+    def save(self, identifier, format_name, incremental=False, max_fetches=None, queue_size=None, **format_args):
         """Save this AnalysisGroup.
 
         You can then load this analysis group again by calling
@@ -379,6 +899,19 @@ class AnalysisGroup(object):
 
         with the same identifier and format information.
 
+        Streams are saved in a pipeline: up to max_fetches streams are
+        downloaded concurrently by a pool of worker threads while the
+        calling thread writes finished streams to the saver one at a time,
+        so savers never need to be thread-safe.  No more than
+        max_fetches + queue_size streams are being downloaded or waiting to
+        be written at any time, which caps the memory used by the save.
+
+        If incremental is True and the identifier refers to data that was
+        previously saved, only data points and events newer than the last
+        ones saved for each stream are fetched and appended.  Data that
+        arrives in the cloud late, with a timestamp older than what was
+        already saved, is not picked up by an incremental save.
+
         Args:
             identifier (str): The format specific identifier that we will
                 use to name this saved AnalysisGroup.  The meaning of this
@@ -387,27 +920,143 @@ class AnalysisGroup(object):
             format_name (str): An identifier for the format we wish to use to
                 save our data.  You can find the list of available formats
                 by calling list_formats().
+            incremental (bool): Append new data to a previous save rather than
+                overwriting it.
+            max_fetches (int): The maximum number of streams to download at once.
+                Defaults to SAVE_CONCURRENCY.
+            queue_size (int): The number of additional streams that may be queued
+                for writing beyond those being downloaded.  Defaults to max_fetches.
+            **format_args: Additional format specific options, for example the
+                compression to use for hdf5 files.
         """
 
+        if max_fetches is None:
+            max_fetches = self.SAVE_CONCURRENCY
+
+        if queue_size is None:
+            queue_size = max_fetches
+
+        if max_fetches < 1 or queue_size < 1:
+            raise ArgumentError("You must allow at least one stream to be fetched and queued at once",
+                                max_fetches=max_fetches, queue_size=queue_size)
+
         saver_factory = self._find_save_format(format_name)
-        with saver_factory(identifier) as saver:
-            for slug, stream in viewitems(self.streams):
-                data = None
-                events = None
-                raw_events = None
 
-                if not self.stream_empty(slug):
-                    data = self.fetch_stream(slug)
-                    events = self.fetch_events(slug)
-                    raw_events = self.fetch_raw_events(slug)
+        if incremental:
+            format_args['append'] = True
+
+        unsupported = [x for x in sorted(format_args) if not _accepts_keyword(saver_factory, x)]
+        if 'append' in unsupported:
+            raise ArgumentError("Save format does not support incremental saves", format_name=format_name)
+        if len(unsupported) > 0:
+            raise ArgumentError("Save format does not support the options passed", format_name=format_name,
+                                options=unsupported)
+
+        saver = saver_factory(identifier, **format_args)
 
-                saver.save_stream(slug, stream, data, events, raw_events)
+        with saver:
+            self._save_streams(saver, incremental, max_fetches, queue_size)
 
             for slug, vartype in viewitems(self.variable_types):
                 saver.save_vartype(slug, vartype)
 
             saver.save_source_info(self.source_info, self.properties)
 
+    def _save_streams(self, saver, incremental, max_fetches, queue_size):
+        """Fetch streams in a pool of worker threads and write them from this thread.
+
+        The workers use their own thread pool rather than CloudSession.pool
+        because each fetch makes parallel requests through CloudSession.pool
+        and would deadlock if it were waiting inside that same pool.
+        """
+
+        self._count_streams(self.streams)
+
+        remaining = iter(list(viewitems(self.streams)))
+        completed = Queue(maxsize=max_fetches + queue_size)
+        pending = deque()
+
+        def _submit_next():
+            entry = next(remaining, None)
+            if entry is None:
+                return False
+
+            slug, stream = entry
+
+            state = None
+            if incremental:
+                state = saver.sync_state(slug)
+
+            pending.append(slug)
+            pool.apply_async(self._fetch_for_save, (slug, stream, incremental, state), callback=completed.put)
+            return True
+
+        pool = ThreadPool(max_fetches)
+
+        try:
+            while len(pending) < max_fetches + queue_size and _submit_next():
+                pass
+
+            while len(pending) > 0:
+                pending.pop()
+                slug, stream, fetched, err = completed.get()
+
+                if err is not None:
+                    raise err
+
+                if incremental:
+                    saver.append_stream(slug, stream, *fetched)
+                else:
+                    saver.save_stream(slug, stream, *fetched)
+
+                _submit_next()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _fetch_for_save(self, slug, stream, incremental, state):
+        """Fetch the data, events and raw events that save() needs for a stream.
+
+        If incremental is True, only data newer than state, which comes from
+        the saver's sync_state(), is fetched.
+        """
+
+        try:
+            fetched = (None, None, None)
+
+            if not self.stream_empty(slug):
+                if incremental:
+                    fetched = self._fetch_newer(slug, state)
+                else:
+                    events, raw_events = self.fetch_events_with_raw(slug)
+                    fetched = (self.fetch_stream(slug), events, raw_events)
+
+            return slug, stream, fetched, None
+        except Exception as err:  # pylint:disable=W0703; we reraise the exception in the writing thread
+            logging.getLogger(__name__).exception("Error fetching stream %s to save", slug)
+            return slug, stream, None, err
+
+    def _fetch_newer(self, slug, state):
+        """Fetch the data and events newer than a previously saved state."""
+
+        if state is None:
+            state = {'last_point': None, 'last_event': None}
+
+        data_start = self._after(state['last_point'])
+        event_start = self._after(state['last_event'])
+
+        data = self.fetch_stream(slug, allow_empty=True, start=data_start)
+        events, raw_events = self.fetch_events_with_raw(slug, start=event_start)
+
+        return data, events, raw_events
+
+    @classmethod
+    def _after(cls, timestamp):
+        if timestamp is None:
+            return None
+
+        return timestamp + pd.Timedelta(1, unit='ns')
+
     @classmethod
     def _find_save_format(cls, format_name):
         for entry in pkg_resources.iter_entry_points('iotile_analytics.save_format', format_name):
@@ -436,9 +1085,11 @@ class AnalysisGroup(object):
         """Configure how this channel handling caching data that has been fetched.
 
         Args:
-            policy (int): One of UNLIMITED_CACHE, LRU_CACHE or NO_CACHE.
+            policy (int): One of ChannelCaching.UNLIMITED, ChannelCaching.LRU or
+                ChannelCaching.NONE.
             param (object): Optional parameter that can configure the behavior of
-                the caching mode chosen.
+                the caching mode chosen.  For ChannelCaching.LRU this is the memory
+                budget in bytes.
         """
 
         self._channel.set_caching(policy, param)
@@ -8,8 +8,11 @@ import math
 import json
 import ssl
 import sys
+import time
+import random
 import logging
 from threading import Lock
+from collections import deque, namedtuple
 from multiprocessing.pool import ThreadPool
 from future.utils import iteritems
 
@@ -24,19 +27,35 @@ try:
     #python2
     from urllib2 import urlopen, Request
     from urllib import urlencode
+    from Queue import Queue
     import urllib3
 except ImportError:
     #python3
     from urllib.request import urlopen, Request
     from urllib.parse import urlencode
+    from queue import Queue
     import urllib3
 
 from typedargs.exceptions import ArgumentError
 from iotile_cloud.api.connection import Api, DOMAIN_NAME
 from iotile_cloud.api.exceptions import HttpNotFoundError, HttpClientError, RestHttpBaseException, HttpCouldNotVerifyServerError
-from .exceptions import CloudError, AuthenticationError, CertificateVerificationError
+from .exceptions import CloudError, AuthenticationError, CertificateVerificationError, MissingPackageError
 from .interaction import ProgressBar
-from .utilities.url_routines import get_url, pack_url, post_url
+from .utilities.url_routines import get_url, pack_url, post_url, configure_transport
+from .utilities.disk_cache import DiskCache
+from .utilities.memory_cache import MemoryCache
+from .utilities.throttle import AdaptiveLimiter, classify_error, request_class
+from .utilities.single_flight import SingleFlight
+
+
+FailedRequest = namedtuple("FailedRequest", ['key', 'error'])
+
+
+def _is_certificate_error(error):
+    """Check if a transport error was caused by failing to verify the server's certificate."""
+
+    reason = getattr(error, 'reason', None)
+    return reason is not None and 'CERTIFICATE_VERIFY_FAILED' in str(reason)
 
 
 class CloudSession(object):
@@ -75,9 +94,30 @@ class CloudSession(object):
             login to the domain that you are talking to.
         token (str): An optional, manually entered IOTile token.
             If valid, bypasses the user+password login, then proceeds as usual
+
+    GET requests made in parallel are retried up to MAX_RETRIES times if they
+    fail with a transient error such as a timeout, a 5xx status or a 429
+    status.  The delay between retries grows exponentially from
+    RETRY_BACKOFF seconds with random jitter, up to MAX_RETRY_DELAY, unless
+    the server sends a Retry-After header.  Per-request timeouts are set with
+    configure_transport().
+
+    Parallel requests are made from a shared pool of MAX_CONCURRENCY threads
+    but the number actually in flight to each domain is adjusted
+    automatically between MIN_CONCURRENCY and MAX_CONCURRENCY, starting at
+    INITIAL_CONCURRENCY.  It grows while requests succeed quickly and
+    shrinks when latency rises or the server returns errors or asks us to
+    slow down.  You can also cap the request rate to a domain using
+    set_rate_limit().
     """
 
-    MAX_CONCURRENCY = 10
+    MIN_CONCURRENCY = 1
+    INITIAL_CONCURRENCY = 10
+    MAX_CONCURRENCY = 32
+
+    MAX_RETRIES = 3
+    RETRY_BACKOFF = 0.5
+    MAX_RETRY_DELAY = 30.0
     _login_cache = {}
     pool = None
 
@@ -87,20 +127,24 @@ class CloudSession(object):
         if CloudSession.pool is None:
             self.logger.debug("Creating thread pool with %d threads", CloudSession.MAX_CONCURRENCY)
             CloudSession.pool = ThreadPool(CloudSession.MAX_CONCURRENCY)
+            configure_transport(pool_size=CloudSession.MAX_CONCURRENCY)
             self.logger.debug("Finished creating thread pool.")
 
         if domain not in CloudSession._login_cache:
-            CloudSession._login_cache[domain] = {'requests': {}, 'request_lock': Lock()}
+            CloudSession._login_cache[domain] = {'requests': MemoryCache(), 'request_lock': Lock(), 'limiter': self._create_limiter(),
+                                                 'inflight': SingleFlight()}
 
         # If we are logging in with a different user than before, clear out the old cache data.
         cache = CloudSession._login_cache[domain]
         with cache['request_lock']:
             old_user = cache.get('user')
             if user is not None and old_user is not None and old_user != user:
-                CloudSession._login_cache[domain] = {'requests': {}, 'request_lock': Lock()}
+                CloudSession._login_cache[domain] = {'requests': MemoryCache(), 'request_lock': Lock(), 'limiter': cache['limiter'],
+                                                     'inflight': SingleFlight()}
 
         self.domain = domain
         self.enable_cache = True
+        self._async_transport = None
 
         if verify is not None:
             self.verify = verify
@@ -182,7 +226,8 @@ class CloudSession(object):
         except HttpClientError:
             return False
 
-    def fetch_multiple(self, resources, per_call_kw=None, postprocess=None, message=None, postprocess_args=None, **kwargs):
+    def fetch_multiple(self, resources, per_call_kw=None, postprocess=None, message=None, postprocess_args=None,
+                       allow_partial=False, **kwargs):
         """Fetch multiple resources in parallel.
 
         Up to concurrency max calls are in flight at a given time.  The results
@@ -200,13 +245,76 @@ class CloudSession(object):
             postprocess_args (list of tuples): Optional list of additional arguments to pass
                 to postprocess function.  If it is not None, it must be a list of tuples with
                 the same length as resources.
+            allow_partial (bool): Return the results that could be fetched even if some
+                resources failed after all retries, rather than raising the first error.
             **kwargs (str): Additional keyword arguments that are passed as part of
                 the query string in the get request.
 
         Returns:
             dict[]: A list of the results for each resource.
+
+            If allow_partial is True, a tuple of that list, with None in place of
+            each failed result, and a list of FailedRequest objects whose key is
+            the index of the failed resource, so that you can retry just those
+            resources.
         """
 
+        if self._async_transport is not None:
+            return self._async_transport.run(self._async_transport.fetch_multiple, resources, per_call_kw=per_call_kw,
+                                             postprocess=postprocess, message=message, postprocess_args=postprocess_args,
+                                             allow_partial=allow_partial, **kwargs)
+
+        args = self._prepare_fetches(resources, per_call_kw, postprocess, postprocess_args, kwargs)
+
+        try:
+            with ProgressBar(total=len(resources), message=message, leave=False) as progbar:
+                args = [(x, call_kw, progbar, postprocess, i, extra_args) for i, (x, call_kw, extra_args) in enumerate(args)]
+                wrapped_results = self.pool.map(self._resource_fetcher, args)
+
+                return self._collect_results(wrapped_results, allow_partial)
+        except RestHttpBaseException as err:
+            raise self._translate_error(err, msg="Error fetching resources in parallel from IOTile.cloud")
+
+    def fetch_multiple_async(self, resources, per_call_kw=None, postprocess=None, postprocess_args=None,
+                             progress=None, **kwargs):
+        """Start fetching multiple resources in parallel without waiting for them.
+
+        This takes the same arguments as fetch_multiple but returns as soon
+        as the fetches are queued on the session's thread pool, so that you
+        can start more work while they are in flight.  The fetches are always
+        made from the thread pool, even if the asyncio transport is selected.
+
+        You must not wait for the result from inside a task that is running
+        on CloudSession.pool since that can deadlock the pool.
+
+        Args:
+            resources (RestResource[]): Should be created from an Api object.
+            per_call_kw (dict[]): Optional keyword arguments for each fetch call.
+            postprocess (callable): Optional callable function that will be called as:
+                `postprocess(index, data, *postprocess_args[index])`.
+            postprocess_args (list of tuples): Optional list of additional arguments to pass
+                to postprocess function.
+            progress (ProgressBar): Optional progress bar that is updated as each resource
+                is fetched.
+            **kwargs (str): Additional keyword arguments that are passed as part of
+                the query string in the get request.
+
+        Returns:
+            PendingFetches: An object whose get() method waits for and returns the results.
+        """
+
+        if progress is None:
+            progress = _NoProgress()
+
+        args = self._prepare_fetches(resources, per_call_kw, postprocess, postprocess_args, kwargs)
+        args = [(x, call_kw, progress, postprocess, i, extra_args) for i, (x, call_kw, extra_args) in enumerate(args)]
+
+        return PendingFetches(self, self.pool.map_async(self._resource_fetcher, args))
+
+    @classmethod
+    def _prepare_fetches(cls, resources, per_call_kw, postprocess, postprocess_args, kwargs):
+        """Validate the arguments to fetch_multiple and return (resource, query, postprocess_args) for each call."""
+
         if per_call_kw is None:
             per_call_kw = [{} for x in range(0, len(resources))]
 
@@ -223,18 +331,22 @@ class CloudSession(object):
         if postprocess_args is None:
             postprocess_args = [tuple() for x in range(0, len(resources))]
 
-        try:
-            with ProgressBar(total=len(resources), message=message, leave=False) as progbar:
-                args = [(x, _merge_dicts(per_call_kw[i], kwargs), progbar, postprocess, i, postprocess_args[i]) for i, x in enumerate(resources)]
-                wrapped_results = self.pool.map(self._resource_fetcher, args)
+        return [(x, _merge_dicts(per_call_kw[i], kwargs), postprocess_args[i]) for i, x in enumerate(resources)]
+
+    @classmethod
+    def _collect_results(cls, wrapped_results, allow_partial):
+        """Unwrap a list of (result, error) tuples from parallel fetches."""
 
-                failed = [err for result, err in wrapped_results if err is not None]
-                if len(failed) > 0:
-                    raise failed[0]
+        failed = [FailedRequest(i, err) for i, (_result, err) in enumerate(wrapped_results) if err is not None]
+        results = [result for result, _err in wrapped_results]
 
-                return [result for result, _err in wrapped_results]
-        except RestHttpBaseException as err:
-            raise self._translate_error(err, msg="Error fetching resources in parallel from IOTile.cloud")
+        if allow_partial:
+            return results, failed
+
+        if len(failed) > 0:
+            raise failed[0].error
+
+        return results
 
     def post_multiple(self, urls, datas, headers=None, message=None, include_auth=True):
         """Make multiple parallel posts to urls with the contents as given by datas.
@@ -281,6 +393,21 @@ class CloudSession(object):
             list of bytes: A list of the actual responses to each post.
         """
 
+        if self._async_transport is not None:
+            return self._async_transport.run(self._async_transport.post_multiple, urls, datas, headers=headers,
+                                             message=message, include_auth=include_auth)
+
+        datas, headers = self._prepare_posts(urls, datas, headers, include_auth)
+
+        with ProgressBar(total=len(urls), leave=False, message=message) as progbar:
+            args = zip(urls, datas, headers, [progbar]*len(urls))
+            wrapped_results = self.pool.map(self._generic_url_poster, args)
+
+        return self._collect_results(wrapped_results, False)
+
+    def _prepare_posts(self, urls, datas, headers, include_auth):
+        """Validate the arguments to post_multiple and encode each payload and its headers."""
+
         if headers is None:
             headers = {}
 
@@ -305,25 +432,18 @@ class CloudSession(object):
             if include_auth:
                 in_headers[b'Authorization'] = '{} {}'.format(self.token_type, self.token).encode('utf-8')
 
-        with ProgressBar(total=len(urls), leave=False, message=message) as progbar:
-            args = zip(urls, datas, headers, [progbar]*len(urls))
-            wrapped_results = self.pool.map(self._generic_url_poster, args)
-
-        failed = [err for _result, err in wrapped_results if err is not None]
-        if len(failed) > 0:
-            raise failed[0]
-
-        return [x for x, _y in wrapped_results]
+        return datas, headers
 
-    def fetch_all(self, resource, page_size=100, message=None, **kwargs):
+    def fetch_all(self, resource, page_size=100, message=None, allow_partial=False, **kwargs):
         """Fetch and concatenate all pages of a given resource.
 
         The pages are fetched in parallel using up to concurrency requests
         at a time.
 
-        If one page request fails, the fetch fails.  A single call is made to
-        figure out how many results there are and then batched calls are made
-        to download the pages in parallel.
+        If one page request fails, the fetch fails unless you pass
+        allow_partial=True.  A single call is made to figure out how many
+        results there are and then batched calls are made to download the
+        pages in parallel.
 
         The RestResource is accessed using get with any keyword arguments passed
         to this function.
@@ -331,57 +451,233 @@ class CloudSession(object):
         **You cannot pass the page keyword argument to this function explicitly since
         that keyword is generated and used internally.**
 
+        If you can process the results one page at a time, use iter_pages or
+        iter_all instead, which let you start working before all pages have
+        been downloaded.
+
         Args:
             resource (RestResource): Should be created from an Api object.
             page_size (int): The desired page size to use for fetches.
             message (str): Optional descriptive message that is printed with the progress bar
+            allow_partial (bool): Return the results from all pages that could be fetched
+                even if some pages failed after all retries.  The first page must
+                always succeed since it tells us how many pages there are.
             **kwargs (str): Additional keyword arguments that are passed as part of
                 the query string in the get request.
 
         Returns:
             dict[]: A list of the results concatenated from all pages.
+
+            If allow_partial is True, a tuple of that list, which skips any failed
+            pages, and a list of FailedRequest objects whose key is the failed page
+            number.  You can fetch just those pages later using fetch_pages.
         """
 
-        try:
-            with ProgressBar(total=100, leave=False, message=message) as progbar:
-                results = resource.get(page_size=page_size, **kwargs)
-                total_count = results['count']
-                results = results.get('results', [])
+        if self._async_transport is not None:
+            return self._async_transport.run(self._async_transport.fetch_all, resource, page_size=page_size,
+                                             message=message, allow_partial=allow_partial, **kwargs)
 
-                if total_count <= page_size:
-                    progbar.total = 1
-                    progbar.update(1)
-                    return results
+        results = []
+        failed = []
 
-                pages = int(math.ceil(total_count / float(page_size)))
-                progbar.total = pages
-                progbar.update(1)
+        for page, result, err in self._iter_page_results(resource, page_size, message, True, None, kwargs):
+            if err is not None:
+                if not allow_partial:
+                    raise self._translate_error(err, msg="Error fetching resource from IOTile.cloud", url=resource.url(), page=page)
 
-                args = [(resource, x+1, page_size, kwargs, progbar) for x in range(1, pages)]
+                failed.append(FailedRequest(page, err))
+                continue
 
-                wrapped_results = self.pool.map(self._url_fetcher, args)
+            results.extend(result)
 
-                failed = [err for result, err in wrapped_results if err is not None]
-                if len(failed) > 0:
-                    raise failed[0]
+        if allow_partial:
+            return results, failed
 
-                for result, _err in wrapped_results:
-                    results.extend(result.get('results'))
+        return results
 
-                return results
-        except RestHttpBaseException as err:
-            raise self._translate_error(err, msg="Error fetching resource from IOTile.cloud", url=resource.url())
+    def fetch_pages(self, resource, pages, page_size=100, message=None, allow_partial=False, **kwargs):
+        """Fetch specific pages of a given resource in parallel.
+
+        This is useful to retry only the pages that failed in a previous call
+        to fetch_all with allow_partial=True.  You must pass the same
+        page_size and keyword arguments that you passed to fetch_all.
+
+        Args:
+            resource (RestResource): Should be created from an Api object.
+            pages (list(int)): The page numbers to fetch, starting at 1.
+            page_size (int): The page size to use for fetches.
+            message (str): Optional descriptive message that is printed with the progress bar
+            allow_partial (bool): Return the pages that could be fetched even if some
+                failed after all retries, rather than raising the first error.
+            **kwargs (str): Additional keyword arguments that are passed as part of
+                the query string in the get request.
+
+        Returns:
+            list(dict[]): The list of results in each page, in the same order as pages.
+
+            If allow_partial is True, a tuple of that list, with None in place of
+            each failed page, and a list of FailedRequest objects whose key is the
+            failed page number.
+        """
+
+        with ProgressBar(total=len(pages), leave=False, message=message) as progbar:
+            args = [(resource, page, page_size, kwargs, progbar) for page in pages]
+            wrapped_results = self.pool.map(self._url_fetcher, args)
+
+        failed = [FailedRequest(page, err) for page, (_result, err) in zip(pages, wrapped_results) if err is not None]
+        results = [result.get('results') if err is None else None for result, err in wrapped_results]
+
+        if allow_partial:
+            return results, failed
+
+        if len(failed) > 0:
+            raise self._translate_error(failed[0].error, msg="Error fetching resource from IOTile.cloud",
+                                        url=resource.url(), page=failed[0].key)
+
+        return results
+
+    def iter_all(self, resource, page_size=100, message=None, ordered=True, max_in_flight=None, **kwargs):
+        """Iterate over all results of a given resource without waiting for all pages.
+
+        This is the same as iter_pages except that it yields each result
+        individually rather than one list per page.
+
+        Args:
+            resource (RestResource): Should be created from an Api object.
+            page_size (int): The desired page size to use for fetches.
+            message (str): Optional descriptive message that is printed with the progress bar
+            ordered (bool): Yield results in page order (the default) or in
+                the order that pages finish downloading.
+            max_in_flight (int): The maximum number of pages that may be downloading or
+                downloaded but not yet consumed at any time.  Defaults to twice
+                MAX_CONCURRENCY.
+            **kwargs (str): Additional keyword arguments that are passed as part of
+                the query string in the get request.
+
+        Yields:
+            dict: Each result from each page.
+        """
+
+        for page in self.iter_pages(resource, page_size=page_size, message=message, ordered=ordered,
+                                    max_in_flight=max_in_flight, **kwargs):
+            for result in page:
+                yield result
+
+    def iter_pages(self, resource, page_size=100, message=None, ordered=True, max_in_flight=None, **kwargs):
+        """Iterate over the pages of a given resource while later pages download.
+
+        A single call is made to figure out how many results there are and
+        then the remaining pages are downloaded in parallel in the background.
+        Each page is yielded as soon as it is available, so you can process
+        the first pages while the later ones are still being fetched.
+
+        To keep memory use bounded, at most max_in_flight pages are requested
+        ahead of the page you are currently consuming.  New pages are only
+        requested as you consume earlier ones.
+
+        If one page request fails after all retries, the iteration fails with
+        a CloudError.
+
+        **You cannot pass the page keyword argument to this function explicitly since
+        that keyword is generated and used internally.**
+
+        Args:
+            resource (RestResource): Should be created from an Api object.
+            page_size (int): The desired page size to use for fetches.
+            message (str): Optional descriptive message that is printed with the progress bar
+            ordered (bool): Yield pages in order (the default).  If False, pages are
+                yielded in the order that they finish downloading.
+            max_in_flight (int): The maximum number of pages that may be downloading or
+                downloaded but not yet consumed at any time.  Defaults to twice
+                MAX_CONCURRENCY.
+            **kwargs (str): Additional keyword arguments that are passed as part of
+                the query string in the get request.
+
+        Yields:
+            dict[]: The list of results in each page.
+        """
+
+        for page, result, err in self._iter_page_results(resource, page_size, message, ordered, max_in_flight, kwargs):
+            if err is not None:
+                raise self._translate_error(err, msg="Error fetching resource from IOTile.cloud", url=resource.url(), page=page)
+
+            yield result
+
+    def _iter_page_results(self, resource, page_size, message, ordered, max_in_flight, kwargs):
+        """Generate (page, results, error) tuples for every page of a resource.
+
+        The first page is fetched synchronously to learn how many pages there
+        are and its error, if any, is raised immediately.
+        """
+
+        if max_in_flight is None:
+            max_in_flight = 2*CloudSession.MAX_CONCURRENCY
+
+        if max_in_flight < 1:
+            raise ArgumentError("You must allow at least one page in flight", max_in_flight=max_in_flight)
+
+        with ProgressBar(total=1, leave=False, message=message) as progbar:
+            results, err = self._url_fetcher((resource, 1, page_size, kwargs, progbar))
+            if err is not None:
+                raise self._translate_error(err, msg="Error fetching resource from IOTile.cloud", url=resource.url())
+
+            total_count = results['count']
+            first_page = results.get('results', [])
+
+            if total_count <= page_size:
+                yield 1, first_page, None
+                return
+
+            pages = int(math.ceil(total_count / float(page_size)))
+            progbar.total = pages
+
+            remaining = iter(range(2, pages + 1))
+            completed = Queue()
+            pending = deque()
+
+            def _fetch_page(page):
+                result, err = self._url_fetcher((resource, page, page_size, kwargs, progbar))
+                return page, result, err
+
+            def _submit_next():
+                page = next(remaining, None)
+                if page is None:
+                    return False
+
+                if ordered:
+                    pending.append(self.pool.apply_async(_fetch_page, (page,)))
+                else:
+                    pending.append(page)
+                    self.pool.apply_async(_fetch_page, (page,), callback=completed.put)
+
+                return True
+
+            while len(pending) < max_in_flight and _submit_next():
+                pass
+
+            yield 1, first_page, None
+            first_page = None
+
+            while len(pending) > 0:
+                if ordered:
+                    page, result, err = pending.popleft().get()
+                else:
+                    pending.pop()
+                    page, result, err = completed.get()
+
+                _submit_next()
+
+                if err is not None:
+                    yield page, None, err
+                else:
+                    yield page, result.get('results'), None
 
     def _resource_fetcher(self, args):
         resource, kwargs, progress, postprocess, i, postprocess_args = args
 
         try:
             request = pack_url(resource.url(), kwargs, token=self.token, token_type=self.token_type, verify=self.verify)
-            result = self._check_cache(request.request_key)
-
-            if result is None:
-                result = get_url(request)
-                self._cache_result(request.request_key, result)
+            result = self._fetch_request(request)
 
             if postprocess is not None:
                 result = postprocess(i, result, *postprocess_args)
@@ -399,7 +695,7 @@ class CloudSession(object):
 
         try:
             request = pack_url(url, headers=headers, verify=self.verify)
-            resp_data = post_url(request, data, progress=progress)
+            resp_data = self._throttled(post_url, request, data, progress=progress)
             return resp_data, None
         except Exception as err:  # pylint:disable=W0703; we do the exception processing in the calling function
             self.logger.exception("Error posting to url %s, headers=%s", url, headers)
@@ -416,34 +712,293 @@ class CloudSession(object):
             query['page'] = page
 
             request = pack_url(resource.url(), query, token=self.token, token_type=self.token_type, verify=self.verify)
-            result = self._check_cache(request.request_key)
-
-            if result is None:
-                result = get_url(request)
-                self._cache_result(request.request_key, result)
+            result = self._fetch_request(request)
 
             progress.update(1)
             return result, None
         except Exception as err:  # pylint:disable=W0703; we do the exception processing in the calling function
             return None, err
 
+    @classmethod
+    def _create_limiter(cls):
+        return AdaptiveLimiter(initial=min(cls.INITIAL_CONCURRENCY, cls.MAX_CONCURRENCY),
+                               minimum=min(cls.MIN_CONCURRENCY, cls.INITIAL_CONCURRENCY),
+                               maximum=cls.MAX_CONCURRENCY)
+
+    def _throttled(self, func, request, *args, **kwargs):
+        """Call func(request) once the concurrency and rate limits for our domain allow it."""
+
+        limiter = self._login_cache[self.domain]['limiter']
+        limiter.acquire()
+
+        start = time.time()
+        error = None
+
+        try:
+            return func(request, *args, **kwargs)
+        except Exception as err:  # pylint:disable=W0703; we just record the error and reraise it
+            error = err
+            raise
+        finally:
+            limiter.release(time.time() - start, error, request_class=request_class(request))
+
+    def _fetch_request(self, request):
+        """Get a request from the cache or make it, sharing any identical request in flight."""
+
+        result = self._check_cache(request.request_key)
+        if result is not None:
+            return result
+
+        inflight = self._login_cache[self.domain]['inflight']
+        return inflight.do(request.request_key, self._fetch_uncached, request)
+
+    def _fetch_uncached(self, request):
+        result = self._get_with_retries(request)
+        self._cache_result(request.request_key, result)
+        return result
+
+    def _get_with_retries(self, request):
+        """Fetch a url, retrying with exponential backoff on transient errors."""
+
+        attempt = 0
+
+        while True:
+            try:
+                return self._throttled(get_url, request)
+            except Exception as err:  # pylint:disable=W0703; we reraise anything we don't retry
+                outcome, retry_after = classify_error(err)
+                if outcome not in ('throttled', 'error') or attempt >= self.MAX_RETRIES:
+                    raise
+
+                delay = self._retry_delay(attempt, retry_after)
+                attempt += 1
+
+                self.logger.info("Retrying %s in %.1f seconds after error (attempt %d of %d): %s",
+                                 request.url, delay, attempt, self.MAX_RETRIES, err)
+                time.sleep(delay)
+
+    @classmethod
+    def _retry_delay(cls, attempt, retry_after=None):
+        """Compute how long to wait before retrying using exponential backoff with jitter."""
+
+        if retry_after is not None:
+            return min(retry_after, cls.MAX_RETRY_DELAY)
+
+        ceiling = min(cls.MAX_RETRY_DELAY, cls.RETRY_BACKOFF * (2 ** attempt))
+        return random.uniform(ceiling / 2.0, ceiling)
+
+    def async_transport(self, max_concurrency=None):
+        """Create an asyncio based transport that shares this session's login and cache.
+
+        The transport has coroutine versions of fetch_multiple, fetch_all and
+        post_multiple that make all requests from a single thread, so you can
+        have hundreds of requests in flight at once.  You can await them
+        directly from a running event loop such as the one in a Jupyter
+        notebook.  The transport has its own concurrency limit but shares
+        this session's rate limit and backoff after throttling.
+
+        This requires python 3.5 or later and the aiohttp package.
+
+        Args:
+            max_concurrency (int): The maximum number of requests in flight at
+                once.  Defaults to AsyncTransport.DEFAULT_CONCURRENCY.
+
+        Returns:
+            AsyncTransport: The new transport.
+        """
+
+        if sys.version_info < (3, 5):
+            raise MissingPackageError("The asyncio transport requires python 3.5 or later", package="python>=3.5",
+                                      suggestion="Use the default thread based transport")
+
+        from .async_transport import AsyncTransport
+        return AsyncTransport(self, max_concurrency=max_concurrency)
+
+    def set_transport(self, transport, max_concurrency=None):
+        """Choose how fetch_multiple, fetch_all and post_multiple make their requests.
+
+        The default 'threads' transport makes requests from a shared thread
+        pool.  The 'asyncio' transport makes them from an event loop using
+        aiohttp and supports many more concurrent requests.  The synchronous
+        methods are thin wrappers around it that block until all requests
+        finish, so existing callers work unchanged with either transport.
+        Both transports share the rate limit and backoff state of the domain.
+
+        Args:
+            transport (str): Either 'threads' or 'asyncio'.
+            max_concurrency (int): The maximum number of requests in flight at
+                once when using the asyncio transport.
+        """
+
+        if transport == 'threads':
+            new_transport = None
+        elif transport == 'asyncio':
+            new_transport = self.async_transport(max_concurrency=max_concurrency)
+        else:
+            raise ArgumentError("Unknown transport", transport=transport, known_transports=['threads', 'asyncio'])
+
+        old_transport = self._async_transport
+        self._async_transport = new_transport
+
+        if old_transport is not None:
+            old_transport.shutdown()
+
+    def set_rate_limit(self, rate, burst=None):
+        """Limit the average number of requests per second made to our domain.
+
+        The limit applies to all parallel requests made through
+        fetch_multiple, fetch_all, iter_pages and post_multiple by all
+        sessions talking to the same domain.  It is applied in addition to
+        the automatic concurrency control.
+
+        Args:
+            rate (float): The maximum average number of requests per second or None
+                to remove the rate limit.
+            burst (int): The maximum number of requests that can be started at once
+                after an idle period.  Defaults to one second worth of requests.
+        """
+
+        self._login_cache[self.domain]['limiter'].set_rate_limit(rate, burst)
+
+    def throttle_stats(self):
+        """Return statistics about the concurrency control for our domain.
+
+        Returns:
+            dict: The current concurrency limit, number of requests in flight,
+                observed latency and number of requests that were throttled or
+                failed.  See AdaptiveLimiter.stats().
+        """
+
+        return self._login_cache[self.domain]['limiter'].stats()
+
+    def set_disk_cache(self, path, ttl=DiskCache.DEFAULT_TTL, max_size=DiskCache.DEFAULT_MAX_SIZE):
+        """Persist fetched responses in a cache file on disk.
+
+        Once a disk cache is configured, every response that would be cached
+        in memory is also written to the sqlite database at path and looked up
+        there when it is not found in memory.  The same file can be used by
+        multiple processes at the same time so that repeated runs of a script
+        or several analytics-host workers on the same machine do not fetch the
+        same data from iotile.cloud twice.
+
+        The disk cache is configured per domain, like the in-memory cache, and
+        is dropped if a different user logs in to the same domain.  Since the
+        cache key does not include your credentials, you should not share a
+        cache file between users with different permissions.
+
+        Args:
+            path (str): The path to the cache file.  If None, any previously
+                configured disk cache is disabled.
+            ttl (float): The maximum age of a cached response in seconds.  If None,
+                cached responses never expire.  Defaults to 1 day.
+            max_size (int): The maximum size of the cache file contents in bytes.  If None,
+                the cache is not size limited.  Defaults to 1 GB.
+        """
+
+        disk_cache = None
+        if path is not None:
+            disk_cache = DiskCache(path, ttl=ttl, max_size=max_size)
+
+        cache = self._login_cache[self.domain]
+        with cache['request_lock']:
+            old_cache = cache.get('disk_cache')
+            cache['disk_cache'] = disk_cache
+
+        if old_cache is not None:
+            old_cache.close()
+
+    def set_cache_limit(self, max_size):
+        """Limit the amount of memory used to cache responses.
+
+        By default, every response fetched from iotile.cloud is cached in
+        memory for as long as the process lives.  Setting a limit turns the
+        cache into a least recently used cache that evicts old responses once
+        the total estimated size of all cached responses exceeds max_size.
+
+        The in-memory cache is shared by all sessions talking to the same
+        domain so the limit applies to all of them.
+
+        Args:
+            max_size (int): The maximum number of bytes to use for cached responses.
+                Passing None removes any limit.
+        """
+
+        if max_size is not None and max_size <= 0:
+            raise ArgumentError("The cache size limit must be a positive number of bytes", max_size=max_size)
+
+        self._login_cache[self.domain]['requests'].set_max_size(max_size)
+
+    def cache_stats(self):
+        """Return statistics about the in-memory response cache for our domain.
+
+        Returns:
+            dict: The number of cached entries, their size in bytes, the size limit
+                and the number of cache hits, misses and evictions.  See
+                MemoryCache.stats().
+        """
+
+        return self._login_cache[self.domain]['requests'].stats()
+
+    def coalesce_stats(self):
+        """Return statistics about requests shared between worker threads.
+
+        When several threads make an identical GET request at the same time,
+        only one request is sent to iotile.cloud and the others share its
+        result.
+
+        Returns:
+            dict: The total number of uncached requests, how many of them were
+                coalesced with an identical request already in flight and how many
+                requests are currently in flight.
+        """
+
+        return self._login_cache[self.domain]['inflight'].stats()
+
     def _cache_result(self, query, response):
         if not self.enable_cache:
             return
 
         cache = self._login_cache[self.domain]
+        cache['requests'].put(query, response)
 
-        with cache['request_lock']:
-            cache['requests'][query] = response
+        disk_cache = cache.get('disk_cache')
+        if disk_cache is not None:
+            disk_cache.put(query, response)
 
     def _check_cache(self, key):
         if not self.enable_cache:
             return None
 
         cache = self._login_cache[self.domain]
+        result = cache['requests'].get(key)
 
-        with cache['request_lock']:
-            return cache['requests'].get(key, None)
+        disk_cache = cache.get('disk_cache')
+        if result is not None or disk_cache is None:
+            return result
+
+        result = disk_cache.get(key)
+        if result is not None:
+            cache['requests'].put(key, result)
+
+        return result
+
+    @classmethod
+    def configure_transport(cls, pool_size=None, connect_timeout=None, read_timeout=None):
+        """Configure the keep-alive connection pools used for parallel requests.
+
+        All CloudSession worker threads share one pool of connections per
+        host so that each request can reuse an existing TCP and TLS
+        connection.  The pool size should normally be at least
+        MAX_CONCURRENCY.  Parameters that are not passed keep their current
+        values.
+
+        Args:
+            pool_size (int): The maximum number of connections to keep alive per host.
+            connect_timeout (float): The number of seconds to wait for a connection.
+            read_timeout (float): The number of seconds to wait for data from the server.
+        """
+
+        configure_transport(pool_size=pool_size, connect_timeout=connect_timeout, read_timeout=read_timeout)
 
     def get_api(self):
         """Return a logged in API object to IOTile.cloud.
@@ -458,7 +1013,7 @@ class CloudSession(object):
     def _translate_error(cls, error, msg="Error interacting with iotile.cloud", **kwargs):
         """Translate a raw rest error into a user friendly cloud error."""
 
-        if isinstance(error, HttpCouldNotVerifyServerError):
+        if isinstance(error, HttpCouldNotVerifyServerError) or _is_certificate_error(error):
             raise CertificateVerificationError(msg, raw_eror=error, **kwargs)
 
         return CloudError(msg, raw_error=error, **kwargs)
@@ -542,6 +1097,53 @@ class CloudSession(object):
             raise self._translate_error(err, "Error fetching event data", event_id=event_id)
 
 
+class PendingFetches(object):
+    """Parallel fetches that were started by CloudSession.fetch_multiple_async.
+
+    Args:
+        session (CloudSession): The session making the fetches.
+        async_result (AsyncResult): The result of mapping the fetches onto the
+            session's thread pool.
+    """
+
+    def __init__(self, session, async_result):
+        self._session = session
+        self._async_result = async_result
+
+    def ready(self):
+        """Check if all of the fetches have finished.
+
+        Returns:
+            bool: True if get() will return without blocking.
+        """
+
+        return self._async_result.ready()
+
+    def get(self, allow_partial=False):
+        """Wait for the fetches to finish and return their results.
+
+        Args:
+            allow_partial (bool): Return the results that could be fetched even if some
+                resources failed after all retries, rather than raising the first error.
+
+        Returns:
+            dict[]: A list of the results for each resource, exactly as returned by
+                CloudSession.fetch_multiple.
+        """
+
+        try:
+            return self._session._collect_results(self._async_result.get(), allow_partial)  #pylint:disable=protected-access
+        except RestHttpBaseException as err:
+            raise self._session._translate_error(err, msg="Error fetching resources in parallel from IOTile.cloud")  #pylint:disable=protected-access
+
+
+class _NoProgress(object):
+    """A stand in for ProgressBar when progress is not displayed."""
+
+    def update(self, delta):
+        pass
+
+
 def _merge_dicts(dict1, dict2):
     result = dict1.copy()
     result.update(dict2)
@@ -0,0 +1,32 @@
+"""Helpers for splitting long streams into chunks that are processed one at a time."""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from typedargs.exceptions import ArgumentError
+
+
+def chunk_ranges(first, last, chunk_rows, overlap=0):
+    """Split the rows [first, last) into chunks of at most chunk_rows new rows.
+
+    Each chunk after the first also starts with the last overlap rows of
+    the chunk before it, which is useful for calculations that look at
+    neighboring rows, like differences or rolling windows.
+
+    Args:
+        first (int): The first row to include.
+        last (int): The first row to exclude.
+        chunk_rows (int): The number of new rows in each chunk.
+        overlap (int): The number of rows from the end of the previous chunk
+            to repeat at the start of each chunk.
+
+    Returns:
+        list((int, int)): The [start, stop) rows of each chunk.
+    """
+
+    if chunk_rows is None or chunk_rows < 1:
+        raise ArgumentError("Chunks must contain at least one new row", chunk_rows=chunk_rows)
+
+    if overlap < 0:
+        raise ArgumentError("The overlap between chunks cannot be negative", overlap=overlap)
+
+    return [(max(first, start - overlap), min(start + chunk_rows, last)) for start in range(first, last, chunk_rows)]
@@ -0,0 +1,220 @@
+"""A persistent cache of iotile.cloud responses that can be shared between processes.
+
+The cache is stored in a single sqlite database file so that multiple
+processes on the same machine, for example several analytics-host workers,
+can safely read and write it at the same time.  Each entry is keyed by the
+``request_key`` produced by :func:`pack_url` and stores the decoded JSON
+response compressed with zlib.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+
+class DiskCache(object):
+    """A size and age limited cache of JSON responses stored on disk.
+
+    Entries older than ``ttl`` seconds are treated as missing and are removed
+    the next time they are looked up or by a sweep that runs every
+    SWEEP_INTERVAL writes.  If the total size of all stored entries grows
+    beyond ``max_size`` bytes, the least recently used entries are evicted
+    until the cache fits again.  The total size is kept up to date by
+    triggers in the database so checking it does not scan the cache.
+
+    All errors from the underlying database, such as a file that is locked for
+    too long by another process, are logged and treated as a cache miss so
+    that a problem with the cache can never break a fetch.
+
+    Args:
+        path (str): The path to the sqlite database file that should hold the
+            cache.  It is created if it does not exist.
+        ttl (float): The maximum age of a cached response in seconds.  If None,
+            responses never expire.
+        max_size (int): The maximum number of bytes of (compressed) responses
+            to keep in the cache.  If None, the cache is not size limited.
+    """
+
+    DEFAULT_TTL = 24 * 60 * 60
+    DEFAULT_MAX_SIZE = 1024 * 1024 * 1024
+
+    LOCK_TIMEOUT = 30.0
+    EVICTION_BATCH = 100
+    SWEEP_INTERVAL = 1000
+
+    def __init__(self, path, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE):
+        self.path = str(path)
+        self.ttl = ttl
+        self.max_size = max_size
+
+        self.logger = logging.getLogger(__name__)
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+
+        folder = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        conn = self._connection()
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                         "size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_created ON responses (created)")
+
+            conn.execute("CREATE TABLE IF NOT EXISTS cache_stats (id INTEGER PRIMARY KEY CHECK (id = 0), total_size INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO cache_stats (id, total_size) SELECT 0, COALESCE(SUM(size), 0) FROM responses")
+            conn.execute("CREATE TRIGGER IF NOT EXISTS responses_insert AFTER INSERT ON responses BEGIN "
+                         "UPDATE cache_stats SET total_size = total_size + NEW.size WHERE id = 0; END")
+            conn.execute("CREATE TRIGGER IF NOT EXISTS responses_delete AFTER DELETE ON responses BEGIN "
+                         "UPDATE cache_stats SET total_size = total_size - OLD.size WHERE id = 0; END")
+
+    def _connection(self):
+        """Get the sqlite connection for the current thread.
+
+        sqlite connections cannot be shared between threads so we keep one per
+        thread that touches the cache.
+        """
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.LOCK_TIMEOUT, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+
+            with self._connections_lock:
+                self._connections.append(conn)
+
+        return conn
+
+    def get(self, key):
+        """Look up a cached response.
+
+        Args:
+            key (str): The request_key of the response to find.
+
+        Returns:
+            object: The decoded response or None if there is no unexpired entry.
+        """
+
+        try:
+            conn = self._connection()
+            row = conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+
+            value, created = row
+            now = time.time()
+
+            if self.ttl is not None and now - created > self.ttl:
+                self._delete(conn, key)
+                return None
+
+            try:
+                response = json.loads(zlib.decompress(value).decode('utf-8'))
+            except (zlib.error, ValueError):
+                self.logger.warning("Removing corrupt entry %s from disk cache %s", key, self.path)
+                self._delete(conn, key)
+                return None
+
+            with conn:
+                conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        except sqlite3.Error:
+            self.logger.exception("Error reading from disk cache %s", self.path)
+            return None
+
+        return response
+
+    @classmethod
+    def _delete(cls, conn, key):
+        with conn:
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def put(self, key, response):
+        """Store a response in the cache.
+
+        Args:
+            key (str): The request_key of the response.
+            response (object): The decoded JSON response to store.
+        """
+
+        value = zlib.compress(json.dumps(response).encode('utf-8'), 1)
+        now = time.time()
+
+        with self._writes_lock:
+            self._writes += 1
+            sweep = self._writes % self.SWEEP_INTERVAL == 0
+
+        try:
+            conn = self._connection()
+            with conn:
+                # We delete and insert rather than INSERT OR REPLACE so that the
+                # delete trigger keeps the total size correct.
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                conn.execute("INSERT INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                             (key, sqlite3.Binary(value), len(value), now, now))
+
+            if sweep and self.ttl is not None:
+                with conn:
+                    conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+
+            if self.max_size is not None:
+                self._evict(conn)
+        except sqlite3.Error:
+            self.logger.exception("Error writing to disk cache %s", self.path)
+
+    def _evict(self, conn):
+        """Remove the least recently used entries until we fit in max_size."""
+
+        with conn:
+            total = self._total_size(conn)
+
+            while total > self.max_size:
+                rows = conn.execute("SELECT key, size FROM responses ORDER BY accessed LIMIT ?", (self.EVICTION_BATCH,)).fetchall()
+                if len(rows) == 0:
+                    break
+
+                for key, size in rows:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    total -= size
+
+                    if total <= self.max_size:
+                        break
+
+    @classmethod
+    def _total_size(cls, conn):
+        total, = conn.execute("SELECT total_size FROM cache_stats WHERE id = 0").fetchone()
+        return total
+
+    def size(self):
+        """Return the total size of all cached responses in bytes."""
+
+        return self._total_size(self._connection())
+
+    def clear(self):
+        """Remove all entries from the cache."""
+
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM responses")
+
+    def close(self):
+        """Close all open database connections."""
+
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+
+            self._connections = []
+
+        self._local = threading.local()
@@ -0,0 +1,296 @@
+"""A thread-safe in-memory cache of iotile.cloud responses with an optional byte budget.
+
+The cache is split into a number of shards, each with its own lock, so that
+the worker threads used by CloudSession do not serialize on a single lock
+when looking up cached responses.  If a byte budget is given, it applies to
+the cache as a whole.  Each shard keeps its entries in least recently used
+order and when the cache grows beyond its budget, the least recently used
+entry of all shards is evicted until it fits again.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import sys
+import threading
+from collections import OrderedDict
+from future.utils import viewitems
+
+
+def estimate_size(obj):
+    """Estimate the number of bytes of memory used by a decoded JSON object.
+
+    This walks dicts, lists and tuples and adds up sys.getsizeof for each
+    member.  It does not account for objects that are shared between
+    multiple containers, which is not a concern for decoded JSON.
+
+    Args:
+        obj (object): The object to measure.
+
+    Returns:
+        int: The approximate size of obj in bytes.
+    """
+
+    total = 0
+    pending = [obj]
+
+    while len(pending) > 0:
+        item = pending.pop()
+        total += sys.getsizeof(item)
+
+        if isinstance(item, dict):
+            for key, value in viewitems(item):
+                total += sys.getsizeof(key)
+                pending.append(value)
+        elif isinstance(item, (list, tuple)):
+            pending.extend(item)
+
+    return total
+
+
+class _CacheShard(object):
+    """One independently locked part of a MemoryCache.
+
+    Each entry is stored as (value, size, tick) where tick is the time of its
+    last use as counted by the MemoryCache.  Entries are kept in least
+    recently used order.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+
+    def oldest_tick(self):
+        """Return the tick of the least recently used entry or None if empty."""
+
+        with self.lock:
+            for _value, _size, tick in self.entries.values():
+                return tick
+
+        return None
+
+
+class MemoryCache(object):
+    """A sharded, optionally size limited, in-memory response cache.
+
+    If max_size is None, the cache is unlimited and no size accounting is
+    done.  Otherwise, max_size is a budget in bytes for the whole cache and
+    entries are evicted in least recently used order to stay within it.
+    Responses that are larger than the entire budget are never cached.
+
+    Args:
+        max_size (int): The maximum number of bytes of responses to keep in
+            memory or None for no limit.
+        shards (int): The number of independently locked shards to split the
+            cache into.
+        sizer (callable): Optional function that returns the size in bytes of
+            a cached value.  Defaults to estimate_size, which is suitable for
+            decoded JSON.
+    """
+
+    SHARD_COUNT = 16
+
+    def __init__(self, max_size=None, shards=SHARD_COUNT, sizer=estimate_size):
+        self._shards = [_CacheShard() for _i in range(0, shards)]
+        self._sizer = sizer
+
+        # Protects max_size, size and the tick counter.  It may be taken while
+        # holding a shard lock but never the other way around.
+        self._lock = threading.Lock()
+        self._max_size = None
+        self._size = 0
+        self._tick = 0
+
+        self.set_max_size(max_size)
+
+    @property
+    def max_size(self):
+        """The maximum number of bytes of responses to keep or None for no limit."""
+
+        with self._lock:
+            return self._max_size
+
+    def _shard(self, key):
+        return self._shards[hash(key) % len(self._shards)]
+
+    def _next_tick(self):
+        """Return the next use time.  This must be called with self._lock held."""
+
+        self._tick += 1
+        return self._tick
+
+    def set_max_size(self, max_size):
+        """Change the byte budget of this cache.
+
+        If the cache currently holds more than the new budget, the least
+        recently used entries are evicted immediately.  Switching from an
+        unlimited cache to a limited one requires measuring every cached
+        entry once.
+
+        Args:
+            max_size (int): The maximum number of bytes of responses to keep in
+                memory or None for no limit.
+        """
+
+        # Hold every shard lock so that no entry is added with a stale size
+        for shard in self._shards:
+            shard.lock.acquire()
+
+        try:
+            with self._lock:
+                was_unlimited = self._max_size is None
+                self._max_size = max_size
+
+                if max_size is None:
+                    self._size = 0
+                elif was_unlimited:
+                    self._size = 0
+                    for shard in self._shards:
+                        for key, (value, _size, tick) in list(viewitems(shard.entries)):
+                            size = self._sizer(value)
+                            shard.entries[key] = (value, size, tick)
+                            self._size += size
+        finally:
+            for shard in self._shards:
+                shard.lock.release()
+
+        self._evict()
+
+    def get(self, key):
+        """Look up a cached response.
+
+        Args:
+            key (str): The request_key of the response.
+
+        Returns:
+            object: The cached response or None if it is not cached.
+        """
+
+        shard = self._shard(key)
+
+        with shard.lock:
+            entry = shard.entries.get(key)
+            if entry is None:
+                shard.misses += 1
+                return None
+
+            shard.hits += 1
+
+            with self._lock:
+                limited = self._max_size is not None
+                if limited:
+                    tick = self._next_tick()
+
+            if limited:
+                # Reinsert to mark as most recently used (works on python 2 and 3)
+                del shard.entries[key]
+                shard.entries[key] = (entry[0], entry[1], tick)
+
+            return entry[0]
+
+    def put(self, key, response):
+        """Store a response in the cache.
+
+        Args:
+            key (str): The request_key of the response.
+            response (object): The decoded response to store.
+        """
+
+        shard = self._shard(key)
+
+        # Measure outside of any lock since it can be slow for large responses
+        max_size = self.max_size
+        size = 0
+        if max_size is not None:
+            size = self._sizer(response)
+
+        with shard.lock:
+            with self._lock:
+                if self._max_size is None:
+                    size = 0
+                elif max_size is None:
+                    size = self._sizer(response)
+
+                old_entry = shard.entries.pop(key, None)
+                if old_entry is not None:
+                    self._size -= old_entry[1]
+
+                if self._max_size is not None and size > self._max_size:
+                    return
+
+                shard.entries[key] = (response, size, self._next_tick())
+                self._size += size
+
+        self._evict()
+
+    def _evict(self):
+        """Remove the least recently used entries of all shards until we fit in max_size.
+
+        This must be called without holding any lock.
+        """
+
+        while True:
+            with self._lock:
+                if self._max_size is None or self._size <= self._max_size:
+                    return
+
+            oldest = None
+            for shard in self._shards:
+                tick = shard.oldest_tick()
+                if tick is not None and (oldest is None or tick < oldest[0]):
+                    oldest = (tick, shard)
+
+            if oldest is None:
+                return
+
+            shard = oldest[1]
+            with shard.lock:
+                if len(shard.entries) == 0:
+                    continue
+
+                _key, (_value, size, _tick) = shard.entries.popitem(last=False)
+                shard.evictions += 1
+                shard.evicted_bytes += size
+
+                with self._lock:
+                    self._size -= size
+
+    def clear(self):
+        """Remove all entries from the cache."""
+
+        for shard in self._shards:
+            with shard.lock:
+                with self._lock:
+                    self._size -= sum(size for _value, size, _tick in shard.entries.values())
+
+                shard.entries.clear()
+
+    def __len__(self):
+        return sum(len(shard.entries) for shard in self._shards)
+
+    def stats(self):
+        """Return statistics about cache usage.
+
+        Returns:
+            dict: A dict with the number of cached entries, their size in bytes
+                (0 if the cache is unlimited), the size budget, the number of
+                hits, misses and evictions and the number of bytes evicted.
+        """
+
+        with self._lock:
+            stats = {'entries': 0, 'size': self._size, 'max_size': self._max_size, 'hits': 0,
+                     'misses': 0, 'evictions': 0, 'evicted_bytes': 0}
+
+        for shard in self._shards:
+            with shard.lock:
+                stats['entries'] += len(shard.entries)
+                stats['hits'] += shard.hits
+                stats['misses'] += shard.misses
+                stats['evictions'] += shard.evictions
+                stats['evicted_bytes'] += shard.evicted_bytes
+
+        return stats
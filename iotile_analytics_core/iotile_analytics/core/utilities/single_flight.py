@@ -0,0 +1,100 @@
+"""Deduplicate identical calls that are made concurrently from different threads.
+
+CloudSession uses a SingleFlight per iotile.cloud domain so that when
+several worker threads ask for the same request at the same time, only one
+of them makes the request and the rest wait for and share its result.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import threading
+
+
+class _Call(object):
+    """A call that is currently in flight."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight(object):
+    """Share the result of a call among all callers that ask for it at once.
+
+    Calls are identified by a key.  If a call with the same key is already
+    running when do() is invoked, the caller blocks until that call finishes
+    and gets its result, or its exception, instead of running func again.
+    Once a call finishes it is forgotten, so later callers run func again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+        self._requests = 0
+        self._coalesced = 0
+
+    def do(self, key, func, *args, **kwargs):
+        """Run func(*args, **kwargs) unless a call with the same key is in flight.
+
+        Args:
+            key (str): The key identifying this call.
+            func (callable): The function to call.
+            *args: Positional arguments passed to func.
+            **kwargs: Keyword arguments passed to func.
+
+        Returns:
+            object: The return value of func from whichever caller ran it.
+
+        Raises:
+            Exception: Whatever func raised, in every caller that shared it.
+        """
+
+        with self._lock:
+            self._requests += 1
+
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except Exception as err:
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+            call.done.set()
+
+    def stats(self):
+        """Return statistics about coalesced calls.
+
+        Returns:
+            dict: The total number of calls, how many of them shared the result of
+                another call and how many distinct calls are currently in flight.
+        """
+
+        with self._lock:
+            return {
+                'requests': self._requests,
+                'coalesced': self._coalesced,
+                'in_flight': len(self._calls)
+            }
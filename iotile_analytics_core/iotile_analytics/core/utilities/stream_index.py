@@ -0,0 +1,85 @@
+"""Find the streams whose slug or name contains a partial identifier.
+
+AnalysisGroup.find_stream resolves partial identifiers by checking whether
+they are a substring of each stream's slug or name.  StreamIndex answers the
+same question without scanning every stream by indexing the trigrams of all
+slugs and names.  Only the streams that contain every trigram of a partial
+identifier can contain the identifier itself, so just those are checked.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import threading
+
+
+class StreamIndex(object):
+    """A substring index over the slugs and names of a list of streams.
+
+    Results are memoized per partial identifier since the same names tend
+    to be resolved over and over again.  The index is immutable so a new one
+    should be built whenever the list of streams changes.
+
+    Args:
+        entries (list((str, str))): The lowercase slug and lowercase name of each
+            stream.  Searches return slugs in the same order as entries.
+    """
+
+    GRAM_LENGTH = 3
+    """The length of the substrings that are indexed."""
+
+    def __init__(self, entries):
+        self._entries = list(entries)
+        self._grams = {}
+        self._memo = {}
+        self._lock = threading.Lock()
+
+        for i, (slug, name) in enumerate(self._entries):
+            for gram in self._split(slug) | self._split(name):
+                self._grams.setdefault(gram, set()).add(i)
+
+    @classmethod
+    def _split(cls, text):
+        length = cls.GRAM_LENGTH
+        return set(text[i:i + length] for i in range(0, len(text) - length + 1))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def search(self, partial):
+        """Find all streams whose slug or name contains partial.
+
+        Args:
+            partial (str): The lowercase partial identifier to search for.
+
+        Returns:
+            list(str): The lowercase slugs of all matching streams.
+        """
+
+        with self._lock:
+            found = self._memo.get(partial)
+
+        if found is None:
+            found = tuple(self._entries[i][0] for i in self._candidates(partial)
+                          if partial in self._entries[i][0] or partial in self._entries[i][1])
+
+            with self._lock:
+                self._memo[partial] = found
+
+        return list(found)
+
+    def _candidates(self, partial):
+        """Return the sorted rows of the streams that could contain partial."""
+
+        if len(partial) < self.GRAM_LENGTH:
+            return range(0, len(self._entries))
+
+        postings = []
+        for gram in self._split(partial):
+            posting = self._grams.get(gram)
+            if posting is None:
+                return []
+
+            postings.append(posting)
+
+        postings.sort(key=len)
+        return sorted(postings[0].intersection(*postings[1:]))
@@ -0,0 +1,442 @@
+"""Adaptive concurrency control and rate limiting for parallel HTTP requests.
+
+CloudSession uses an AdaptiveLimiter per iotile.cloud domain to decide how
+many requests may be in flight at once.  The limit follows an additive
+increase, multiplicative decrease scheme: it grows slowly while requests
+succeed with stable latency and shrinks quickly when latency rises, the
+server returns errors or it asks us to slow down with a 429 or 503 status.
+Any Retry-After header sent by the server pauses all new requests until it
+has elapsed.
+
+An optional TokenBucket can additionally cap the average number of requests
+per second.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import re
+import ssl
+import threading
+import time
+from collections import OrderedDict
+from email.utils import parsedate_tz, mktime_tz
+
+try:
+    #python2
+    from urllib2 import HTTPError, URLError
+    from urlparse import urlparse, parse_qs
+except ImportError:
+    #python3
+    from urllib.error import HTTPError, URLError
+    from urllib.parse import urlparse, parse_qs
+
+import urllib3
+from typedargs.exceptions import ArgumentError
+
+
+_now = getattr(time, 'monotonic', time.time)
+
+THROTTLE_STATUS_CODES = frozenset([429, 503])
+
+# These errors mean that a TLS connection was cut off rather than rejected
+_TRANSIENT_TLS_ERRORS = (ssl.SSLEOFError, ssl.SSLZeroReturnError)
+
+_ID_SEGMENT = re.compile(r'(--|^[0-9a-fA-F-]*[0-9][0-9a-fA-F-]*$)')
+
+
+def parse_retry_after(value):
+    """Parse the value of a Retry-After header.
+
+    Args:
+        value (str): Either a number of seconds or an HTTP date.
+
+    Returns:
+        float: The number of seconds to wait or None if the value could not be parsed.
+    """
+
+    if value is None:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    parsed = parsedate_tz(value)
+    if parsed is None:
+        return None
+
+    return max(0.0, mktime_tz(parsed) - time.time())
+
+
+def request_class(request):
+    """Group requests whose latency can be compared with each other.
+
+    A request for one small item and a request for a large page of data
+    points take very different amounts of time even when the server is
+    healthy, so AdaptiveLimiter keeps a separate latency baseline for each
+    class of request.  Requests are grouped by their URL path, with slugs and
+    ids replaced by a placeholder, and the page size they ask for.
+
+    Args:
+        request (RequestInfo): The request as returned by pack_url.
+
+    Returns:
+        str: A key that is the same for all requests of the same class.
+    """
+
+    path = urlparse(request.url).path
+    segments = ['*' if _ID_SEGMENT.search(segment) else segment for segment in path.split('/')]
+
+    page_size = parse_qs(request.query_string).get('page_size', [''])[0]
+    return '%s?page_size=%s' % ('/'.join(segments), page_size)
+
+
+def is_tls_failure(reason):
+    """Check if a connection failed because the TLS handshake was rejected.
+
+    Certificate verification failures, hostname mismatches and similar TLS
+    errors will fail in the same way no matter how often they are retried.
+    Connections that were cut off in the middle of a TLS session are not
+    considered failures of this kind.
+
+    Args:
+        reason (Exception): The reason of a URLError.
+
+    Returns:
+        bool: Whether retrying the request cannot succeed.
+    """
+
+    # urllib3 wraps the underlying ssl error, if there is one, as its first argument
+    if isinstance(reason, urllib3.exceptions.SSLError) and len(reason.args) > 0 and isinstance(reason.args[0], Exception):
+        reason = reason.args[0]
+
+    if isinstance(reason, _TRANSIENT_TLS_ERRORS):
+        return False
+
+    return isinstance(reason, (ssl.SSLError, ssl.CertificateError, urllib3.exceptions.SSLError))
+
+
+def classify_error(error):
+    """Classify a request error for the purposes of congestion control.
+
+    Args:
+        error (Exception): The error raised by a request or None if it succeeded.
+
+    Returns:
+        (str, float): The kind of outcome, one of 'success', 'throttled', 'error' or
+            'client_error', and the number of seconds the server asked us to wait
+            before retrying, or None.
+    """
+
+    if error is None:
+        return 'success', None
+
+    if isinstance(error, HTTPError):
+        retry_after = None
+        if error.headers is not None:
+            retry_after = parse_retry_after(error.headers.get('Retry-After'))
+
+        if error.code in THROTTLE_STATUS_CODES:
+            return 'throttled', retry_after
+
+        if error.code >= 500:
+            return 'error', retry_after
+
+        return 'client_error', None
+
+    if isinstance(error, URLError) and is_tls_failure(error.reason):
+        return 'client_error', None
+
+    if isinstance(error, (URLError, IOError)):
+        return 'error', None
+
+    return 'client_error', None
+
+
+class TokenBucket(object):
+    """A thread-safe token bucket rate limiter.
+
+    Tokens are added at a constant rate up to a maximum of burst tokens.
+    Each call to acquire() consumes one token and blocks until one is
+    available.
+
+    Args:
+        rate (float): The average number of tokens per second.
+        burst (int): The maximum number of tokens that can accumulate.  Defaults
+            to one second worth of tokens (at least 1).
+    """
+
+    def __init__(self, rate, burst=None):
+        if rate <= 0:
+            raise ArgumentError("Rate limit must be a positive number of requests per second", rate=rate)
+
+        if burst is None:
+            burst = max(1, int(rate))
+
+        if burst < 1:
+            raise ArgumentError("Rate limit burst must be at least 1", burst=burst)
+
+        self.rate = float(rate)
+        self.burst = burst
+
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._last = _now()
+
+    def acquire(self):
+        """Consume one token, blocking until it is available."""
+
+        while True:
+            with self._lock:
+                now = _now()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+
+                wait = (1.0 - self._tokens) / self.rate
+
+            time.sleep(wait)
+
+
+class AdaptiveLimiter(object):
+    """Limit the number of requests in flight based on observed performance.
+
+    Call acquire() before making a request and release() with the time it
+    took and any error once it finishes.
+
+    Rising latency is detected by comparing the smoothed latency of each
+    class of request, see request_class(), with the lowest latency seen for
+    that class, so that mixing small and large requests is not mistaken for
+    congestion.
+
+    A limiter can have a parent limiter, whose rate limit and pauses after
+    Retry-After headers it obeys and to which it reports throttling and
+    errors, while keeping its own limit on the number of requests in flight.
+    This lets transports with very different concurrency share the
+    congestion state of a domain.
+
+    Args:
+        initial (int): The starting concurrency limit.
+        minimum (int): The smallest limit we will shrink to.
+        maximum (int): The largest limit we will grow to.  This should not be
+            larger than the number of threads that make requests.
+        parent (AdaptiveLimiter): Optional limiter whose rate limit and backoff
+            state should be shared.
+    """
+
+    LATENCY_FACTOR = 2.0
+    LATENCY_SMOOTHING = 0.2
+    BASELINE_DRIFT = 1.01
+    DECREASE_FACTOR = 0.5
+    LATENCY_DECREASE_FACTOR = 0.9
+    MAX_REQUEST_CLASSES = 256
+
+    def __init__(self, initial=10, minimum=1, maximum=32, parent=None):
+        if not 1 <= minimum <= initial <= maximum:
+            raise ArgumentError("Concurrency limits must satisfy 1 <= minimum <= initial <= maximum",
+                                minimum=minimum, initial=initial, maximum=maximum)
+
+        self.minimum = minimum
+        self.maximum = maximum
+
+        self._parent = parent
+        self._cond = threading.Condition()
+        self._limit = float(initial)
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._latency = None
+        self._baselines = OrderedDict()
+        self._bucket = None
+
+        self._requests = 0
+        self._throttled = 0
+        self._errors = 0
+
+    @property
+    def limit(self):
+        """The current maximum number of requests in flight."""
+
+        return max(self.minimum, int(self._limit))
+
+    def set_rate_limit(self, rate, burst=None):
+        """Cap the average request rate with a token bucket.
+
+        Args:
+            rate (float): The maximum average number of requests per second or None
+                to remove any rate limit.
+            burst (int): The maximum number of requests that can be made at once after
+                an idle period.
+        """
+
+        bucket = None
+        if rate is not None:
+            bucket = TokenBucket(rate, burst)
+
+        with self._cond:
+            self._bucket = bucket
+
+    def _rate_bucket(self):
+        """Get the token bucket that applies to our requests, if any."""
+
+        if self._parent is not None:
+            return self._parent._rate_bucket()  #pylint:disable=protected-access
+
+        with self._cond:
+            return self._bucket
+
+    def _pause_remaining(self, now):
+        """Get how many seconds new requests must still wait after a Retry-After."""
+
+        with self._cond:
+            wait = self._paused_until - now
+
+        if self._parent is not None:
+            wait = max(wait, self._parent._pause_remaining(now))  #pylint:disable=protected-access
+
+        return wait
+
+    def back_off(self, retry_after=None):
+        """Shrink the limit and pause new requests after congestion seen by another limiter.
+
+        Args:
+            retry_after (float): The number of seconds the server asked us to wait
+                or None.
+        """
+
+        with self._cond:
+            now = _now()
+            self._decrease(self.DECREASE_FACTOR, now)
+
+            if retry_after is not None:
+                self._paused_until = max(self._paused_until, now + retry_after)
+
+            self._cond.notify_all()
+
+    def acquire(self):
+        """Wait until we are allowed to start another request."""
+
+        with self._cond:
+            while True:
+                wait = self._pause_remaining(_now())
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+
+                if self._in_flight < self.limit:
+                    break
+
+                self._cond.wait()
+
+            self._in_flight += 1
+
+        bucket = self._rate_bucket()
+        if bucket is not None:
+            bucket.acquire()
+
+    def release(self, latency, error=None, request_class=None):
+        """Record the outcome of a request and free its slot.
+
+        Args:
+            latency (float): How long the request took in seconds.
+            error (Exception): The error raised by the request or None if it succeeded.
+            request_class (str): The class of the request whose latency baseline should
+                be used, see request_class().  Requests without a class share a
+                single baseline.
+        """
+
+        outcome, retry_after = classify_error(error)
+
+        with self._cond:
+            self._in_flight -= 1
+            self._requests += 1
+            now = _now()
+
+            if outcome == 'success':
+                self._record_success(latency, request_class, now)
+            elif outcome in ('throttled', 'error'):
+                if outcome == 'throttled':
+                    self._throttled += 1
+                else:
+                    self._errors += 1
+
+                self._decrease(self.DECREASE_FACTOR, now)
+
+            if retry_after is not None:
+                self._paused_until = max(self._paused_until, now + retry_after)
+
+            self._cond.notify_all()
+
+        if self._parent is not None and outcome in ('throttled', 'error'):
+            self._parent.back_off(retry_after)
+
+    def _record_success(self, latency, request_class, now):
+        if self._latency is None:
+            self._latency = latency
+        else:
+            self._latency += self.LATENCY_SMOOTHING * (latency - self._latency)
+
+        baseline = self._baselines.pop(request_class, None)
+        if baseline is None:
+            baseline = [latency, latency]
+        else:
+            baseline[0] += self.LATENCY_SMOOTHING * (latency - baseline[0])
+
+            # The baseline latency drifts slowly upward so that it follows changes
+            # in the size of the requests being made.
+            baseline[1] = min(latency, baseline[1] * self.BASELINE_DRIFT)
+
+        # Keep the most recently used classes last so we forget the oldest ones first
+        self._baselines[request_class] = baseline
+        if len(self._baselines) > self.MAX_REQUEST_CLASSES:
+            self._baselines.popitem(last=False)
+
+        smoothed, min_latency = baseline
+        if smoothed > self.LATENCY_FACTOR * min_latency:
+            self._decrease(self.LATENCY_DECREASE_FACTOR, now)
+        else:
+            # Additive increase of about one request per full window of requests
+            self._limit = min(self.maximum, self._limit + 1.0 / self._limit)
+
+    def _decrease(self, factor, now):
+        # Only back off once per round trip so that a burst of failures from
+        # requests that were already in flight does not collapse the limit.
+        window = self._latency if self._latency is not None else 0.0
+        if now - self._last_decrease < window:
+            return
+
+        self._limit = max(float(self.minimum), self._limit * factor)
+        self._last_decrease = now
+
+    def stats(self):
+        """Return statistics about this limiter.
+
+        Returns:
+            dict: The current limit, requests in flight, smoothed latency, the lowest
+                baseline latency of any request class, the number of request classes
+                tracked, the total number of requests and how many were throttled or
+                failed.
+        """
+
+        bucket = self._rate_bucket()
+
+        with self._cond:
+            min_latency = None
+            if len(self._baselines) > 0:
+                min_latency = min(baseline[1] for baseline in self._baselines.values())
+
+            return {
+                'limit': self.limit,
+                'in_flight': self._in_flight,
+                'latency': self._latency,
+                'min_latency': min_latency,
+                'request_classes': len(self._baselines),
+                'requests': self._requests,
+                'throttled': self._throttled,
+                'errors': self._errors,
+                'rate_limit': bucket.rate if bucket is not None else None
+            }
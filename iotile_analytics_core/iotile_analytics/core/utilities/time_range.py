@@ -0,0 +1,108 @@
+"""Helpers for restricting fetched data to a time range.
+
+AnalysisGroup fetch methods accept optional start and end arguments that
+select the half open range [start, end).  Either may be omitted to leave
+that side of the range unbounded.  Times can be anything that
+pd.Timestamp understands and are interpreted as UTC if they have no
+timezone.
+"""
+
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+
+import numpy as np
+import pandas as pd
+from typedargs.exceptions import ArgumentError
+
+
+def parse_time_range(start=None, end=None):
+    """Normalize optional start and end times into UTC timestamps.
+
+    Args:
+        start (str, datetime or pd.Timestamp): The first time to include or None.
+        end (str, datetime or pd.Timestamp): The first time after start to exclude
+            or None.
+
+    Returns:
+        (pd.Timestamp, pd.Timestamp): The timezone aware UTC start and end times, each
+            of which may be None.
+    """
+
+    start = _to_utc(start)
+    end = _to_utc(end)
+
+    if start is not None and end is not None and start > end:
+        raise ArgumentError("The start of a time range must not be after its end", start=start, end=end)
+
+    return start, end
+
+
+def format_cloud_time(timestamp):
+    """Format a UTC timestamp as iotile.cloud expects in a query string.
+
+    Args:
+        timestamp (pd.Timestamp): A timezone aware UTC timestamp.
+
+    Returns:
+        str: The timestamp in ISO 8601 format with microseconds and a trailing Z.
+    """
+
+    return timestamp.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def to_timecol(timestamp):
+    """Convert a UTC timestamp into nanoseconds since the epoch.
+
+    Args:
+        timestamp (pd.Timestamp): A timezone aware UTC timestamp.
+
+    Returns:
+        int: The number of nanoseconds since 1970-01-01T00:00:00Z.
+    """
+
+    return int(timestamp.tz_convert(None).to_datetime64().astype('datetime64[ns]').astype(np.int64))
+
+
+def select_time_range(frame, start=None, end=None):
+    """Select the rows of a DataFrame whose index lies in [start, end).
+
+    Args:
+        frame (pd.DataFrame): A frame indexed by time.  A timezone naive index
+            is assumed to be in UTC.
+        start (pd.Timestamp): The first time to include or None.
+        end (pd.Timestamp): The first time to exclude or None.
+
+    Returns:
+        pd.DataFrame: The selected rows, which is frame itself if no rows were
+            removed.
+    """
+
+    if (start is None and end is None) or len(frame) == 0:
+        return frame
+
+    index = frame.index
+    if getattr(index, 'tz', None) is None:
+        start = start.tz_convert(None) if start is not None else None
+        end = end.tz_convert(None) if end is not None else None
+
+    mask = np.ones(len(index), dtype=bool)
+    if start is not None:
+        mask &= index >= start
+    if end is not None:
+        mask &= index < end
+
+    if mask.all():
+        return frame
+
+    return frame[mask]
+
+
+def _to_utc(value):
+    if value is None:
+        return None
+
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is None:
+        return timestamp.tz_localize('UTC')
+
+    return timestamp.tz_convert('UTC')
@@ -1,27 +1,159 @@
-"""Thread-safe and parallelizable URL fetch and post routines based on urllib."""
+"""Thread-safe and parallelizable URL fetch and post routines based on urllib3.
+
+All requests are made through a shared urllib3.PoolManager so that
+connections to each host are kept alive and reused between requests and
+between the worker threads of CloudSession instead of paying for a new TCP
+and TLS handshake on every call.  The size of the per-host connection pools
+and the timeouts used can be adjusted with configure_transport().
+"""
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import io
 import json
-import ssl
 import sys
+import threading
 from collections import namedtuple
 
 try:
     #python2
-    from urllib2 import urlopen, Request
+    from urllib2 import HTTPError, URLError
     from urllib import urlencode
 except ImportError:
     #python3
-    from urllib.request import urlopen, Request
+    from urllib.error import HTTPError, URLError
     from urllib.parse import urlencode
 
+import urllib3
 from future.utils import iteritems
 from typedargs.exceptions import ArgumentError
 
 
 RequestInfo = namedtuple("RequestInfo", ['url', 'query_string', 'request_key', 'headers', 'verify'])
 
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_READ_TIMEOUT = 120.0
+MAX_REDIRECTS = 10
+
+_transport_lock = threading.Lock()
+_transport_settings = {
+    'pool_size': DEFAULT_POOL_SIZE,
+    'connect_timeout': DEFAULT_CONNECT_TIMEOUT,
+    'read_timeout': DEFAULT_READ_TIMEOUT
+}
+_pool_managers = {}
+
+
+def configure_transport(pool_size=None, connect_timeout=None, read_timeout=None):
+    """Configure the shared connection pools used by get_url and post_url.
+
+    Any parameter that is not passed keeps its current value.  Existing
+    connection pools are closed and recreated with the new settings the next
+    time a request is made.
+
+    Args:
+        pool_size (int): The maximum number of connections to keep alive per host.
+            This should be at least the number of threads making requests in
+            parallel.  Defaults to 10.
+        connect_timeout (float): The number of seconds to wait for a connection
+            to be established before failing.  Defaults to 10 seconds.
+        read_timeout (float): The number of seconds to wait for data from the
+            server before failing.  Defaults to 120 seconds.
+    """
+
+    if pool_size is not None and pool_size < 1:
+        raise ArgumentError("The connection pool size must be at least 1", pool_size=pool_size)
+
+    with _transport_lock:
+        if pool_size is not None:
+            _transport_settings['pool_size'] = pool_size
+        if connect_timeout is not None:
+            _transport_settings['connect_timeout'] = connect_timeout
+        if read_timeout is not None:
+            _transport_settings['read_timeout'] = read_timeout
+
+        old_managers = list(_pool_managers.values())
+        _pool_managers.clear()
+
+    for manager in old_managers:
+        manager.clear()
+
+
+def get_transport_settings():
+    """Get the current connection pool size and timeouts.
+
+    Returns:
+        dict: The pool_size, connect_timeout and read_timeout settings.
+    """
+
+    with _transport_lock:
+        return dict(_transport_settings)
+
+
+def _get_pool_manager(verify):
+    """Get the shared PoolManager for requests with the given verification setting."""
+
+    verify = verify is not False
+
+    with _transport_lock:
+        manager = _pool_managers.get(verify)
+        if manager is None:
+            timeout = urllib3.Timeout(connect=_transport_settings['connect_timeout'], read=_transport_settings['read_timeout'])
+            cert_reqs = 'CERT_REQUIRED' if verify else 'CERT_NONE'
+
+            # Follow redirects like urllib did but never retry, since CloudSession
+            # has its own retry policy.
+            retries = urllib3.Retry(total=None, connect=0, read=0, status=0, redirect=MAX_REDIRECTS)
+
+            manager = urllib3.PoolManager(maxsize=_transport_settings['pool_size'], timeout=timeout,
+                                          cert_reqs=cert_reqs, retries=retries)
+            _pool_managers[verify] = manager
+
+        return manager
+
+
+def native_headers(headers):
+    """Convert a dict of bytes headers into native strings on python 3."""
+
+    if sys.version_info.major < 3:
+        return headers
+
+    return {_native_str(key): _native_str(val) for key, val in iteritems(headers)}
+
+
+def _native_str(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+
+    return value
+
+
+def _perform_request(method, url, headers, verify, body=None):
+    """Make a request using a pooled connection and return the response body.
+
+    Errors are translated into the same exceptions that urllib raises so that
+    callers see a HTTPError for non-success status codes and a URLError for
+    all other problems including timeouts and certificate errors.
+    """
+
+    manager = _get_pool_manager(verify)
+
+    try:
+        resp = manager.request(method, url, body=body, headers=headers)
+    except urllib3.exceptions.MaxRetryError as err:
+        # Report the underlying error, such as a failed connection, rather than
+        # the fact that we did not retry it.
+        raise URLError(err.reason if err.reason is not None else err)
+    except urllib3.exceptions.HTTPError as err:
+        raise URLError(err)
+
+    # Redirects are followed so any 3xx response left is one we cannot use
+    if resp.status >= 300:
+        raise HTTPError(url, resp.status, resp.reason, resp.headers, io.BytesIO(resp.data))
+
+    return resp.data
+
 #pylint:disable=too-many-arguments;These are all necessary, have sane defaults and will not all need to be specified together.
 def pack_url(url, query_args=None, token=None, token_type="jwt", headers=None, verify=True, json=False):
     """Create a RequestInfo object for passing to {get, post}_url.
@@ -76,7 +208,7 @@ def get_url(request_info, progress=None):
 
     It works correctly on python 2.7 and python 3 and has proper support for
     TLS with an option to disable verification of the TLS certificate for
-    testing purposes.
+    testing purposes.  Connections are reused from a shared pool per host.
 
     Args:
         request_info (RequestInfo): The result of a previous call to pack_url
@@ -91,18 +223,8 @@ def get_url(request_info, progress=None):
     if not isinstance(request_info, RequestInfo):
         raise ArgumentError("You must call get_url with a RequestInfo object from a call to pack_url", request_info=request_info)
 
-    req = Request(request_info.request_key, headers=request_info.headers)
-
-    if request_info.verify is False:
-        context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
-        context.options |= ssl.OP_NO_SSLv2
-        context.options |= ssl.OP_NO_SSLv3
-
-        resp = urlopen(req, context=context)
-    else:
-        resp = urlopen(req)
-
-    data = resp.read()
+    headers = native_headers(request_info.headers)
+    data = _perform_request('GET', request_info.request_key, headers, request_info.verify)
     result = json.loads(data.decode('utf-8'))
 
     if progress is not None:
@@ -118,7 +240,7 @@ def post_url(request_info, data, progress=None):
 
     It works correctly on python 2.7 and python 3 and has proper support for
     TLS with an option to disable verification of the TLS certificate for
-    testing purposes.
+    testing purposes.  Connections are reused from a shared pool per host.
 
     Args:
         request_info (RequestInfo): The result of a previous call to pack_url
@@ -145,22 +267,9 @@ def post_url(request_info, data, progress=None):
     # See: https://github.com/iotile/iotile_analytics/issues/47
     if sys.version_info.major < 3:
         url = url.encode('utf-8')
-        headers = request_info.headers
-    else:
-        headers = {key.decode('utf-8'): val.decode('utf-8') for key, val in iteritems(request_info.headers)}
-
-    req = Request(url, data, headers=headers)
-
-    if request_info.verify is False:
-        context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
-        context.options |= ssl.OP_NO_SSLv2
-        context.options |= ssl.OP_NO_SSLv3
-
-        resp = urlopen(req, context=context)
-    else:
-        resp = urlopen(req)
 
-    resp_data = resp.read().decode('utf-8')
+    headers = native_headers(request_info.headers)
+    resp_data = _perform_request('POST', url, headers, request_info.verify, body=data).decode('utf-8')
 
     if progress is not None:
         progress.update(1)
@@ -19,6 +19,9 @@ setup(
         "iotile_cloud>=0.9.2",
         "tqdm>=4.19.4"
     ],
+    extras_require={
+        "async": ["aiohttp>=3.3"]
+    },
     description="A data science bridge for iotile.cloud",
     author="Arch",
     author_email="info@arch-iot.com",
@@ -5,9 +5,17 @@ from __future__ import (absolute_import, division,
 from builtins import *
 
 import os.path
+import re
+import sys
+import json
 import pytest
 from iotile_analytics.core import CloudSession, AnalysisGroup
 
+# The asyncio transport tests use async def, which is a syntax error before python 3.5
+collect_ignore = []
+if sys.version_info < (3, 5):
+    collect_ignore.append('test_async_transport.py')
+
 
 @pytest.fixture(scope="module")
 def water_meter(mock_cloud):
@@ -44,3 +52,50 @@ def with_system(water_meter):
 
     group = AnalysisGroup.FromDevice('d--0000-0000-0000-00d2', domain=domain, include_system=True)
     return group
+
+@pytest.fixture(scope="module")
+def large_project(mock_cloud, tmpdir_factory):
+    """Create a cloud with a project of 5 devices and 1043 streams.
+
+    The first 4 devices have 260 streams each, every 7th of which has data.
+    The last device has 3 streams, 2 of which have events.
+    """
+
+    domain, cloud = mock_cloud
+    base = os.path.dirname(__file__)
+    folder = tmpdir_factory.mktemp('large_project')
+
+    cloud.add_data(os.path.join(base, 'data', 'basic_cloud.json'))
+
+    project = 'p--0000-1234'
+    devices = ['d--0000-0000-0000-%04x' % (0x1000 + i) for i in range(0, 5)]
+    streams = []
+
+    for device in devices:
+        cloud.devices[device] = {"id": int(device[-4:], 16), "slug": device, "project": project, "label": device}
+        stream_count = 3 if device == devices[-1] else 260
+
+        for var in range(0x5000, 0x5000 + stream_count):
+            slug = 's--0000-1234--%s--%04x' % (device[3:], var)
+            stream = {"id": slug, "slug": slug, "project": project, "project_id": None, "device": device, "block": None,
+                      "variable": 'v--0000-1234--%04x' % var, "var_type": None, "var_name": "Variable %04x" % var, "data_label": ""}
+
+            cloud.streams[slug] = stream
+            streams.append(slug)
+
+            if len(streams) % 7 == 0:
+                data = [{"timestamp": "2017-04-11T22:07:25.972121Z", "int_value": i} for i in range(0, len(streams) % 5 + 1)]
+                folder.join(slug + '.json').write(json.dumps(data))
+
+    for i, slug in enumerate([streams[-1], streams[-1], streams[-2]]):
+        cloud.events[90000 + i] = {"id": 90000 + i, "stream": slug, "device": devices[-1], "project": project,
+                                   "timestamp": "2017-04-11T22:07:25Z", "extra_data": {}, "has_raw_data": False}
+
+    # The mock cloud only looks up projects by uuid
+    cloud.projects[project] = {"id": project, "slug": project, "name": "Large Project", "org": "arch-internal"}
+    cloud.apis.insert(0, (re.compile(r"/api/v1/project/(p--[0-9\-a-f]+)/"), lambda request, slug: cloud.one_object('projects', request, slug)))
+
+    cloud.stream_folder = str(folder)
+
+    CloudSession('test@arch-iot.com', 'test', domain=domain, verify=False)
+    return domain, cloud, project, streams
@@ -4,11 +4,16 @@ from __future__ import (absolute_import, division,
                         print_function, unicode_literals)
 from builtins import *
 
+import re
+import gzip
+import json
 import pytest
+import numpy as np
 import pandas as pd
 from typedargs.exceptions import ArgumentError
 from iotile_analytics.core import CloudSession, AnalysisGroup
 from iotile_analytics.core.stream_series import StreamSeries
+from iotile_analytics.core.channels.cloud_api import IOTileCloudChannel
 from iotile_analytics.core.exceptions import AuthenticationError, CertificateVerificationError, CloudError
 
 
@@ -90,6 +95,252 @@ def test_stream_download(filter_group):
         data.convert('Test Unit')
 
 
+def test_time_range(filter_group, water_meter):
+    """Make sure time ranges are sent to the cloud and applied to the results."""
+
+    _domain, cloud = water_meter
+    full = filter_group.fetch_stream('5001')
+    start = full.index[3]
+    end = full.index[7]
+
+    queries = []
+
+    def _record_query(request):
+        queries.append(dict(request.args))
+        return cloud.get_stream_df(request)
+
+    cloud.apis.insert(0, (re.compile(r"/api/v1/df/"), _record_query))
+    try:
+        ranged = filter_group.fetch_stream('5001', start=start, end=end.to_pydatetime())
+    finally:
+        cloud.apis.pop(0)
+
+    assert queries[0]['start'] == start.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    assert queries[0]['end'] == end.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    assert ranged.equals(full.iloc[3:7])
+
+    # Times without a timezone are in UTC
+    assert len(filter_group.fetch_stream('5001', start=start.strftime("%Y-%m-%d %H:%M:%S.%f"))) == len(full) - 3
+
+    events = filter_group.fetch_events('5001')
+    assert len(filter_group.fetch_events('5001', end=events.index[0])) == 0
+    assert filter_group.fetch_events('5001', start=events.index[-1]).equals(events.iloc[-1:])
+
+    raw_events = filter_group.fetch_raw_events('5001', start=events.index[0], end=events.index[-1])
+    assert len(raw_events) == 1
+    assert raw_events.index[0] == events.index[0]
+
+    with pytest.raises(ArgumentError):
+        filter_group.fetch_stream('5001', start=end, end=start)
+
+
+def test_events_with_raw(filter_group, water_meter):
+    """Make sure events and raw events can be fetched with one metadata pass."""
+
+    _domain, cloud = water_meter
+    filter_group._channel._session.enable_cache = False
+
+    events = filter_group.fetch_events('5001')
+    raw_events = filter_group.fetch_raw_events('5001')
+
+    event_pages = []
+
+    def _record_events(request):
+        event_pages.append(dict(request.args))
+        return cloud.list_events(request)
+
+    cloud.apis.insert(0, (re.compile(r"/api/v1/event/$"), _record_events))
+    try:
+        both_events, both_raw = filter_group.fetch_events_with_raw('5001')
+    finally:
+        cloud.apis.pop(0)
+
+    assert len(event_pages) == 1
+    assert both_events.equals(events)
+    assert both_raw.equals(raw_events)
+
+    _events, subkeys = filter_group.fetch_events_with_raw('5001', subkey='test')
+    assert list(subkeys[0].values[:1]) == [1]
+
+    ranged_events, ranged_raw = filter_group.fetch_events_with_raw('5001', start=events.index[0], end=events.index[-1])
+    assert len(ranged_events) == 1
+    assert len(ranged_raw) == 1
+
+
+def test_frame_cache(filter_group, water_meter):
+    """Make sure parsed streams and events are cached within a memory budget."""
+
+    _domain, cloud = water_meter
+    filter_group._channel._session.enable_cache = False
+    assert filter_group.frame_cache_stats() is None
+
+    filter_group.enable_frame_cache(10*1024*1024)
+
+    data = filter_group.fetch_stream('5001')
+    events = filter_group.fetch_events('5001')
+
+    requests = cloud.request_count
+    cached = filter_group.fetch_stream('5001')
+    assert cloud.request_count == requests
+    assert cached.equals(data)
+    assert cached is not data
+    assert cached.available_units == data.available_units
+
+    cached[cached.columns[0]] = 0
+    assert filter_group.fetch_stream('5001').equals(data)
+    assert filter_group.fetch_events('5001').equals(events)
+
+    # A different time range is a different result
+    ranged = filter_group.fetch_stream('5001', start=data.index[1])
+    assert len(ranged) == len(data) - 1
+
+    stats = filter_group.frame_cache_stats()
+    assert stats['hits'] == 3
+    assert stats['misses'] == 3
+    assert stats['entries'] == 3
+    assert stats['size'] > 0
+
+    filter_group.enable_frame_cache(stats['size'] // 2)
+    assert filter_group.frame_cache_stats()['evictions'] > 0
+
+    with pytest.raises(ArgumentError):
+        filter_group.enable_frame_cache(None)
+
+    filter_group.disable_frame_cache()
+    assert filter_group.frame_cache_stats() is None
+
+    filter_group.fetch_stream('5001')
+    assert cloud.request_count > requests
+
+
+def test_iter_stream(filter_group):
+    """Make sure streams can be iterated over in chunks with their metadata."""
+
+    data = filter_group.fetch_stream('5001')
+
+    chunks = list(filter_group.iter_stream('5001', chunk_rows=2, overlap=1))
+    assert len(chunks) == (len(data) + 1) // 2
+    assert chunks[1].index[0] == chunks[0].index[-1]
+    assert all(x.available_units == data.available_units for x in chunks)
+    assert pd.concat([chunks[0]] + [x.iloc[1:] for x in chunks[1:]]).equals(data)
+
+    with pytest.raises(ArgumentError):
+        list(filter_group.iter_stream('5001', chunk_rows=0))
+
+
+def test_lazy_bootstrap(water_meter):
+    """Make sure streams are only counted and vartypes fetched when needed."""
+
+    domain, _cloud = water_meter
+    CloudSession('test@arch-iot.com', 'test', domain=domain, verify=False)
+
+    counted = []
+    vartype_fetches = []
+
+    class _RecordingChannel(IOTileCloudChannel):
+        def count_streams(self, slugs):
+            counted.append(list(slugs))
+            return super(_RecordingChannel, self).count_streams(slugs)
+
+        def fetch_variable_types(self, slugs):
+            vartype_fetches.append(slugs)
+            return super(_RecordingChannel, self).fetch_variable_types(slugs)
+
+    group = AnalysisGroup(_RecordingChannel('d--0000-0000-0000-00d2', domain))
+    assert counted == []
+    assert vartype_fetches == []
+
+    slug = group.find_stream('5001')
+    assert counted == [[slug]]
+
+    group.fetch_stream('5001')
+    assert counted == [[slug]]
+    assert len(vartype_fetches) == 1
+
+    counts = group.stream_counts
+    assert len(counted) == 2
+    assert slug not in counted[1]
+    assert sorted(counts) == sorted(group.streams)
+
+    group.print_streams()
+    assert len(counted) == 2
+    assert len(vartype_fetches) == 1
+
+
+def test_metadata_snapshot(filter_group, water_meter, tmpdir):
+    """Make sure we can reopen a group from a snapshot without fetching metadata."""
+
+    _domain, cloud = water_meter
+    path = str(tmpdir.join('snapshot.json.gz'))
+
+    filter_group.snapshot_metadata(path)
+
+    requests = cloud.request_count
+    group = AnalysisGroup.FromSnapshot(path)
+    assert cloud.request_count == requests
+
+    assert group.streams == filter_group.streams
+    assert group.stream_counts == filter_group.stream_counts
+    assert group.variable_types == filter_group.variable_types
+    assert group.source_info == filter_group.source_info
+    assert group.properties == filter_group.properties
+    assert cloud.request_count == requests
+
+    assert group.fetch_stream('5001').equals(filter_group.fetch_stream('5001'))
+
+    # Make the snapshot stale and check that revalidation fixes it
+    with gzip.open(path, 'rb') as infile:
+        snapshot = json.loads(infile.read().decode('utf-8'))
+
+    snapshot['stream_counts'] = {slug: {'points': 0, 'events': 0} for slug in snapshot['stream_counts']}
+    with gzip.open(path, 'wb') as outfile:
+        outfile.write(json.dumps(snapshot).encode('utf-8'))
+
+    group = AnalysisGroup.FromSnapshot(path, revalidate=True)
+    assert group.wait_revalidation(10.0)
+    assert group.stream_counts == filter_group.stream_counts
+    assert group.find_stream('5001') == filter_group.find_stream('5001')
+
+    snapshot['version'] = 1000
+    with gzip.open(path, 'wb') as outfile:
+        outfile.write(json.dumps(snapshot).encode('utf-8'))
+
+    with pytest.raises(ArgumentError):
+        AnalysisGroup.FromSnapshot(path)
+
+
+def test_csv_parsing():
+    """Make sure we parse df API responses into the same series as before."""
+
+    raw = b"row,int_value,stream_slug\n" \
+          b"2017-04-11T22:07:25.972121Z,100,s--0000-0077--0000-0000-0000-00d2--5001\n" \
+          b"2017-04-11T22:17:25.972121Z,99.5,s--0000-0077--0000-0000-0000-00d2--5001\n"
+
+    data = IOTileCloudChannel.parse_datapoint_csv(raw)
+    assert isinstance(data, StreamSeries)
+    assert list(data.iloc[:, 0]) == [100.0, 99.5]
+    assert data.index.equals(pd.to_datetime(['2017-04-11T22:07:25.972121Z', '2017-04-11T22:17:25.972121Z'], utc=True))
+
+    index = IOTileCloudChannel.parse_timestamps(['2017-04-11T22:07:25Z', '2017-04-11T22:07:26.5Z'])
+    assert list(index) == [pd.Timestamp('2017-04-11T22:07:25', tz='UTC'), pd.Timestamp('2017-04-11T22:07:26.5', tz='UTC')]
+
+    # Timestamps with explicit offsets fall back to pandas
+    index = IOTileCloudChannel.parse_timestamps(['2017-04-11T22:07:25+01:00'])
+    assert list(index) == [pd.Timestamp('2017-04-11T21:07:25', tz='UTC')]
+
+    # Streams without values in the df API return None so we use the data API
+    assert IOTileCloudChannel.parse_datapoint_csv(b"row,int_value,stream_slug\n2017-04-11T22:07:25.972121Z,,s--1\n") is None
+    assert len(IOTileCloudChannel.parse_datapoint_csv(b"row,int_value,stream_slug\n")) == 0
+
+    # An empty body, without even a header, is an empty stream
+    data = IOTileCloudChannel.parse_datapoint_csv(b"")
+    assert isinstance(data, StreamSeries)
+    assert len(data) == 0
+    assert data.iloc[:, 0].dtype == np.float64
+    assert isinstance(data.index, pd.DatetimeIndex)
+    assert str(data.index.tz) == 'UTC'
+
+
 def test_empty_stream(filter_group):
     """Make sure we can download an empty data stream."""
 
@@ -0,0 +1,170 @@
+"""Tests for the asyncio based CloudSession transport."""
+
+import time
+import asyncio
+import threading
+import pytest
+from iotile_analytics.core import CloudSession
+
+pytest.importorskip('aiohttp')
+
+
+SLUG = 's--0000-0077--0000-0000-0000-00d2--5001'
+
+
+@pytest.fixture(scope='function')
+def session(water_meter):
+    """A logged in session with caching disabled so every call hits the cloud."""
+
+    domain, cloud = water_meter
+    session = CloudSession('test@arch-iot.com', 'test', domain=domain, verify=False)
+    session.enable_cache = False
+
+    yield session, cloud
+
+    session.enable_cache = True
+
+
+def test_async_fetches(session):
+    """Make sure we can await fetches from a running event loop."""
+
+    session, _cloud = session
+    api = session.get_api()
+    expected = session.fetch_all(api.data, page_size=3, filter=SLUG)
+
+    async def _fetch():
+        async with session.async_transport(max_concurrency=4) as transport:
+            variables = await transport.fetch_multiple([api.vartype('water-meter-volume'), api.vartype('water-meter-flow')])
+            data = await transport.fetch_all(api.data, page_size=3, filter=SLUG)
+            return variables, data
+
+    loop = asyncio.new_event_loop()
+    try:
+        variables, data = loop.run_until_complete(_fetch())
+    finally:
+        loop.close()
+
+    assert [x['slug'] for x in variables] == ['water-meter-volume', 'water-meter-flow']
+    assert data == expected
+
+
+def test_sync_wrapper(session):
+    """Make sure the synchronous API works on top of the asyncio transport."""
+
+    session, _cloud = session
+    api = session.get_api()
+    expected = session.fetch_all(api.data, page_size=3, filter=SLUG)
+
+    session.set_transport('asyncio')
+    try:
+        assert session.fetch_all(api.data, page_size=3, filter=SLUG) == expected
+
+        results, failed = session.fetch_multiple([api.vartype('water-meter-volume'), api.vartype('missing')], allow_partial=True)
+        assert results[0]['slug'] == 'water-meter-volume'
+        assert [x.key for x in failed] == [1]
+
+        url = session.domain + "/api/v1/auth/login/"
+        posted = session.post_multiple([url], [{'email': 'test@arch-iot.com', 'password': 'test'}], include_auth=False)
+        assert len(posted) == 1
+
+        # Make sure the sync wrapper also works when called from inside a running loop
+        async def _inside_loop():
+            return session.fetch_all(api.data, page_size=3, filter=SLUG)
+
+        loop = asyncio.new_event_loop()
+        try:
+            assert loop.run_until_complete(_inside_loop()) == expected
+        finally:
+            loop.close()
+    finally:
+        session.set_transport('threads')
+
+
+def test_async_coalescing(session):
+    """Make sure identical concurrent requests are only sent once."""
+
+    session, cloud = session
+    api = session.get_api()
+
+    transport = session.async_transport()
+    before = cloud.request_count
+
+    try:
+        results = transport.run(transport.fetch_multiple, [api.vartype('water-meter-flow') for _i in range(0, 10)])
+    finally:
+        transport.shutdown()
+
+    assert len(results) == 10
+    assert cloud.request_count - before == 1
+    assert transport.stats()['coalesced'] == 9
+
+
+def test_sync_calls_from_threads(session):
+    """Make sure many threads can share the asyncio transport at once."""
+
+    session, _cloud = session
+    api = session.get_api()
+    expected = session.fetch_all(api.data, page_size=3, filter=SLUG)
+
+    session.set_transport('asyncio')
+    transport = session._async_transport
+
+    results = []
+    errors = []
+
+    def _worker():
+        try:
+            for _i in range(0, 3):
+                results.append(session.fetch_all(api.data, page_size=1, filter=SLUG))
+        except Exception as err:  # pylint:disable=W0703; we check for errors below
+            errors.append(err)
+
+    try:
+        threads = [threading.Thread(target=_worker) for _i in range(0, 8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+        assert len(results) == 24
+        assert all(result == expected for result in results)
+
+        # All calls ran on the same background loop and reused its client
+        assert len(transport._clients) == 1
+        assert transport.stats()['in_flight'] == 0
+    finally:
+        session.set_transport('threads')
+
+    assert transport._runner is None
+    assert len(transport._clients) == 0
+
+
+def test_async_shares_limiter(session):
+    """Make sure the asyncio transport has its own limit but respects the session's rate limit."""
+
+    session, _cloud = session
+    api = session.get_api()
+    resources = [api.vartype('water-meter-volume') for _i in range(0, 6)]
+
+    before = session.throttle_stats()['requests']
+    session.set_rate_limit(50, burst=1)
+    session.set_transport('asyncio', max_concurrency=100)
+    transport = session._async_transport
+
+    try:
+        start = time.time()
+        session.fetch_multiple(resources, per_call_kw=[{'attempt': i} for i in range(0, 6)])
+        assert time.time() - start >= 0.09
+
+        stats = transport.stats()['throttle']
+        assert stats['requests'] == 6
+        assert stats['in_flight'] == 0
+        assert stats['rate_limit'] == 50
+
+        # The transport is not capped by the thread pool's concurrency limit
+        assert stats['limit'] == 100 > session.throttle_stats()['limit']
+        assert session.throttle_stats()['requests'] == before
+    finally:
+        session.set_transport('threads')
+        session.set_rate_limit(None)
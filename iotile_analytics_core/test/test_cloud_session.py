@@ -1,9 +1,19 @@
 """Tests to make sure low level CloudSession functions work as expected."""
 
 import os
+import re
 import json
 import pytest
+from pytest_localserver.http import WSGIServer
+from iotile_cloud.utils.mock_cloud import ErrorCode
 from iotile_analytics.core import CloudSession
+from iotile_analytics.core.exceptions import CloudError
+from iotile_analytics.core.utilities import url_routines
+
+try:
+    from urllib2 import HTTPError, URLError
+except ImportError:
+    from urllib.error import HTTPError, URLError
 
 
 @pytest.fixture(scope='function')
@@ -67,3 +77,169 @@ def test_post_behavior(cloud_session, httpserver):
 
     req1 = httpserver.requests[0]
 
+
+
+def test_connection_pooling(cloud_session):
+    """Make sure parallel fetches share one pooled transport."""
+
+    session, domain = cloud_session
+    session.enable_cache = False
+
+    api = session.get_api()
+    resources = [api.vartype('water-meter-volume') for _i in range(0, 20)]
+
+    manager = url_routines._get_pool_manager(False)
+    results = session.fetch_multiple(resources)
+    assert len(results) == 20
+    assert all(x == results[0] for x in results)
+
+    assert url_routines._get_pool_manager(False) is manager
+    pool = manager.connection_from_url(domain)
+    assert pool.num_connections > 0
+
+    CloudSession.configure_transport(pool_size=4, read_timeout=30.0)
+    assert url_routines._get_pool_manager(False) is not manager
+    assert len(session.fetch_multiple(resources)) == 20
+
+    CloudSession.configure_transport(pool_size=CloudSession.MAX_CONCURRENCY, read_timeout=url_routines.DEFAULT_READ_TIMEOUT)
+    session.enable_cache = True
+
+
+def test_http_errors(cloud_session):
+    """Make sure failed requests raise urllib compatible errors."""
+
+    session, domain = cloud_session
+
+    request = url_routines.pack_url(domain + "/api/v1/vartype/missing-vartype/", token=session.token, verify=False)
+    with pytest.raises(HTTPError) as excinfo:
+        url_routines.get_url(request)
+
+    assert excinfo.value.code == 404
+
+
+def test_redirects():
+    """Make sure redirects are followed and a redirect loop is an error."""
+
+    def _redirecting_app(environ, start_response):
+        path = environ['PATH_INFO']
+        if path == '/old/':
+            start_response('301 Moved Permanently', [('Location', '/new/')])
+            return [b'<html>Moved</html>']
+        if path == '/loop/':
+            start_response('302 Found', [('Location', '/loop/')])
+            return [b'']
+
+        start_response('200 OK', [('Content-Type', 'application/json')])
+        return [json.dumps({'path': path}).encode('utf-8')]
+
+    server = WSGIServer(application=_redirecting_app)
+    server.start()
+
+    try:
+        assert url_routines.get_url(url_routines.pack_url(server.url + '/old/')) == {'path': '/new/'}
+
+        with pytest.raises(URLError):
+            url_routines.get_url(url_routines.pack_url(server.url + '/loop/'))
+    finally:
+        server.stop()
+
+
+def test_iter_pages(cloud_session):
+    """Make sure we can stream pages in order and as they complete."""
+
+    session, _domain = cloud_session
+    api = session.get_api()
+    slug = 's--0000-0077--0000-0000-0000-00d2--5001'
+
+    expected = session.fetch_all(api.data, page_size=3, filter=slug)
+    assert len(expected) == 11
+
+    pages = list(session.iter_pages(api.data, page_size=3, max_in_flight=1, filter=slug))
+    assert [len(x) for x in pages] == [3, 3, 3, 2]
+    assert [x for page in pages for x in page] == expected
+
+    unordered = list(session.iter_all(api.data, page_size=3, ordered=False, max_in_flight=2, filter=slug))
+    assert sorted(x['id'] for x in unordered) == sorted(x['id'] for x in expected)
+
+    single = list(session.iter_pages(api.data, page_size=100, filter=slug))
+    assert len(single) == 1
+    assert single[0] == expected
+
+
+def test_retry_transient_errors(cloud_session, mock_cloud, monkeypatch):
+    """Make sure transient server errors are retried with backoff."""
+
+    session, _domain = cloud_session
+    _domain, cloud = mock_cloud
+    api = session.get_api()
+
+    monkeypatch.setattr(CloudSession, 'RETRY_BACKOFF', 0.01)
+    session.enable_cache = False
+
+    failures = []
+
+    def _flaky(request, slug):
+        if len(failures) < 2:
+            failures.append(request.path)
+            raise ErrorCode(502)
+
+        return cloud.get_vartype(request, slug)
+
+    cloud.apis.insert(0, (re.compile(r"/api/v1/vartype/([0-9\-a-zA-Z]+)/"), _flaky))
+    try:
+        results = session.fetch_multiple([api.vartype('water-meter-volume')])
+        assert len(failures) == 2
+        assert results[0]['slug'] == 'water-meter-volume'
+
+        # Client errors are not retried
+        failures[:] = []
+        with pytest.raises(HTTPError):
+            session.fetch_multiple([api.vartype('missing-vartype')])
+
+        assert len(failures) == 2
+    finally:
+        cloud.apis.pop(0)
+        session.enable_cache = True
+
+
+def test_partial_failures(cloud_session, mock_cloud, monkeypatch):
+    """Make sure we can recover the pages and resources that succeeded."""
+
+    session, _domain = cloud_session
+    _domain, cloud = mock_cloud
+    api = session.get_api()
+    slug = 's--0000-0077--0000-0000-0000-00d2--5001'
+
+    monkeypatch.setattr(CloudSession, 'RETRY_BACKOFF', 0.01)
+    session.enable_cache = False
+
+    expected = session.fetch_all(api.data, page_size=3, filter=slug)
+
+    def _broken_page(request):
+        if request.args.get('page') == '2':
+            raise ErrorCode(500)
+
+        return cloud.get_stream_data(request)
+
+    cloud.apis.insert(0, (re.compile(r"/api/v1/data/"), _broken_page))
+    try:
+        with pytest.raises(CloudError):
+            session.fetch_all(api.data, page_size=3, filter=slug)
+
+        results, failed = session.fetch_all(api.data, page_size=3, allow_partial=True, filter=slug)
+        assert len(results) == 8
+        assert [x.key for x in failed] == [2]
+        assert isinstance(failed[0].error, HTTPError)
+    finally:
+        cloud.apis.pop(0)
+
+    retried = session.fetch_pages(api.data, [x.key for x in failed], page_size=3, filter=slug)
+    assert retried == [expected[3:6]]
+
+    resources = [api.vartype('water-meter-volume'), api.vartype('missing-vartype')]
+    results, failed = session.fetch_multiple(resources, allow_partial=True)
+    assert results[0]['slug'] == 'water-meter-volume'
+    assert results[1] is None
+    assert [x.key for x in failed] == [1]
+
+    session.enable_cache = True
@@ -0,0 +1,168 @@
+"""Tests for the persistent on-disk response cache."""
+
+import os
+import time
+import sqlite3
+import pytest
+from iotile_analytics.core import CloudSession
+from iotile_analytics.core.utilities.disk_cache import DiskCache
+
+
+@pytest.fixture(scope='function')
+def disk_cache(tmpdir):
+    """A disk cache in a temporary directory."""
+
+    cache = DiskCache(str(tmpdir.join('cache.sqlite')))
+    yield cache
+    cache.close()
+
+
+def test_get_put(disk_cache):
+    """Make sure we can store and retrieve responses."""
+
+    assert disk_cache.get('http://a') is None
+
+    disk_cache.put('http://a', {'count': 1, 'results': [{'value': 1.5}]})
+    assert disk_cache.get('http://a') == {'count': 1, 'results': [{'value': 1.5}]}
+
+    disk_cache.put('http://a', {'count': 0})
+    assert disk_cache.get('http://a') == {'count': 0}
+
+    disk_cache.clear()
+    assert disk_cache.get('http://a') is None
+    assert disk_cache.size() == 0
+
+
+def test_ttl(disk_cache):
+    """Make sure old entries expire."""
+
+    disk_cache.ttl = 0.05
+    disk_cache.put('http://a', {'count': 1})
+    assert disk_cache.get('http://a') == {'count': 1}
+
+    time.sleep(0.1)
+    assert disk_cache.get('http://a') is None
+
+
+def test_size_limit(tmpdir):
+    """Make sure the least recently used entries are evicted to fit max_size."""
+
+    cache = DiskCache(str(tmpdir.join('cache.sqlite')), max_size=None)
+    cache.put('http://probe', {'data': 'x'*100})
+    entry_size = cache.size()
+    cache.clear()
+
+    cache.max_size = entry_size * 3
+    cache.put('http://a', {'data': 'a'*100})
+    cache.put('http://b', {'data': 'b'*100})
+    cache.put('http://c', {'data': 'c'*100})
+
+    # Touch a so that b is the least recently used entry
+    assert cache.get('http://a') is not None
+    cache.put('http://d', {'data': 'd'*100})
+
+    assert cache.size() <= cache.max_size
+    assert cache.get('http://b') is None
+    assert cache.get('http://a') is not None
+    assert cache.get('http://d') is not None
+    cache.close()
+
+
+def test_shared_file(tmpdir):
+    """Make sure two cache objects can share the same file."""
+
+    path = str(tmpdir.join('cache.sqlite'))
+    cache1 = DiskCache(path)
+    cache2 = DiskCache(path)
+
+    cache1.put('http://a', {'count': 5})
+    assert cache2.get('http://a') == {'count': 5}
+
+    cache1.close()
+    cache2.close()
+
+
+def test_session_disk_cache(water_meter, tmpdir):
+    """Make sure CloudSession reuses responses from the disk cache."""
+
+    domain, cloud = water_meter
+    path = str(tmpdir.join('cache.sqlite'))
+
+    session = CloudSession('test@arch-iot.com', 'test', domain=domain, verify=False)
+    session.set_disk_cache(path)
+
+    api = session.get_api()
+    resources = [api.vartype('water-meter-volume')]
+    first = session.fetch_multiple(resources)
+    assert os.path.isfile(path)
+
+    # Drop the in-memory cache to simulate a new process
+    CloudSession._login_cache[domain]['requests'].clear()
+
+    count = cloud.request_count
+    second = session.fetch_multiple(resources)
+    assert cloud.request_count == count
+    assert second == first
+
+    session.set_disk_cache(None)
+
+
+def test_corrupt_entry(disk_cache):
+    """Make sure a corrupt entry is treated as a cache miss and removed."""
+
+    disk_cache.put('http://a', {'count': 1})
+    conn = disk_cache._connection()
+    with conn:
+        conn.execute("UPDATE responses SET value = ? WHERE key = ?", (b'garbage', 'http://a'))
+
+    assert disk_cache.get('http://a') is None
+    assert conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] == 0
+    assert disk_cache.size() == 0
+
+
+def test_running_size(tmpdir):
+    """Make sure the total size is tracked across writers and for caches from older versions."""
+
+    path = str(tmpdir.join('cache.sqlite'))
+
+    # Create a cache the way older versions did, without the size table
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("CREATE TABLE responses (key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                     "size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)")
+        conn.execute("INSERT INTO responses VALUES (?, ?, ?, ?, ?)", ('http://old', b'x'*10, 10, time.time(), time.time()))
+    conn.close()
+
+    cache1 = DiskCache(path)
+    cache2 = DiskCache(path)
+    assert cache1.size() == 10
+
+    cache1.put('http://a', {'data': 'a'*100})
+    cache2.put('http://a', {'data': 'a'*200})
+    cache2.put('http://b', {'data': 'b'*100})
+
+    conn = cache1._connection()
+    total, = conn.execute("SELECT SUM(size) FROM responses").fetchone()
+    assert cache1.size() == cache2.size() == total
+
+    cache2.clear()
+    assert cache1.size() == 0
+
+    cache1.close()
+    cache2.close()
+
+
+def test_ttl_sweep(disk_cache):
+    """Make sure expired entries that are never read again are removed periodically."""
+
+    disk_cache.ttl = 0.05
+    disk_cache.SWEEP_INTERVAL = 5
+
+    disk_cache.put('http://old', {'count': 1})
+    time.sleep(0.1)
+
+    for i in range(0, 4):
+        disk_cache.put('http://new%d' % i, {'count': i})
+
+    keys = [row[0] for row in disk_cache._connection().execute("SELECT key FROM responses")]
+    assert sorted(keys) == ['http://new%d' % i for i in range(0, 4)]
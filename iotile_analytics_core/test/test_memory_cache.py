@@ -0,0 +1,157 @@
+"""Tests for the sharded in-memory response cache and the LRU caching policy."""
+
+import threading
+import pytest
+from typedargs.exceptions import ArgumentError
+from iotile_analytics.core import CloudSession, AnalysisGroup
+from iotile_analytics.core.channels import ChannelCaching
+from iotile_analytics.core.utilities.memory_cache import MemoryCache, estimate_size
+
+
+def test_unlimited_cache():
+    """Make sure an unlimited cache keeps everything."""
+
+    cache = MemoryCache()
+
+    for i in range(0, 100):
+        cache.put('key_%d' % i, {'value': i})
+
+    assert len(cache) == 100
+    assert cache.get('key_5') == {'value': 5}
+    assert cache.get('missing') is None
+
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['evictions'] == 0
+    assert stats['size'] == 0
+
+
+def test_lru_eviction():
+    """Make sure a limited cache evicts least recently used entries."""
+
+    entry = {'data': 'x'*100}
+    entry_size = estimate_size(entry)
+
+    cache = MemoryCache(max_size=entry_size*3, shards=1)
+    cache.put('a', dict(entry))
+    cache.put('b', dict(entry))
+    cache.put('c', dict(entry))
+
+    assert cache.get('a') is not None
+    cache.put('d', dict(entry))
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.get('d') is not None
+
+    stats = cache.stats()
+    assert stats['evictions'] == 1
+    assert stats['evicted_bytes'] == entry_size
+    assert stats['size'] <= stats['max_size']
+
+    # Entries larger than the budget are never cached
+    cache.put('big', {'data': 'x'*10000})
+    assert cache.get('big') is None
+
+
+def test_global_budget():
+    """Make sure the budget applies to the whole cache rather than to each shard."""
+
+    entry = {'data': 'x'*1000}
+    entry_size = estimate_size(entry)
+
+    # A single entry may use most of the budget even though there are many shards
+    cache = MemoryCache(max_size=entry_size + 10, shards=16)
+    cache.put('big', dict(entry))
+    assert cache.get('big') == entry
+
+    cache.put('other', dict(entry))
+    assert cache.get('other') == entry
+    assert cache.get('big') is None
+
+    # Eviction picks the least recently used entry across all shards
+    small = {'value': 1}
+    cache = MemoryCache(max_size=estimate_size(small)*5, shards=4)
+    for i in range(0, 5):
+        cache.put('key_%d' % i, dict(small))
+
+    assert cache.get('key_0') is not None
+    cache.put('key_5', dict(small))
+
+    assert len(cache) == 5
+    assert cache.get('key_1') is None
+    assert cache.get('key_0') is not None
+
+
+def test_concurrent_resize():
+    """Make sure size accounting stays correct while the budget changes under concurrent puts."""
+
+    entry = {'data': 'x'*100}
+    entry_size = estimate_size(entry)
+    cache = MemoryCache()
+
+    def _writer(offset):
+        for i in range(0, 500):
+            cache.put('key_%d' % ((offset + i) % 300), dict(entry))
+            cache.get('key_%d' % i)
+
+    threads = [threading.Thread(target=_writer, args=(i*100,)) for i in range(0, 4)]
+    for thread in threads:
+        thread.start()
+
+    for i in range(0, 50):
+        cache.set_max_size(entry_size*(50 + i) if i % 2 == 0 else None)
+
+    cache.set_max_size(entry_size*100)
+
+    for thread in threads:
+        thread.join()
+
+    stats = cache.stats()
+    assert stats['size'] == entry_size*stats['entries']
+    assert stats['size'] <= stats['max_size']
+
+
+def test_resize():
+    """Make sure we can add a limit to an existing cache."""
+
+    cache = MemoryCache(shards=1)
+
+    for i in range(0, 10):
+        cache.put('key_%d' % i, {'data': 'x'*100})
+
+    entry_size = estimate_size({'data': 'x'*100})
+    cache.set_max_size(entry_size*2)
+
+    assert len(cache) == 2
+    assert cache.get('key_9') is not None
+    assert cache.stats()['evictions'] == 8
+
+    cache.set_max_size(None)
+    assert cache.stats()['size'] == 0
+
+
+def test_lru_policy(water_meter):
+    """Make sure we can configure an LRU cache on a channel."""
+
+    domain, _cloud = water_meter
+    CloudSession('test@arch-iot.com', 'test', domain=domain, verify=False)
+
+    group = AnalysisGroup.FromDevice('d--0000-0000-0000-00d2', domain=domain)
+
+    with pytest.raises(ArgumentError):
+        group.set_caching(ChannelCaching.LRU)
+
+    group.set_caching(ChannelCaching.LRU, 1024*1024)
+    group.fetch_raw_events('5001')
+    group.fetch_raw_events('5001')
+
+    session = CloudSession(domain=domain)
+    stats = session.cache_stats()
+    assert stats['max_size'] == 1024*1024
+    assert stats['hits'] > 0
+    assert 0 < stats['size'] <= 1024*1024
+
+    group.set_caching(ChannelCaching.UNLIMITED)
+    assert session.cache_stats()['max_size'] is None
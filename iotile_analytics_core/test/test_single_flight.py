@@ -0,0 +1,92 @@
+"""Tests for coalescing identical requests that are in flight at the same time."""
+
+import re
+import time
+import threading
+from iotile_analytics.core import CloudSession
+from iotile_analytics.core.utilities.single_flight import SingleFlight
+
+
+def test_single_flight():
+    """Make sure concurrent calls with the same key share one result."""
+
+    flight = SingleFlight()
+    calls = []
+    results = []
+
+    def _slow(value):
+        calls.append(value)
+        time.sleep(0.1)
+        return value
+
+    def _worker():
+        results.append(flight.do('key', _slow, 5))
+
+    threads = [threading.Thread(target=_worker) for _i in range(0, 5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [5]
+    assert results == [5]*5
+
+    stats = flight.stats()
+    assert stats['requests'] == 5
+    assert stats['coalesced'] == 4
+    assert stats['in_flight'] == 0
+
+    # Once a call finishes, the next one runs again
+    assert flight.do('key', _slow, 6) == 6
+    assert calls == [5, 6]
+
+
+def test_single_flight_errors():
+    """Make sure errors are shared with every waiting caller."""
+
+    flight = SingleFlight()
+    errors = []
+
+    def _fail():
+        time.sleep(0.1)
+        raise ValueError("failed")
+
+    def _worker():
+        try:
+            flight.do('key', _fail)
+        except ValueError as err:
+            errors.append(err)
+
+    threads = [threading.Thread(target=_worker) for _i in range(0, 3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(errors) == 3
+    assert flight.stats()['in_flight'] == 0
+
+
+def test_session_coalescing(water_meter):
+    """Make sure identical parallel requests only hit the cloud once."""
+
+    domain, cloud = water_meter
+    session = CloudSession('test@arch-iot.com', 'test', domain=domain, verify=False)
+    api = session.get_api()
+
+    def _slow_vartype(request, slug):
+        time.sleep(0.2)
+        return cloud.get_vartype(request, slug)
+
+    cloud.apis.insert(0, (re.compile(r"/api/v1/vartype/([0-9\-a-zA-Z]+)/"), _slow_vartype))
+    try:
+        before = cloud.request_count
+        coalesced = session.coalesce_stats()['coalesced']
+
+        results = session.fetch_multiple([api.vartype('water-meter-flow') for _i in range(0, 4)])
+
+        assert cloud.request_count - before == 1
+        assert all(x['slug'] == 'water-meter-flow' for x in results)
+        assert session.coalesce_stats()['coalesced'] - coalesced == 3
+    finally:
+        cloud.apis.pop(0)
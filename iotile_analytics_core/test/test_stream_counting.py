@@ -0,0 +1,174 @@
+"""Tests for listing and counting projects with many streams."""
+
+import re
+import pytest
+from typedargs.exceptions import ArgumentError
+from iotile_analytics.core import AnalysisGroup
+from iotile_analytics.core.channels import IOTileCloudChannel
+
+
+def test_stream_listing(large_project):
+    """Make sure all pages of a project's streams are listed."""
+
+    domain, cloud, project, streams = large_project
+
+    pages = []
+
+    def _record_page(request):
+        pages.append(dict(request.args))
+        return cloud.list_streams(request)
+
+    cloud.apis.insert(0, (re.compile(r"/api/v1/stream/$"), _record_page))
+    try:
+        channel = IOTileCloudChannel(project, domain, stream_page_size=100)
+        listed = channel.list_streams()
+    finally:
+        cloud.apis.pop(0)
+
+    assert sorted(x['slug'] for x in listed) == sorted(streams)
+    assert sorted(int(x['page']) for x in pages) == list(range(1, 12))
+    assert all(x['page_size'] == '100' for x in pages)
+
+    group = AnalysisGroup(IOTileCloudChannel(project, domain))
+    assert len(group.streams) == len(streams)
+
+    with pytest.raises(ArgumentError):
+        IOTileCloudChannel(project, domain, stream_page_size=0)
+
+
+def test_bulk_counts(large_project):
+    """Make sure project streams are counted with device level requests."""
+
+    domain, cloud, project, streams = large_project
+    channel = IOTileCloudChannel(project, domain)
+    channel._session.enable_cache = False
+
+    seen = {'extra': 0, 'events': 0, 'points': 0}
+
+    def _counting(kind, handler):
+        def _handler(request, *args):
+            seen[kind] += 1
+            return handler(request, *args)
+
+        return _handler
+
+    recorders = [(re.compile(r"/api/v1/device/(d--[0-9\-a-f]+)/extra/"), _counting('extra', cloud.device_extra)),
+                 (re.compile(r"/api/v1/event/$"), _counting('events', cloud.list_events)),
+                 (re.compile(r"/api/v1/stream/(s--[0-9\-a-f]+)/data/"), _counting('points', cloud.get_stream_data))]
+
+    cloud.apis[0:0] = recorders
+    requests = cloud.request_count
+    try:
+        counts = channel.count_streams(streams)
+    finally:
+        del cloud.apis[0:len(recorders)]
+        channel._session.enable_cache = True
+
+    bulk_requests = cloud.request_count - requests
+
+    # 5 device stream counts and event totals, per stream event counts for the
+    # one device that has events and per stream point counts for all streams
+    # since they all have stream ids.
+    assert seen == {'extra': 5, 'events': 5 + 3, 'points': len(streams)}
+    assert bulk_requests == 5 + 5 + 3 + len(streams)
+
+    sample = streams[::50] + streams[-3:]
+    individual = channel._count_individual_streams({slug: {} for slug in sample})
+    assert {slug: counts[slug] for slug in sample} == individual
+
+    assert counts[streams[-1]] == {'points': 4, 'events': 2}
+    assert counts[streams[-2]] == {'points': 0, 'events': 1}
+    assert counts[streams[6]] == {'points': 3, 'events': 0}
+    assert sum(1 for x in counts.values() if x['points'] > 0) == len(streams) // 7
+
+
+def test_untrusted_device_counts(large_project):
+    """Make sure stale device stream counts are only used for streams without a stream id."""
+
+    domain, cloud, project, streams = large_project
+    channel = IOTileCloudChannel(project, domain)
+    channel._session.enable_cache = False
+
+    device = 'd--0000-0000-0000-1004'
+    table = {
+        streams[-1]: {'data_cnt': 0, 'has_streamid': True},
+        streams[-2]: {'data_cnt': 42, 'has_streamid': False}
+    }
+
+    def _stale_extra(request, slug):
+        if slug == device:
+            return {'slug': device, 'stream_counts': table}
+
+        return cloud.device_extra(request, slug)
+
+    cloud.apis.insert(0, (re.compile(r"/api/v1/device/(d--[0-9\-a-f]+)/extra/"), _stale_extra))
+    try:
+        counts = channel.count_streams(streams[-3:])
+    finally:
+        cloud.apis.pop(0)
+        channel._session.enable_cache = True
+
+    # streams[-3] is missing from the table and streams[-1] has a stale count
+    assert counts[streams[-1]] == {'points': 4, 'events': 2}
+    assert counts[streams[-2]] == {'points': 42, 'events': 1}
+    assert counts[streams[-3]] == {'points': 0, 'events': 0}
+
+
+def test_single_stream_count(large_project):
+    """Make sure that a single stream is counted directly."""
+
+    domain, cloud, project, streams = large_project
+    channel = IOTileCloudChannel(project, domain)
+    channel._session.enable_cache = False
+
+    requests = cloud.request_count
+    assert channel.count_streams([streams[13]]) == {streams[13]: {'points': 5, 'events': 0}}
+    assert cloud.request_count - requests == 2
+
+
+def test_from_project(large_project):
+    """Make sure a project group tags each stream with its device."""
+
+    domain, _cloud, project, streams = large_project
+
+    group = AnalysisGroup.FromProject(project, domain=domain)
+    assert sorted(group.streams) == sorted(streams)
+    assert group.source_info['slug'] == project
+
+    by_device = group.streams_by_device()
+    assert sorted(len(x) for x in by_device.values()) == [3, 260, 260, 260, 260]
+    assert group.get_stream_device(streams[-1]) == 'd--0000-0000-0000-1004'
+
+
+def test_from_devices(large_project):
+    """Make sure a group can be created from a list of devices with one listing per device."""
+
+    domain, cloud, _project, streams = large_project
+
+    devices = ['d--1003', 'd--0000-0000-0000-1004', 'd--1004']
+
+    pages = []
+
+    def _record_page(request):
+        pages.append(dict(request.args))
+        return cloud.list_streams(request)
+
+    cloud.apis.insert(0, (re.compile(r"/api/v1/stream/$"), _record_page))
+    try:
+        group = AnalysisGroup.FromDevices(devices, domain=domain)
+    finally:
+        cloud.apis.pop(0)
+
+    assert sorted(x['device'] for x in pages) == ['d--0000-0000-0000-1003', 'd--0000-0000-0000-1004']
+    assert sorted(group.streams) == sorted(streams[-263:])
+    assert group.source_info == {'devices': 'd--0000-0000-0000-1003, d--0000-0000-0000-1004'}
+    assert group.properties == {}
+
+    assert sorted(group.streams_by_device()) == ['d--0000-0000-0000-1003', 'd--0000-0000-0000-1004']
+    assert group.stream_counts[streams[-1]] == {'points': 4, 'events': 2}
+
+    channel = IOTileCloudChannel(['d--0000-0000-0000-1003'], domain, stream_page_size=100)
+    assert sorted(x['slug'] for x in channel.list_streams()) == sorted(streams[-263:-3])
+
+    with pytest.raises(ArgumentError):
+        IOTileCloudChannel(['d--0000-0000-0000-1003', 'p--0000-1234'], domain)
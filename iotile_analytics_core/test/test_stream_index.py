@@ -0,0 +1,42 @@
+"""Tests for finding streams by partial identifiers."""
+
+import pytest
+from typedargs.exceptions import ArgumentError
+from iotile_analytics.core.utilities.stream_index import StreamIndex
+
+
+def test_stream_index():
+    """Make sure the index finds the same streams as checking every stream."""
+
+    entries = [('s--0000-0001--0000-0000-0000-00d2--%04x' % var, ('flow rate %d' % var) if var % 2 else '')
+               for var in range(0x5000, 0x5100)]
+    entries.append(('s--0000-0001--0000-0000-0000-00d3--5001', 'io 1(from variable)'))
+
+    index = StreamIndex(entries)
+    assert len(index) == len(entries)
+
+    for partial in ['5001', '00d3', 'flow rate 2048', 'rate', 'io', '1', '', 's--0000-0001--0000-0000-0000-00d2--5010',
+                    'missing', '(from']:
+        expected = [slug for slug, name in entries if partial in slug or partial in name]
+        assert index.search(partial) == expected
+        assert index.search(partial) == expected
+
+
+def test_find_stream_index(filter_group):
+    """Make sure find_stream keeps its uniqueness and empty stream checks."""
+
+    slug = filter_group.find_stream('5001')
+    assert filter_group.find_stream(slug.upper()) == slug
+    assert filter_group.find_stream(0x5001) == slug
+
+    with pytest.raises(ArgumentError):
+        filter_group.find_stream('s--')
+
+    with pytest.raises(ArgumentError):
+        filter_group.find_stream('not a stream')
+
+    empty = [x for x in filter_group.streams if filter_group.stream_empty(x)][0]
+    with pytest.raises(ArgumentError):
+        filter_group.find_stream(empty)
+
+    assert filter_group.find_stream(empty, include_empty=True) == empty.lower()
@@ -0,0 +1,273 @@
+"""Tests for adaptive concurrency control and rate limiting."""
+
+import ssl
+import time
+import threading
+import pytest
+import urllib3
+from typedargs.exceptions import ArgumentError
+from iotile_analytics.core import CloudSession
+import iotile_analytics.core.session as session_module
+from iotile_analytics.core.utilities.throttle import AdaptiveLimiter, TokenBucket, parse_retry_after, classify_error, request_class
+from iotile_analytics.core.utilities.url_routines import pack_url
+
+try:
+    from urllib2 import HTTPError, URLError
+except ImportError:
+    from urllib.error import HTTPError, URLError
+
+
+def _http_error(code, headers=None):
+    return HTTPError('http://test', code, 'error', headers or {}, None)
+
+
+def test_token_bucket():
+    """Make sure the token bucket enforces its average rate."""
+
+    bucket = TokenBucket(50, burst=1)
+
+    start = time.time()
+    for _i in range(0, 6):
+        bucket.acquire()
+
+    assert time.time() - start >= 0.09
+
+    with pytest.raises(ArgumentError):
+        TokenBucket(0)
+
+
+def test_classify_errors():
+    """Make sure we classify request outcomes correctly."""
+
+    assert classify_error(None) == ('success', None)
+    assert classify_error(_http_error(429, {'Retry-After': '5'})) == ('throttled', 5.0)
+    assert classify_error(_http_error(503)) == ('throttled', None)
+    assert classify_error(_http_error(502)) == ('error', None)
+    assert classify_error(_http_error(404)) == ('client_error', None)
+    assert classify_error(URLError('timed out')) == ('error', None)
+
+    # TLS failures will not go away by retrying but dropped TLS connections might
+    verify_error = ssl.SSLCertVerificationError(1, '[SSL: CERTIFICATE_VERIFY_FAILED] certificate verify failed')
+    assert classify_error(URLError(urllib3.exceptions.SSLError(verify_error))) == ('client_error', None)
+    assert classify_error(URLError(verify_error)) == ('client_error', None)
+    assert classify_error(URLError(ssl.CertificateError("hostname mismatch"))) == ('client_error', None)
+    assert classify_error(URLError(urllib3.exceptions.SSLError(ssl.SSLEOFError(8, 'EOF')))) == ('error', None)
+
+    assert parse_retry_after('2.5') == 2.5
+    assert parse_retry_after('garbage') is None
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0.0
+
+
+def test_adaptive_growth_and_backoff():
+    """Make sure the limit grows on success and shrinks on throttling."""
+
+    limiter = AdaptiveLimiter(initial=4, minimum=1, maximum=8)
+
+    for _i in range(0, 100):
+        limiter.acquire()
+        limiter.release(0.01)
+
+    assert limiter.limit == 8
+
+    limiter.acquire()
+    limiter.release(0.01, _http_error(429))
+    assert limiter.limit == 4
+
+    # A second failure within the same round trip does not shrink us again
+    limiter.acquire()
+    limiter.release(0.01, _http_error(429))
+    assert limiter.limit == 4
+
+    # Client errors are not a sign of congestion
+    time.sleep(0.02)
+    limiter.acquire()
+    limiter.release(0.01, _http_error(404))
+    assert limiter.limit == 4
+
+    stats = limiter.stats()
+    assert stats['throttled'] == 2
+    assert stats['requests'] == 103
+    assert stats['in_flight'] == 0
+
+
+def test_tls_failure_not_retried(water_meter, monkeypatch):
+    """Make sure certificate errors fail immediately without shrinking the limit."""
+
+    domain, _cloud = water_meter
+    session = CloudSession('test@arch-iot.com', 'test', domain=domain, verify=False)
+
+    calls = []
+
+    def _fail(request):
+        calls.append(request)
+        raise URLError(urllib3.exceptions.SSLError(ssl.SSLCertVerificationError(1, 'certificate verify failed')))
+
+    monkeypatch.setattr(session_module, 'get_url', _fail)
+
+    before = session.throttle_stats()
+    request = pack_url(domain + '/api/v1/vartype/water-meter-volume/')
+
+    with pytest.raises(URLError):
+        session._get_with_retries(request)
+
+    after = session.throttle_stats()
+    assert len(calls) == 1
+    assert after['limit'] == before['limit']
+    assert after['errors'] == before['errors']
+
+
+def test_adaptive_limit_enforced():
+    """Make sure no more than limit requests are in flight at once."""
+
+    limiter = AdaptiveLimiter(initial=2, minimum=2, maximum=2)
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def _worker():
+        limiter.acquire()
+        with lock:
+            active.append(1)
+            peak.append(len(active))
+
+        time.sleep(0.02)
+
+        with lock:
+            active.pop()
+
+        limiter.release(0.02)
+
+    threads = [threading.Thread(target=_worker) for _i in range(0, 8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(peak) == 2
+
+
+def test_retry_after_pauses():
+    """Make sure a Retry-After header pauses new requests."""
+
+    limiter = AdaptiveLimiter(initial=2, minimum=1, maximum=4)
+    limiter.acquire()
+    limiter.release(0.01, _http_error(429, {'Retry-After': '0.2'}))
+
+    start = time.time()
+    limiter.acquire()
+    assert time.time() - start >= 0.15
+    limiter.release(0.01)
+
+
+def test_parent_limiter():
+    """Make sure a child limiter shares rate limits and backoff but not its concurrency limit."""
+
+    parent = AdaptiveLimiter(initial=4, minimum=1, maximum=4)
+    child = AdaptiveLimiter(initial=100, minimum=1, maximum=100, parent=parent)
+
+    for _i in range(0, 50):
+        child.acquire()
+
+    assert child.stats()['in_flight'] == 50
+    assert parent.stats()['in_flight'] == 0
+
+    for _i in range(0, 50):
+        child.release(0.01)
+
+    parent.set_rate_limit(50, burst=1)
+    assert child.stats()['rate_limit'] == 50
+
+    start = time.time()
+    for _i in range(0, 6):
+        child.acquire()
+        child.release(0.01)
+
+    assert time.time() - start >= 0.09
+    parent.set_rate_limit(None)
+
+    # Throttling seen by the child pauses and shrinks the parent too
+    child.acquire()
+    child.release(0.01, _http_error(429, {'Retry-After': '0.2'}))
+    assert parent.limit == 2
+    assert child.limit == 50
+
+    start = time.time()
+    parent.acquire()
+    assert time.time() - start >= 0.15
+    parent.release(0.01)
+
+    # And a pause of the parent holds back the child
+    parent.back_off(0.2)
+    start = time.time()
+    child.acquire()
+    assert time.time() - start >= 0.15
+    child.release(0.01)
+
+
+def test_session_rate_limit(water_meter):
+    """Make sure parallel fetches respect a rate limit."""
+
+    domain, _cloud = water_meter
+    session = CloudSession('test@arch-iot.com', 'test', domain=domain, verify=False)
+    session.enable_cache = False
+
+    api = session.get_api()
+    resources = [api.vartype('water-meter-volume') for _i in range(0, 6)]
+
+    session.set_rate_limit(50, burst=1)
+
+    # Use distinct query strings so that the requests are not coalesced
+    start = time.time()
+    session.fetch_multiple(resources, per_call_kw=[{'attempt': i} for i in range(0, 6)])
+    assert time.time() - start >= 0.09
+
+    stats = session.throttle_stats()
+    assert stats['rate_limit'] == 50
+    assert stats['requests'] >= 6
+    assert stats['in_flight'] == 0
+
+    session.set_rate_limit(None)
+    session.enable_cache = True
+
+
+def test_latency_baseline_per_request_class():
+    """Make sure slow large pages are not mistaken for congestion after fast small ones."""
+
+    limiter = AdaptiveLimiter(initial=4, minimum=1, maximum=8)
+
+    for _i in range(0, 20):
+        limiter.acquire()
+        limiter.release(0.001, request_class='/api/v1/data/?page_size=1')
+
+    for _i in range(0, 100):
+        limiter.acquire()
+        limiter.release(0.2, request_class='/api/v1/data/?page_size=1000')
+
+    assert limiter.limit == 8
+
+    stats = limiter.stats()
+    assert stats['request_classes'] == 2
+    assert stats['min_latency'] == 0.001
+
+    # Within a class, rising latency still shrinks the limit
+    for _i in range(0, 20):
+        limiter.acquire()
+        limiter.release(2.0, request_class='/api/v1/data/?page_size=1000')
+
+    assert limiter.limit < 8
+
+
+def test_request_class():
+    """Make sure requests are grouped by path and page size but not by slug or page."""
+
+    first = pack_url('https://iotile.cloud/api/v1/stream/s--0000-0077--0000-0000-0000-00d2--5001/data/',
+                     {'page_size': 1000, 'page': 1})
+    second = pack_url('https://iotile.cloud/api/v1/stream/s--0000-0077--0000-0000-0000-00d3--5001/data/',
+                      {'page_size': 1000, 'page': 7})
+    count = pack_url('https://iotile.cloud/api/v1/stream/s--0000-0077--0000-0000-0000-00d2--5001/data/',
+                     {'page_size': 1})
+    event = pack_url('https://iotile.cloud/api/v1/event/1234/data/')
+
+    assert request_class(first) == request_class(second)
+    assert request_class(first) != request_class(count)
+    assert request_class(event) == '/api/v1/event/*/data/?page_size='
@@ -91,6 +91,8 @@ class SourceInfoReport(AnalysisTemplate):
             out.write("\nStream Summaries\n")
             out.write("----------------\n")
 
+            stream_counts = self._group.stream_counts
+
             for slug in sorted(self._group.streams):
                 if self._group.stream_empty(slug):
                     continue
@@ -109,7 +111,7 @@ class SourceInfoReport(AnalysisTemplate):
                 if self._group.stream_empty(slug):
                     continue
 
-                counts = self._group.stream_counts[slug]
+                counts = stream_counts[slug]
 
                 out.write('{:s}              {: 6d} points {: 6d} events\n'.format(slug, counts.get('points'), counts.get('events')))
 
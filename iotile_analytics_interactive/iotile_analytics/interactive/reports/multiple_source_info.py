@@ -92,6 +92,8 @@ class MultipleSourceInfoReport(AnalysisTemplate):
                 out.write("\nStream Summaries\n")
                 out.write("----------------\n")
 
+                stream_counts = _group.stream_counts
+
                 for slug in sorted(_group.streams):
                     if _group.stream_empty(slug):
                         continue
@@ -110,7 +112,7 @@ class MultipleSourceInfoReport(AnalysisTemplate):
                     if _group.stream_empty(slug):
                         continue
 
-                    counts = _group.stream_counts[slug]
+                    counts = stream_counts[slug]
 
                     out.write('{:s}              {: 6d} points {: 6d} events\n'.format(slug, counts.get('points'), counts.get('events')))
 
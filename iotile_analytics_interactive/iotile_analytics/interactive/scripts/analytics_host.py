@@ -120,6 +120,8 @@ def build_args():
     parser.add_argument('--web-push-label', type=str, default=None, help="Set the label used when pushing a report to iotile.cloud (otherwise you are prompted for it)")
     parser.add_argument('--web-push-slug', type=str, default=None, help="Override the source slug given in the analysisgroup and force it to be this")
     parser.add_argument('--token', type=str, default=None, help="Token for authentication to iotile cloud (instead of a password)")
+    parser.add_argument('--disk-cache', type=str, default=None, help="Cache responses from iotile.cloud in this file so that repeated runs do not download the same data again")
+    parser.add_argument('--disk-cache-ttl', type=float, default=24*60*60, help="The maximum age in seconds of responses reused from the disk cache (default: 1 day)")
     parser.add_argument('-d', '--domain', default=DOMAIN_NAME, help="Domain to use for remote queries, defaults to https://iotile.cloud")
     parser.add_argument('analysis_group', default=None, nargs='*', help="The slug or path of the object you want to perform analysis on")
 
@@ -264,7 +266,10 @@ def find_analysis_group(args, group_in):
             sys.exit(1)
 
     if is_cloud:
-        CloudSession(user=args.user, password=args.password, token=args.token, domain=args.domain, verify=not args.no_verify)
+        session = CloudSession(user=args.user, password=args.password, token=args.token, domain=args.domain, verify=not args.no_verify)
+
+        if args.disk_cache is not None:
+            session.set_disk_cache(args.disk_cache, ttl=args.disk_cache_ttl)
 
     group_obj = generator(group)
 
@@ -11,7 +11,7 @@ setup(
     version=version,
     license="LGPLv3",
     install_requires=[
-        "iotile-analytics-core >= 0.1.0",
+        "iotile-analytics-core >= 0.7.0",
         "bokeh >= 1.0.0"
     ],
     entry_points={
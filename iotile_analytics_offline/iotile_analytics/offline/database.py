@@ -12,8 +12,11 @@ import pandas as pd
 import numpy as np
 from future.utils import viewitems
 from iotile_analytics.core.stream_series import StreamSeries
+from iotile_analytics.core.utilities.time_range import parse_time_range, to_timecol
+from iotile_analytics.core.utilities.chunking import chunk_ranges
 from typedargs.exceptions import ArgumentError
 from .table_descriptions import Stream, EventIndex, PropertyTable, DatabaseInfoTable, PropertyTypes
+from .event_columns import EventColumns
 
 
 class OfflineDatabase(object):
@@ -25,16 +28,65 @@ class OfflineDatabase(object):
     database will be created that will not be backed by file
     storage.
 
+    Existing files are opened read-only unless you pass append=True, in
+    which case you can add new streams and append newer data to existing
+    streams using append_stream().
+
+    Files created with format version 2.1 or later store the summary data
+    of events in typed columns, see EventColumns.  Event summaries in older
+    files are stored as one json blob per event and continue to be stored
+    that way when appending to them.
+
     Args:
         path (str): The path to the database file that we want
             to create or open.  If None if passed (the default),
             a new, in-memory database is created that will be
             lost when the program is exited.
+        append (bool): Open an existing file for writing so that new data
+            can be appended to it.
+        compression (str or dict): How to compress the streams that are saved.
+            This is either the name of one of COMPRESSION_PRESETS or a dict
+            of arguments for tables.Filters: complib, complevel, shuffle and
+            bitshuffle.  By default, only metadata and json data are
+            compressed, with zlib, and data tables are not compressed.
+            Streams that were already saved keep their compression.
+        chunk_rows (int): The number of rows in each HDF5 chunk of the data
+            and event tables.  By default, PyTables picks a chunk size based on
+            the number of data points in the first save of each stream.
     """
 
-    VERSION = (2, 0, 0)
+    VERSION = (2, 1, 0)
+
+    WRITE_CHUNK_ROWS = 1 << 20
+    """The maximum number of rows written to a table in a single append."""
+
+    ITER_CHUNK_ROWS = 1 << 20
+    """The default number of data points in each chunk yielded by iter_datapoints."""
+
+    COMPRESSION_PRESETS = {
+        'none': {'complevel': 0},
+        'zlib': {'complib': 'zlib', 'complevel': 1, 'shuffle': True},
+        'blosclz': {'complib': 'blosc:blosclz', 'complevel': 5, 'shuffle': True},
+        'lz4': {'complib': 'blosc:lz4', 'complevel': 5, 'shuffle': True},
+        'zstd': {'complib': 'blosc:zstd', 'complevel': 5, 'bitshuffle': True}
+    }
+    """Named compression settings that can be passed as compression."""
+
+    SORTED_ATTR = 'time_sorted'
+    """The data table attribute recording whether data points are saved in timestamp order."""
+
+    _DEFAULT_FILTERS = tables.Filters(complevel=1)
+
+    def __init__(self, path=None, append=False, compression=None, chunk_rows=None):
+        self.columnar_events = True
+        self._filters = self._build_filters(compression)
+
+        if chunk_rows is not None and chunk_rows < 1:
+            raise ArgumentError("HDF5 chunks must contain at least one row", chunk_rows=chunk_rows)
+
+        self._chunk_rows = chunk_rows
+        self._sorted_tables = {}
 
-    def __init__(self, path=None):
         if path is None:
             self._file = tables.open_file(str(uuid.uuid4()), "w", driver="H5FD_CORE", driver_core_backing_store=0)
             self._initialize_database()
@@ -45,15 +97,43 @@ class OfflineDatabase(object):
         # otherwise pytables will throw an exception when it tries to open the file.
         path = str(path)
         if os.path.isfile(path):
-            self._file = tables.open_file(path, mode="r")
-            self.read_only = True
+            self._file = tables.open_file(path, mode="a" if append else "r")
+            self.read_only = not append
 
             self._check_version()
+            self.columnar_events = tuple(self._get_version())[:2] >= (2, 1)
         else:
             self._file = tables.open_file(path, mode="w")
             self._initialize_database()
             self.read_only = False
 
+    @classmethod
+    def _build_filters(cls, compression):
+        """Convert a compression setting into tables.Filters, or None for the default."""
+
+        if compression is None:
+            return None
+
+        if isinstance(compression, basestring):
+            if compression not in cls.COMPRESSION_PRESETS:
+                raise ArgumentError("Unknown compression preset", compression=compression,
+                                    known_presets=sorted(cls.COMPRESSION_PRESETS))
+
+            compression = cls.COMPRESSION_PRESETS[compression]
+
+        unknown = set(compression) - set(['complib', 'complevel', 'shuffle', 'bitshuffle'])
+        if len(unknown) > 0:
+            raise ArgumentError("Unknown compression settings", unknown=sorted(unknown))
+
+        complib = compression.get('complib', 'zlib')
+        if complib not in tables.filters.all_complibs or tables.which_lib_version(str(complib.split(':')[0])) is None:
+            raise ArgumentError("Compression library is not available in this PyTables installation", complib=complib)
+
+        try:
+            return tables.Filters(**{str(key): value for key, value in viewitems(compression)})
+        except ValueError as err:
+            raise ArgumentError("Invalid compression settings", compression=compression, error=str(err))
+
     def __enter__(self):
         return self
 
@@ -131,48 +211,177 @@ class OfflineDatabase(object):
         if node_path in self._file:
             raise ArgumentError("Stream already exists in file, cannot save", slug=slug)
 
-        has_raw_events = raw_events is not None and len(raw_events) > 0
-        if has_raw_events and len(raw_events) != len(events):
-            raise ArgumentError("If you pass raw events, you must pass the same number as the number of events")
+        self._check_raw_events(events, raw_events)
 
-        filters = tables.Filters(complevel=1)
+        filters = self._filters
+        if filters is None:
+            filters = self._DEFAULT_FILTERS
+
+        table_args = {'filters': self._filters, 'expectedrows': max(len(data) if data is not None else 0, 10000)}
+        if self._chunk_rows is not None:
+            table_args['chunkshape'] = (self._chunk_rows,)
 
         group = self._file.create_group('/streams', slug)
 
         arr_def = self._file.create_vlarray(group, 'definition', tables.VLStringAtom(), filters=filters)
-        arr_events = self._file.create_vlarray(group, 'events', tables.VLStringAtom(), filters=filters)
-        arr_rawevents = self._file.create_vlarray(group, 'raw_events', tables.VLStringAtom(), filters=filters)
-        table_data = self._file.create_table(group, 'data', Stream)
-        table_events = self._file.create_table(group, 'event_index', EventIndex)
+
+        if self.columnar_events:
+            EventColumns.create(self._file, group, filters=filters)
+        else:
+            self._file.create_vlarray(group, 'events', tables.VLStringAtom(), filters=filters)
+
+        self._file.create_vlarray(group, 'raw_events', tables.VLStringAtom(), filters=filters)
+        self._file.create_table(group, 'data', Stream, **table_args)
+        table_events = self._file.create_table(group, 'event_index', EventIndex, **table_args)
+        self._index_event_times(table_events)
 
         arr_def.append(self._encode_json(definition))
 
-        row = table_events.row
+        self._append_rows(group, data, events, raw_events)
+
+    def append_stream(self, slug, definition, data=None, events=None, raw_events=None):
+        """Append newer data and events to a stream, saving it if it does not exist.
+
+        The data and events must all be newer than what is already saved
+        for the stream, which you can find by calling sync_state().  The
+        stream definition is only used if the stream has not been saved yet.
+
+        Args:
+            slug (str): The stream slug to save
+            definition (dict): The stream metadata dictionary that comes
+                from the /api/v1/stream/<slug>/ API
+            data (StreamData): The new timeseries data to append.
+            events (pandas.DataFrame): Any new event summary data to append.
+            raw_events (pandas.DataFrame): The raw event data for the new events.
+        """
+
+        if self.read_only:
+            raise ArgumentError("Attemping to append to a stream in a read only database", slug=slug)
+
+        name = slug.replace('-', '_')
+        if name not in self._file.root.streams:
+            self.save_stream(slug, definition, data, events, raw_events)
+            return
+
+        self._check_raw_events(events, raw_events)
+        self._append_rows(getattr(self._file.root.streams, name), data, events, raw_events)
+
+    def sync_state(self, slug):
+        """Get the newest data point and event times saved for a stream.
+
+        This lets you fetch only newer data from iotile.cloud and add it
+        with append_stream().
 
-        if events is not None:
-            for i, (timestamp, event) in enumerate(events.iterrows()):
-                row['timestamp'] = self._to_timecol(timestamp)
-                row['event_id'] = event['event_id']
-                row['event_index'] = i
+        Args:
+            slug (str): The stream slug to query
+
+        Returns:
+            dict: None if the stream has not been saved, otherwise a dict with the
+                last_point and last_event keys containing the UTC timestamp of the
+                newest saved data point and event, or None if there are none.
+        """
+
+        name = slug.replace('-', '_')
+        if name not in self._file.root.streams:
+            return None
+
+        stream = getattr(self._file.root.streams, name)
+
+        last_point = None
+        if len(stream.data) > 0 and self._is_sorted(stream.data):
+            last_point = self._from_timecol(stream.data.cols.timestamp[len(stream.data) - 1])
+        elif len(stream.data) > 0:
+            last_point = self._from_timecol(stream.data.col('timestamp').max())
 
-                row.append()
+        last_event = None
+        event_times = stream.event_index.col('timestamp')
+        event_times = event_times[event_times != np.iinfo(np.int64).min]
+        if len(event_times) > 0:
+            last_event = self._from_timecol(event_times.max())
+
+        return {'last_point': last_point, 'last_event': last_event}
+
+    @classmethod
+    def _check_raw_events(cls, events, raw_events):
+        has_raw_events = raw_events is not None and len(raw_events) > 0
+        if has_raw_events and len(raw_events) != len(events):
+            raise ArgumentError("If you pass raw events, you must pass the same number as the number of events")
+
+    def _append_rows(self, group, data, events, raw_events):
+        """Append data points and events to the tables of a saved stream."""
+
+        arr_rawevents = group.raw_events
+        table_events = group.event_index
+        table_data = group.data
+
+        has_raw_events = raw_events is not None and len(raw_events) > 0
+        saved_events = table_events.nrows
+
+        # Raw events are stored either for no events or for every event.  If only the
+        # saved or only the new events have them, pad the others with empty entries.
+        if events is not None and len(events) > 0:
+            if has_raw_events and arr_rawevents.nrows < saved_events:
+                for _i in range(arr_rawevents.nrows, saved_events):
+                    arr_rawevents.append(self._encode_json({}))
+            elif not has_raw_events and arr_rawevents.nrows > 0:
+                has_raw_events = True
+                raw_events = pd.DataFrame([{}]*len(events), index=events.index)
+
+        if events is not None and len(events) > 0:
+            self._index_event_times(table_events)
+
+            rows = np.zeros(len(events), dtype=table_events.dtype)
+            rows['timestamp'] = self._to_timecols(events.index)
+            rows['event_id'] = events['event_id'].values
+            rows['event_index'] = np.arange(saved_events, saved_events + len(events))
+            self._append_event_summaries(group, events, saved_events)
+            self._append_chunked(table_events, rows)
+
+            if has_raw_events:
+                for raw_event in raw_events.to_dict('records'):
+                    arr_rawevents.append(self._encode_json(raw_event))
+
+        if data is not None and len(data) > 0:
+            rows = np.zeros(len(data), dtype=table_data.dtype)
+            rows['timestamp'] = self._to_timecols(data.index)
+            rows['internal_value'] = data.iloc[:, 0].values
+
+            in_order = bool(np.all(rows['timestamp'][1:] >= rows['timestamp'][:-1]))
+            if in_order and table_data.nrows > 0:
+                in_order = self._is_sorted(table_data) and \
+                    rows['timestamp'][0] >= table_data.cols.timestamp[table_data.nrows - 1]
+
+            self._append_chunked(table_data, rows)
+            table_data.set_attr(self.SORTED_ATTR, in_order)
+
+    def _append_event_summaries(self, group, events, saved_events):
+        """Append the summary data of events in the format used by their stream."""
+
+        if EventColumns.GROUP_NAME not in group:
+            for event in events.to_dict('records'):
+                group.events.append(self._encode_json(event))
+            return
 
-                arr_events.append(self._encode_json(event.to_dict()))
+        columns = EventColumns(getattr(group, EventColumns.GROUP_NAME))
+        if columns.append(events, saved_events):
+            return
 
-                if has_raw_events:
-                    arr_rawevents.append(self._encode_json(raw_events.iloc[i].to_dict()))
+        # The new events have fields that cannot be merged with the saved ones so rewrite all columns
+        saved = columns.read(pd.RangeIndex(saved_events))
+        combined = pd.concat([saved, events.reset_index(drop=True)], ignore_index=True, sort=False)
 
-            table_events.flush()
+        filters = getattr(group, EventColumns.GROUP_NAME)._v_filters
+        self._file.remove_node(group, EventColumns.GROUP_NAME, recursive=True)
+        EventColumns.create(self._file, group, filters=filters).append(combined)
 
-        row = table_data.row
-        if data is not None:
-            for timestamp, point in data.iterrows():
-                row['timestamp'] = self._to_timecol(timestamp)
-                row['internal_value'] = point[0]
+    @classmethod
+    def _append_chunked(cls, table, rows):
+        """Append a structured array to a table in chunks of WRITE_CHUNK_ROWS rows."""
 
-                row.append()
+        for first in range(0, len(rows), cls.WRITE_CHUNK_ROWS):
+            table.append(rows[first:first + cls.WRITE_CHUNK_ROWS])
 
-            table_data.flush()
+        table.flush()
 
     def save_vartype(self, _slug, vartype):
         """Save a vartype into the database.
@@ -186,6 +395,11 @@ class OfflineDatabase(object):
             raise ArgumentError("Attempted to save variable type in read only file")
 
         table = self._file.root.meta.vartype_definitions
+
+        # When appending to an existing file, the variable type may already be saved
+        if vartype.get('slug') in set(self._decode_json(x).get('slug') for x in table.read()):
+            return
+
         table.append(self._encode_json(vartype))
 
     def save_source_info(self, info, properties):
@@ -201,6 +415,10 @@ class OfflineDatabase(object):
         if self.read_only:
             raise ArgumentError("Attempted to save source info in read only file")
 
+        # Replace any previously saved values when appending to an existing file
+        self._file.root.meta.source_info.truncate(0)
+        self._file.root.meta.properties.truncate(0)
+
         self._encode_dict_in_table(info, self._file.root.meta.source_info)
         self._encode_dict_in_table(properties, self._file.root.meta.properties)
 
@@ -267,7 +485,25 @@ class OfflineDatabase(object):
 
     @classmethod
     def _to_timecol(cls, value):
-        return value.to_datetime64().astype(np.int64)
+        return value.to_datetime64().astype('datetime64[ns]').astype(np.int64)
+
+    @classmethod
+    def _to_timecols(cls, index):
+        """Convert a DatetimeIndex into an array of nanoseconds since the epoch.
+
+        A timezone naive index is assumed to be in UTC and NaT is stored as
+        the smallest int64, the same as _to_timecol.
+        """
+
+        index = pd.DatetimeIndex(index)
+        if index.tz is not None:
+            index = index.tz_convert(None)
+
+        return index.values.astype('datetime64[ns]').astype(np.int64)
+
+    @classmethod
+    def _from_timecol(cls, value):
+        return pd.Timestamp(int(value), unit='ns', tz='UTC')
 
     def list_streams(self):
         """Return a list of all streams.
@@ -295,6 +531,16 @@ class OfflineDatabase(object):
 
         return streams
 
+    def fetch_group_info(self):
+        """Fetch the metadata needed to create an AnalysisGroup.
+
+        Returns:
+            (list, dict, dict): The results of list_streams, fetch_source_info
+                and fetch_properties.
+        """
+
+        return self.list_streams(), self.fetch_source_info(), self.fetch_properties()
+
     def close(self):
         self._file.close()
 
@@ -317,11 +563,13 @@ class OfflineDatabase(object):
         info_obj = self._decode_json(group.definition[0])
         return info_obj
 
-    def fetch_datapoints(self, slug):
+    def fetch_datapoints(self, slug, start=None, end=None):
         """Get all timeseries data for a stream.
 
         Args:
             slug (str): The stream slug to query
+            start (pd.Timestamp): Only fetch data points at or after this UTC time.
+            end (pd.Timestamp): Only fetch data points before this UTC time.
 
         Returns:
             StreamSeries: The stream data.
@@ -334,17 +582,207 @@ class OfflineDatabase(object):
 
         data = getattr(self._file.root.streams, name).data
 
-        index = data.read(field='timestamp')
-        values = data.read(field='internal_value')
+        # Read both columns at once so that compressed chunks are only decompressed once
+        if self._is_sorted(data):
+            first, last = self._find_time_range(data, start, end)
+            rows = data.read(first, last)
+        else:
+            rows = data.read_coordinates(self._find_time_rows(data, start, end))
+
+        dt_index = pd.to_datetime(rows['timestamp'], unit='ns')
+        return StreamSeries(rows['internal_value'], index=dt_index)
+
+    def iter_datapoints(self, slug, chunk_rows=None, overlap=0, start=None, end=None):
+        """Iterate over the timeseries data for a stream in chunks.
+
+        Each chunk is read from the file when it is needed so only one chunk
+        is in memory at a time, however long the stream is.
+
+        Args:
+            slug (str): The stream slug to query
+            chunk_rows (int): The number of new data points in each chunk.  Defaults
+                to ITER_CHUNK_ROWS.
+            overlap (int): The number of data points at the end of each chunk to
+                repeat at the start of the next one.
+            start (pd.Timestamp): Only fetch data points at or after this UTC time.
+            end (pd.Timestamp): Only fetch data points before this UTC time.
+
+        Yields:
+            StreamSeries: Consecutive chunks of the stream data.
+        """
+
+        if chunk_rows is None:
+            chunk_rows = self.ITER_CHUNK_ROWS
+
+        name = slug.replace('-', '_')
+
+        if name not in self._file.root.streams:
+            raise ArgumentError("Stream slug not found in OfflineDatabase", slug=slug)
+
+        data = getattr(self._file.root.streams, name).data
+
+        coords = None
+        if self._is_sorted(data):
+            first, last = self._find_time_range(data, start, end)
+        else:
+            coords = self._find_time_rows(data, start, end)
+            first, last = 0, len(coords)
+
+        for chunk_first, chunk_last in chunk_ranges(first, last, chunk_rows, overlap):
+            if coords is None:
+                rows = data.read(chunk_first, chunk_last)
+            else:
+                rows = data.read_coordinates(coords[chunk_first:chunk_last])
+
+            dt_index = pd.to_datetime(rows['timestamp'], unit='ns')
+            yield StreamSeries(rows['internal_value'], index=dt_index)
+
+    def _is_sorted(self, table):
+        """Check if the data points in a data table are saved in timestamp order.
+
+        Tables record this in an attribute when data is saved.  Tables saved
+        before that attribute existed are checked once and the result cached.
+        """
+
+        if self.SORTED_ATTR in table.attrs:
+            return bool(table.get_attr(self.SORTED_ATTR))
+
+        path = table._v_pathname
+        if path not in self._sorted_tables:
+            timestamps = table.col('timestamp')
+            self._sorted_tables[path] = bool(np.all(timestamps[1:] >= timestamps[:-1]))
+
+        return self._sorted_tables[path]
+
+    @classmethod
+    def _find_time_range(cls, table, start, end):
+        """Find the rows of a data table that lie in the time range [start, end).
+
+        The table must be sorted by timestamp, see _is_sorted, so that we can
+        binary search the timestamp column and only read the rows that we need.
+        """
+
+        start, end = parse_time_range(start, end)
+
+        first = 0
+        last = len(table)
+
+        if start is not None:
+            first = cls._bisect_timestamp(table, to_timecol(start))
+        if end is not None:
+            last = cls._bisect_timestamp(table, to_timecol(end))
+
+        return first, max(first, last)
+
+    @classmethod
+    def _find_time_rows(cls, table, start, end):
+        """Find the rows of a data table that lie in the time range [start, end), in file order.
+
+        This works whatever order the data points are saved in by querying
+        the timestamp column.
+        """
+
+        start, end = parse_time_range(start, end)
+        if start is None and end is None:
+            return np.arange(len(table))
+
+        conditions = []
+        condvars = {}
+
+        if start is not None:
+            conditions.append('(timestamp >= start)')
+            condvars['start'] = np.int64(to_timecol(start))
+        if end is not None:
+            conditions.append('(timestamp < end)')
+            condvars['end'] = np.int64(to_timecol(end))
+
+        return table.get_where_list(' & '.join(conditions), condvars=condvars, sort=True)
 
-        dt_index = pd.to_datetime(index, unit='ns')
-        return StreamSeries(values, index=dt_index)
+    @classmethod
+    def _bisect_timestamp(cls, table, timestamp):
+        """Find the first row whose timestamp is not before timestamp."""
+
+        column = table.cols.timestamp
+        low = 0
+        high = len(table)
+
+        while low < high:
+            mid = (low + high) // 2
+            if column[mid] < timestamp:
+                low = mid + 1
+            else:
+                high = mid
+
+        return low
+
+    @classmethod
+    def _find_event_rows(cls, table, start, end):
+        """Find the rows of an event index that lie in the time range [start, end).
+
+        Events are not guaranteed to be saved in timestamp order so the rows
+        are found with a query on the timestamp column, which uses its index
+        if the file has one.  Events without a valid timestamp are excluded
+        whenever a range is given.
+        """
+
+        start, end = parse_time_range(start, end)
+        if start is None and end is None:
+            return None
+
+        conditions = ['(timestamp != invalid)']
+        condvars = {'invalid': np.iinfo(np.int64).min}
+
+        if start is not None:
+            conditions.append('(timestamp >= start)')
+            condvars['start'] = np.int64(to_timecol(start))
+        if end is not None:
+            conditions.append('(timestamp < end)')
+            condvars['end'] = np.int64(to_timecol(end))
+
+        return table.get_where_list(' & '.join(conditions), condvars=condvars, sort=True)
+
+    @classmethod
+    def _index_event_times(cls, table):
+        """Make sure that the timestamp column of an event index is indexed.
+
+        PyTables keeps the index up to date as rows are appended so this only
+        needs to be done once per table.
+        """
+
+        if not table.cols.timestamp.is_indexed:
+            table.cols.timestamp.create_csindex()
+
+    @classmethod
+    def _read_event_times(cls, table, rows):
+        """Read the timestamps of the given rows of an event index, or all rows if rows is None."""
+
+        if rows is None:
+            return table.col('timestamp')
 
-    def _get_event_index(self, name):
+        if len(rows) == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        return table.read_coordinates(rows, field='timestamp')
+
+    @classmethod
+    def _read_rows(cls, array, rows):
+        """Read the given rows from a table or vlarray, or all rows if rows is None."""
+
+        if rows is None:
+            return array.read()
+
+        if len(rows) == 0 or array.nrows == 0:
+            return array.read(0, 0)
+
+        first = int(rows[0])
+        data = array.read(first, int(rows[-1]) + 1)
+        return [data[i - first] for i in rows]
+
+    def _get_event_index(self, name, rows=None):
         data = getattr(self._file.root.streams, name).event_index
-        return data.read()
+        return self._read_rows(data, rows)
 
-    def fetch_events(self, slug):
+    def fetch_events(self, slug, start=None, end=None):
         """Fetch all events for a given stream.
 
         These are the event metadata dictionaries, not the raw
@@ -353,6 +791,8 @@ class OfflineDatabase(object):
         Args:
             slug (str): The slug of the stream that we should fetch
                 events for.
+            start (pd.Timestamp): Only fetch events at or after this UTC time.
+            end (pd.Timestamp): Only fetch events before this UTC time.
 
         Returns:
             pd.DataFrame: All of the events.
@@ -363,14 +803,38 @@ class OfflineDatabase(object):
         if name not in self._file.root.streams:
             raise ArgumentError("Stream slug not found in OfflineDatabase", slug=slug)
 
-        events = self._get_event_index(name)
+        stream = getattr(self._file.root.streams, name)
+        rows = self._find_event_rows(stream.event_index, start, end)
+
+        index = pd.to_datetime(self._read_event_times(stream.event_index, rows), unit='ns')
 
-        enc_event_data = getattr(self._file.root.streams, name).events.read()
+        if EventColumns.GROUP_NAME in stream:
+            return EventColumns(getattr(stream, EventColumns.GROUP_NAME)).read(index, rows)
+
+        enc_event_data = self._read_rows(stream.events, rows)
         event_data = [self._decode_json(x) for x in enc_event_data]
 
-        index = pd.to_datetime([x['timestamp'] for x in events], unit='ns')
         return pd.DataFrame(event_data, index=index)
 
+    def fetch_events_with_raw(self, slug, postprocess=None, start=None, end=None):
+        """Fetch the events of a stream along with their raw event data.
+
+        Args:
+            slug (str): The slug of the stream that we should fetch
+                events for.
+            postprocess (callable): (Optional) function to call on each raw event, as
+                in fetch_raw_events().
+            start (pd.Timestamp): Only fetch events at or after this UTC time.
+            end (pd.Timestamp): Only fetch events before this UTC time.
+
+        Returns:
+            (pd.DataFrame, pd.DataFrame): All of the events and all of the raw events.
+        """
+
+        events = self.fetch_events(slug, start=start, end=end)
+        raw_events = self.fetch_raw_events(slug, postprocess=postprocess, start=start, end=end)
+        return events, raw_events
+
     def _count_stream(self, slug):
         """Count the number of data points and events in a stream."""
 
@@ -381,11 +845,11 @@ class OfflineDatabase(object):
 
         stream = getattr(self._file.root.streams, name)
         data_count = len(stream.data)
-        event_count = len(stream.events)
+        event_count = stream.event_index.nrows
 
         return {'points': data_count, 'events': event_count}
 
-    def fetch_raw_events(self, slug, postprocess=None):
+    def fetch_raw_events(self, slug, postprocess=None, start=None, end=None):
         """Fetch all raw event data for this stream.
 
         These are the raw json dictionaries that are stored for
@@ -399,6 +863,8 @@ class OfflineDatabase(object):
                 postprocess(i, data, event_summary) where i is the row in the output dataframe, data
                 is the raw data and event_summary if the pandas series corresponding to the event
                 as returned by fetch_events()
+            start (pd.Timestamp): Only fetch events at or after this UTC time.
+            end (pd.Timestamp): Only fetch events before this UTC time.
 
         Returns:
             pd.DataFrame: All of the raw events.
@@ -409,10 +875,13 @@ class OfflineDatabase(object):
         if name not in self._file.root.streams:
             raise ArgumentError("Stream slug not found in OfflineDatabase", slug=slug)
 
-        events = self.fetch_events(slug)
-        event_index = self._get_event_index(name)
+        stream = getattr(self._file.root.streams, name)
+        rows = self._find_event_rows(stream.event_index, start, end)
+
+        events = self.fetch_events(slug, start=start, end=end)
+        timestamps = self._read_event_times(stream.event_index, rows)
 
-        enc_event_data = getattr(self._file.root.streams, name).raw_events.read()
+        enc_event_data = self._read_rows(stream.raw_events, rows)
         event_data = [self._decode_json(x) for x in enc_event_data]
 
         if postprocess is not None:
@@ -425,10 +894,11 @@ class OfflineDatabase(object):
                     to_remove.add(i)
 
             if len(to_remove) > 0:
-                event_index = [x for i, x in enumerate(event_index) if i not in to_remove]
-                event_data = [x for i, x in enumerate(event_data) if i not in to_remove]
+                keep = [i for i in range(0, len(event_data)) if i not in to_remove]
+                timestamps = timestamps[keep]
+                event_data = [event_data[i] for i in keep]
 
-        index = pd.to_datetime([x['timestamp'] for x in event_index], unit='ns')
+        index = pd.to_datetime(timestamps, unit='ns')
         return pd.DataFrame(event_data, index=index)
 
     def count_streams(self, slugs):
@@ -0,0 +1,338 @@
+"""Columnar storage for event summaries in offline databases.
+
+Starting with format version 2.1, the summary data of each event is not
+saved as a json blob.  Instead, each field of the event summaries is saved
+as its own array so that all events of a stream can be loaded with a few
+array reads:
+
+- numeric and boolean fields are saved as native HDF5 arrays.
+- string fields are dictionary encoded as an array of integer codes into a
+  list of distinct strings.  Missing strings have the code -1.
+- any other field, such as a field that mixes strings and numbers, is saved
+  as one json blob per event.
+
+Since field names can contain characters that are not valid in HDF5 node
+names, fields are saved in nodes named c0, c1, ... and their names and
+kinds are saved in the columns attribute of the group.
+
+Event summaries from iotile.cloud do not always have the same fields, so
+appending events can change the saved columns in place: a new field is
+added as a new column filled with missing values for the saved events, an
+int column that receives fractional or missing values is converted to a
+float column and a column whose saved values are all missing takes on the
+kind of the new values.
+"""
+
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+
+import json
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import tables
+from future.utils import viewitems
+from past.builtins import basestring
+
+
+class EventColumns(object):
+    """The columns of event summary data saved for one stream.
+
+    Args:
+        group (tables.Group): The HDF5 group holding the event columns.
+    """
+
+    GROUP_NAME = 'event_columns'
+    """The name of the group under each stream that holds its event columns."""
+
+    INT = 'int'
+    FLOAT = 'float'
+    BOOL = 'bool'
+    STRING = 'string'
+    JSON = 'json'
+
+    _ATOMS = {
+        INT: tables.Int64Atom,
+        FLOAT: tables.Float64Atom,
+        BOOL: tables.BoolAtom
+    }
+
+    def __init__(self, group):
+        self._group = group
+
+    @classmethod
+    def create(cls, h5file, parent, filters=None):
+        """Create an empty set of event columns under a stream's group.
+
+        Args:
+            h5file (tables.File): The file to create the columns in.
+            parent (tables.Group): The group of the stream.
+            filters (tables.Filters): Optional compression settings for the columns.
+
+        Returns:
+            EventColumns: The new, empty columns.
+        """
+
+        group = h5file.create_group(parent, cls.GROUP_NAME, filters=filters)
+        group._v_attrs.columns = json.dumps([])
+        return EventColumns(group)
+
+    @property
+    def columns(self):
+        """list((str, str)): The name and kind of each saved field in order."""
+
+        return [tuple(x) for x in json.loads(self._group._v_attrs.columns)]
+
+    @classmethod
+    def classify(cls, values):
+        """Determine how a column of event summary data should be saved.
+
+        Args:
+            values (pd.Series): The values of one field for all events.
+
+        Returns:
+            str: One of INT, FLOAT, BOOL, STRING or JSON.
+        """
+
+        kind = values.dtype.kind
+        if kind in 'iu':
+            return cls.INT
+        if kind == 'f':
+            return cls.FLOAT
+        if kind == 'b':
+            return cls.BOOL
+
+        present = [x for x in values if x is not None and not (isinstance(x, float) and np.isnan(x))]
+        if all(isinstance(x, basestring) for x in present):
+            return cls.STRING
+
+        return cls.JSON
+
+    def append(self, events, saved_rows=0):
+        """Append event summaries to the saved columns.
+
+        Fields that are new or whose kind changed in a compatible way, see
+        the module documentation, are converted in place.  Only the columns
+        that change are rewritten.
+
+        Args:
+            events (pd.DataFrame): The event summaries to save.
+            saved_rows (int): The number of events that are already saved.
+
+        Returns:
+            bool: False if the events could not be appended because their fields
+                are incompatible with the saved fields, otherwise True.
+        """
+
+        incoming = OrderedDict((name, self.classify(events[name])) for name in events.columns)
+        saved = self.columns
+
+        if len(saved) == 0 and saved_rows == 0:
+            columns = list(incoming.items())
+            self._create_columns(columns)
+        else:
+            columns = self._merge_columns(saved, incoming, events, saved_rows)
+            if columns is None:
+                return False
+
+            self._update_columns(saved, columns, saved_rows)
+
+        for i, (name, kind) in enumerate(columns):
+            if name in incoming:
+                values = events[name]
+            else:
+                values = pd.Series([None]*len(events), dtype=object)
+
+            self._append_column(i, kind, values)
+
+        return True
+
+    def _merge_columns(self, saved, incoming, events, saved_rows):
+        """Determine the columns needed to hold both the saved and incoming fields.
+
+        Returns:
+            list((str, str)): The name and kind of each column or None if the
+                saved columns cannot hold the incoming fields without rewriting them all.
+        """
+
+        columns = []
+        for i, (name, kind) in enumerate(saved):
+            new_kind = incoming.get(name)
+
+            if new_kind is None or events[name].isna().all():
+                merged = self._merge_missing(kind)
+            elif new_kind == kind or kind == self.JSON:
+                merged = kind
+            elif self._saved_missing(i, kind):
+                merged = self._merge_missing(new_kind)
+            elif set([kind, new_kind]) == set([self.INT, self.FLOAT]):
+                merged = self.FLOAT
+            else:
+                merged = None
+
+            if merged is None:
+                return None
+
+            columns.append((name, merged))
+
+        names = set(name for name, _kind in saved)
+        for name, kind in viewitems(incoming):
+            if name in names:
+                continue
+
+            if saved_rows > 0:
+                kind = self._merge_missing(kind)
+                if kind is None:
+                    return None
+
+            columns.append((name, kind))
+
+        return columns
+
+    @classmethod
+    def _merge_missing(cls, kind):
+        """Get the kind of a column that holds values of the given kind and missing values.
+
+        Ints and bools cannot be missing so ints become floats, like in pandas,
+        and bools are incompatible.  Json columns save missing values as null.
+        """
+
+        if kind == cls.INT:
+            return cls.FLOAT
+        if kind == cls.BOOL:
+            return None
+
+        return kind
+
+    def _saved_missing(self, i, kind):
+        """Check if all saved values of column i are missing."""
+
+        if kind == self.STRING:
+            return getattr(self._group, 'c%d_values' % i).nrows == 0
+        if kind == self.FLOAT:
+            return bool(np.isnan(getattr(self._group, 'c%d' % i).read()).all())
+
+        return False
+
+    def _update_columns(self, saved, columns, saved_rows):
+        """Convert the saved columns whose kind changed and add new columns filled with missing values."""
+
+        h5file = self._group._v_file
+
+        for i, (name, kind) in enumerate(columns):
+            node_name = 'c%d' % i
+
+            if i < len(saved):
+                old_kind = saved[i][1]
+                if old_kind == kind:
+                    continue
+
+                if old_kind == self.INT:
+                    values = pd.Series(getattr(self._group, node_name).read().astype(np.float64))
+                else:
+                    values = pd.Series([None]*saved_rows, dtype=object)
+
+                h5file.remove_node(self._group, node_name)
+                if old_kind == self.STRING:
+                    h5file.remove_node(self._group, node_name + '_values')
+            else:
+                values = pd.Series([None]*saved_rows, dtype=object)
+
+            self._create_column(i, kind)
+            self._append_column(i, kind, values)
+
+        self._group._v_attrs.columns = json.dumps(columns)
+
+    def _create_columns(self, columns):
+        for i, (_name, kind) in enumerate(columns):
+            self._create_column(i, kind)
+
+        self._group._v_attrs.columns = json.dumps(columns)
+
+    def _create_column(self, i, kind):
+        h5file = self._group._v_file
+        node_name = 'c%d' % i
+
+        if kind in self._ATOMS:
+            h5file.create_earray(self._group, node_name, self._ATOMS[kind](), shape=(0,))
+        elif kind == self.STRING:
+            h5file.create_earray(self._group, node_name, tables.Int32Atom(), shape=(0,))
+            h5file.create_vlarray(self._group, node_name + '_values', tables.VLStringAtom())
+        else:
+            h5file.create_vlarray(self._group, node_name, tables.VLStringAtom())
+
+    def _append_column(self, i, kind, values):
+        node = getattr(self._group, 'c%d' % i)
+
+        if len(values) == 0:
+            return
+
+        if kind == self.FLOAT:
+            node.append(np.asarray(pd.to_numeric(values), dtype=np.float64))
+        elif kind in self._ATOMS:
+            node.append(values.values)
+        elif kind == self.STRING:
+            strings = getattr(self._group, 'c%d_values' % i)
+            codes = {x.decode('utf-8'): code for code, x in enumerate(strings.read())}
+
+            encoded = np.full(len(values), -1, dtype=np.int32)
+            for row, value in enumerate(values):
+                if not isinstance(value, basestring):
+                    continue
+
+                code = codes.get(value)
+                if code is None:
+                    code = len(codes)
+                    codes[value] = code
+                    strings.append(value.encode('utf-8'))
+
+                encoded[row] = code
+
+            node.append(encoded)
+        else:
+            for value in values:
+                node.append(json.dumps(value).encode('utf-8'))
+
+    def read(self, index, rows=None):
+        """Read saved event summaries into a DataFrame.
+
+        Args:
+            index (pd.DatetimeIndex): The index of the returned DataFrame, which must
+                have one entry per row that is read.
+            rows (ndarray): The sorted rows to read or None to read all rows.
+
+        Returns:
+            pd.DataFrame: The event summaries.
+        """
+
+        if len(index) == 0:
+            return pd.DataFrame([], index=index)
+
+        data = {}
+        for i, (name, kind) in enumerate(self.columns):
+            node = getattr(self._group, 'c%d' % i)
+            values = self._read_rows(node, rows)
+
+            if kind == self.STRING:
+                strings = [x.decode('utf-8') for x in getattr(self._group, 'c%d_values' % i).read()]
+                lookup = np.array(strings + [None], dtype=object)
+                values = lookup[np.where(values < 0, len(strings), values)]
+            elif kind == self.JSON:
+                values = [json.loads(x.decode('utf-8')) for x in values]
+
+            data[name] = values
+
+        return pd.DataFrame(data, index=index, columns=[name for name, _kind in self.columns])
+
+    @classmethod
+    def _read_rows(cls, node, rows):
+        if rows is None:
+            return node.read()
+
+        first = int(rows[0])
+        data = node.read(first, int(rows[-1]) + 1)
+
+        if isinstance(data, list):
+            return [data[i - first] for i in rows]
+
+        return data[np.asarray(rows) - first]
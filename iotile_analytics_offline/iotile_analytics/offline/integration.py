@@ -3,8 +3,16 @@ from iotile_analytics.core.exceptions import UsageError
 from .database import OfflineDatabase
 
 
-def hdf5_save_factory(path):
-    """Generate an HDF5 saver and overwrite a previous file if exists."""
+def hdf5_save_factory(path, append=False, compression=None, chunk_rows=None):
+    """Generate an HDF5 saver and overwrite a previous file if exists.
+
+    If append is True, an existing file is opened for appending instead of
+    being overwritten.  compression and chunk_rows are passed to
+    OfflineDatabase and apply to all streams that are newly saved.
+    """
+
+    if append and os.path.isfile(path):
+        return OfflineDatabase(path, append=True, compression=compression, chunk_rows=chunk_rows)
 
     if os.path.exists(path):
         if not os.path.isfile(path):
@@ -12,7 +20,7 @@ def hdf5_save_factory(path):
 
         os.remove(path)
 
-    return OfflineDatabase(path)
+    return OfflineDatabase(path, compression=compression, chunk_rows=chunk_rows)
 
 
 def hdf5_load_factory(path):
@@ -1,14 +1,21 @@
 """A LiveReport plugin to enable quickly saving data from iotile.cloud offline."""
 
 class SaveOfflineReport(object):
-    """Save all data locally as an HDF5 database file."""
+    """Save all data locally as an HDF5 database file.
+
+    Args:
+        compression (str): The name of the compression settings to use, one of
+            none, zlib, blosclz, lz4 or zstd.  If not passed, data tables are not
+            compressed.  See OfflineDatabase.COMPRESSION_PRESETS.
+    """
 
     # Standalone reports are those that can be serialized to a single file or the console
     # since we don't support console serializaiton, we are not standalone
     standalone = False
 
-    def __init__(self, group):
+    def __init__(self, group, compression=None):
         self._group = group
+        self._compression = compression
 
 
     def run(self, output_path, file_handler):
@@ -25,5 +32,5 @@ class SaveOfflineReport(object):
         if not output_path.endswith('.hdf5'):
             output_path = output_path + ".hdf5"
 
-        self._group.save(output_path, 'hdf5')
+        self._group.save(output_path, 'hdf5', compression=self._compression)
         return [output_path]
@@ -11,7 +11,7 @@ setup(
     version=version,
     license="LGPLv3",
     install_requires=[
-        "iotile-analytics-core >= 0.2.0",
+        "iotile-analytics-core >= 0.7.0",
         "tables >= 3.4.2"
     ],
     entry_points={
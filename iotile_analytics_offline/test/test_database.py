@@ -3,7 +3,10 @@
 import pytest
 import numpy as np
 import pandas as pd
+from iotile_analytics.core.stream_series import StreamSeries
+from iotile_analytics.core.utilities import envelope_create, envelope_update, envelope_finish
 from iotile_analytics.offline import OfflineDatabase
+from iotile_analytics.offline.event_columns import EventColumns
 from typedargs.exceptions import ArgumentError
 
 
@@ -106,3 +109,261 @@ def test_postprocess_events(group, database):
     assert len(events5001) == 1
     assert np.all(events5001.values == grp5001.values)
     assert np.allclose(grp5001.index.astype('int64'), events5001.index.astype('int64'))
+
+
+def test_time_range_reads(group, database):
+    """Make sure we only read the rows in a requested time range."""
+
+    slug = 's--0000-0077--0000-0000-0000-00d2--5001'
+
+    data = database.fetch_datapoints(slug)
+    start = data.index[3]
+    end = data.index[7]
+
+    ranged = database.fetch_datapoints(slug, start=start, end=end)
+    assert np.allclose(ranged.values, data.values[3:7])
+    assert list(ranged.index) == list(data.index[3:7])
+
+    assert len(database.fetch_datapoints(slug, start=start)) == len(data) - 3
+    assert len(database.fetch_datapoints(slug, end=end)) == 7
+    assert len(database.fetch_datapoints(slug, start=end, end=end)) == 0
+
+    events = database.fetch_events(slug)
+    first_event = events.index[0]
+    after_first = first_event + pd.Timedelta(microseconds=1)
+
+    ranged = database.fetch_events(slug, start=first_event, end=after_first)
+    assert len(ranged) == 1
+    assert ranged.equals(events.iloc[:1])
+    assert len(database.fetch_events(slug, start=after_first)) == len(events[events.index >= after_first])
+
+    raw = database.fetch_raw_events(slug, end=after_first)
+    assert len(raw) == 1
+    assert raw.equals(database.fetch_raw_events(slug).iloc[:1])
+
+    with pytest.raises(ArgumentError):
+        database.fetch_datapoints(slug, start=end, end=start)
+
+
+def test_bulk_writes(monkeypatch):
+    """Make sure data saved in several chunks reads back exactly."""
+
+    monkeypatch.setattr(OfflineDatabase, 'WRITE_CHUNK_ROWS', 3)
+
+    slug = 's--0000-0077--0000-0000-0000-00d2--5001'
+    index = pd.date_range('2017-04-11T22:07:25.972121', periods=10, freq='10s', tz='UTC')
+    data = StreamSeries(np.arange(0, 10) * 1.5, index=index)
+    events = pd.DataFrame({'event_id': [5, 6, 7], 'peak': [1.0, 2.5, 3.0]},
+                          index=pd.DatetimeIndex([index[1], pd.NaT, index[4]]))
+    raw_events = pd.DataFrame([{'a': 1}, {'a': 2}, {'a': 3}], index=events.index)
+
+    db = OfflineDatabase()
+    db.save_stream(slug, None, data, events, raw_events)
+
+    saved = db.fetch_datapoints(slug)
+    assert list(saved.values[:, 0]) == list(data.values[:, 0])
+    assert list(saved.index) == list(index.tz_convert(None))
+
+    saved_events = db.fetch_events(slug)
+    assert list(saved_events['event_id']) == [5, 6, 7]
+    assert list(saved_events['peak']) == [1.0, 2.5, 3.0]
+    assert pd.isna(saved_events.index[1])
+    assert list(db.fetch_raw_events(slug)['a']) == [1, 2, 3]
+    assert db._get_event_index(slug.replace('-', '_'))['event_index'].tolist() == [0, 1, 2]
+
+    db.close()
+
+
+def test_columnar_events(tmpdir):
+    """Make sure event summaries saved as columns read back like json events."""
+
+    slug = 's--0000-0077--0000-0000-0000-00d2--5001'
+    index = pd.date_range('2017-04-11T22:07:25', periods=4, freq='60s', tz='UTC')
+    events = pd.DataFrame({'event_id': [1, 2, 3, 4], 'peak': [1.5, np.nan, 2.0, 3.0], 'ok': [True, False, True, True],
+                           'state': ['moving', None, 'moving', 'stopped'], 'extra': [1, 'a', {'b': 2}, None]}, index=index)
+
+    outfile = str(tmpdir.join("out.hdf5"))
+    db = OfflineDatabase(outfile)
+    db.save_stream(slug, None, events=events.iloc[:2])
+    db.close()
+
+    db = OfflineDatabase(outfile, append=True)
+    assert db.columnar_events
+    db.append_stream(slug, None, events=events.iloc[2:])
+    db.close()
+
+    db = OfflineDatabase(outfile)
+    saved = db.fetch_events(slug)
+
+    legacy = OfflineDatabase()
+    legacy.columnar_events = False
+    legacy.save_stream(slug, None, events=events)
+
+    expected = legacy.fetch_events(slug)
+    assert list(saved.columns) == list(events.columns)
+    assert list(saved.index) == list(expected.index)
+    assert list(saved['event_id']) == [1, 2, 3, 4]
+    assert saved['peak'].equals(expected['peak'])
+    assert list(saved['ok']) == [True, False, True, True]
+    assert saved['state'].equals(expected['state'])
+    assert pd.isna(saved['state'].iloc[1])
+    assert list(saved['extra']) == list(expected['extra'])
+
+    ranged = db.fetch_events(slug, start=index[1], end=index[3])
+    assert pd.isna(ranged['state'].iloc[0])
+    assert list(ranged['state'].iloc[1:]) == ['moving']
+    assert len(db.fetch_events(slug, start=index[3] + pd.Timedelta(seconds=1))) == 0
+    assert db.count_streams([slug])[slug] == {'points': 0, 'events': 4}
+
+    legacy.close()
+    db.close()
+
+
+def test_columnar_events_widen(monkeypatch):
+    """Make sure appending events with compatible changes in their fields only changes the affected columns."""
+
+    slug = 's--0000-0077--0000-0000-0000-00d2--5001'
+    index = pd.date_range('2017-04-11T22:07:25', periods=5, freq='60s', tz='UTC')
+
+    db = OfflineDatabase()
+    db.save_stream(slug, None, events=pd.DataFrame({'event_id': [1, 2], 'peak': [1, 2], 'note': [None, None],
+                                                    'axis': ['x', 'y']}, index=index[:2]))
+
+    # None of these appends should need to read back the saved events
+    def _no_rewrite(*args, **kwargs):
+        raise AssertionError("Saved events were rewritten")
+
+    monkeypatch.setattr(EventColumns, 'read', _no_rewrite)
+
+    db.append_stream(slug, None, events=pd.DataFrame({'event_id': [3], 'peak': [2.5], 'note': [7], 'count': [4]},
+                                                     index=index[2:3]))
+    db.append_stream(slug, None, events=pd.DataFrame({'event_id': [4, 5], 'peak': [np.nan, 3], 'note': [None, 8.5],
+                                                      'axis': [None, 'z'], 'count': [None, None]}, index=index[3:]))
+    monkeypatch.undo()
+
+    columns = EventColumns(db._file.root.streams.s__0000_0077__0000_0000_0000_00d2__5001.event_columns).columns
+    assert columns == [('event_id', 'int'), ('peak', 'float'), ('note', 'float'), ('axis', 'string'), ('count', 'float')]
+
+    saved = db.fetch_events(slug)
+    assert list(saved.columns) == ['event_id', 'peak', 'note', 'axis', 'count']
+    assert list(saved['event_id']) == [1, 2, 3, 4, 5]
+    assert saved['peak'].equals(pd.Series([1.0, 2.0, 2.5, np.nan, 3.0], index=saved.index, name='peak'))
+    assert saved['note'].equals(pd.Series([np.nan, np.nan, 7.0, np.nan, 8.5], index=saved.index, name='note'))
+    assert saved['count'].equals(pd.Series([np.nan, np.nan, 4.0, np.nan, np.nan], index=saved.index, name='count'))
+    assert list(saved['axis'].iloc[[0, 1, 4]]) == ['x', 'y', 'z']
+    assert saved['axis'].iloc[2:4].isna().all()
+
+    db.close()
+
+
+def test_columnar_events_rewrite():
+    """Make sure appending events with incompatible fields rewrites the saved columns."""
+
+    slug = 's--0000-0077--0000-0000-0000-00d2--5001'
+    index = pd.date_range('2017-04-11T22:07:25', periods=3, freq='60s', tz='UTC')
+
+    db = OfflineDatabase()
+    db.save_stream(slug, None, events=pd.DataFrame({'event_id': [1, 2], 'peak': [1, 2], 'ok': [True, False]},
+                                                   index=index[:2]))
+    db.append_stream(slug, None, events=pd.DataFrame({'event_id': [3], 'peak': ['high'], 'ok': [None]}, index=index[2:]))
+
+    saved = db.fetch_events(slug)
+    assert list(saved.columns) == ['event_id', 'peak', 'ok']
+    assert list(saved['peak']) == [1, 2, 'high']
+    assert list(saved['ok']) == [True, False, None]
+    assert list(saved['event_id']) == [1, 2, 3]
+
+    db.close()
+
+
+def test_indexed_event_ranges():
+    """Make sure event time ranges are found with the timestamp index."""
+
+    slug = 's--0000-0077--0000-0000-0000-00d2--5001'
+    times = pd.DatetimeIndex(['2017-04-11T22:10:00', '2017-04-11T22:00:00', pd.NaT, '2017-04-11T22:05:00'])
+    events = pd.DataFrame({'event_id': [1, 2, 3, 4]}, index=times)
+    raw_events = pd.DataFrame([{'a': 1}, {'a': 2}, {'a': 3}, {'a': 4}], index=times)
+
+    db = OfflineDatabase()
+    db.save_stream(slug, None, events=events, raw_events=raw_events)
+    db.append_stream(slug, None, events=pd.DataFrame({'event_id': [5]}, index=pd.DatetimeIndex(['2017-04-11T22:01:00'])),
+                     raw_events=pd.DataFrame([{'a': 5}], index=pd.DatetimeIndex(['2017-04-11T22:01:00'])))
+
+    table = db._file.root.streams.s__0000_0077__0000_0000_0000_00d2__5001.event_index
+    assert table.cols.timestamp.is_indexed
+
+    ranged = db.fetch_events(slug, start='2017-04-11T22:00:30', end='2017-04-11T22:10:00')
+    assert list(ranged['event_id']) == [4, 5]
+    assert list(ranged.index) == [pd.Timestamp('2017-04-11T22:05:00'), pd.Timestamp('2017-04-11T22:01:00')]
+
+    assert list(db.fetch_events(slug, end='2017-04-11T22:05:00')['event_id']) == [2, 5]
+    assert list(db.fetch_raw_events(slug, start='2017-04-11T22:05:00')['a']) == [1, 4]
+    assert len(db.fetch_events(slug)) == 5
+
+    db.close()
+
+
+def test_unsorted_data_ranges():
+    """Make sure time ranges of data saved out of timestamp order are read with a query."""
+
+    slug = 's--0000-0077--0000-0000-0000-00d2--5001'
+    times = pd.DatetimeIndex(['2017-04-11T22:00:00', '2017-04-11T22:10:00', '2017-04-11T22:20:00'])
+
+    db = OfflineDatabase()
+    db.save_stream(slug, None, data=StreamSeries([1.0, 2.0, 3.0], index=times))
+
+    table = db._file.root.streams.s__0000_0077__0000_0000_0000_00d2__5001.data
+    assert table.get_attr(OfflineDatabase.SORTED_ATTR)
+
+    # Appending older data points leaves the table out of order
+    db.append_stream(slug, None, data=StreamSeries([4.0, 5.0], index=pd.DatetimeIndex(['2017-04-11T22:15:00',
+                                                                                          '2017-04-11T22:05:00'])))
+    assert not table.get_attr(OfflineDatabase.SORTED_ATTR)
+
+    ranged = db.fetch_datapoints(slug, start='2017-04-11T22:05:00', end='2017-04-11T22:20:00')
+    assert list(ranged.values[:, 0]) == [2.0, 4.0, 5.0]
+    assert len(db.fetch_datapoints(slug, start='2017-04-11T23:00:00')) == 0
+    assert len(db.fetch_datapoints(slug)) == 5
+
+    chunks = list(db.iter_datapoints(slug, chunk_rows=2, start='2017-04-11T22:05:00'))
+    assert [list(x.values[:, 0]) for x in chunks] == [[2.0, 3.0], [4.0, 5.0]]
+    assert db.sync_state(slug)['last_point'] == pd.Timestamp('2017-04-11T22:20:00', tz='UTC')
+
+    # Tables saved without the attribute are checked once
+    table.del_attr(OfflineDatabase.SORTED_ATTR)
+    assert not db._is_sorted(table)
+    assert len(db.fetch_datapoints(slug, end='2017-04-11T22:10:00')) == 2
+
+    db.close()
+
+
+def test_iter_datapoints(database):
+    """Make sure a stream can be read in chunks and summarized incrementally."""
+
+    slug = 's--0000-0077--0000-0000-0000-00d2--5001'
+    data = database.fetch_datapoints(slug)
+
+    chunks = list(database.iter_datapoints(slug, chunk_rows=3))
+    assert [len(x) for x in chunks[:-1]] == [3] * (len(chunks) - 1)
+    assert pd.concat(chunks).equals(data)
+
+    chunks = list(database.iter_datapoints(slug, chunk_rows=3, overlap=1, start=data.index[1]))
+    assert chunks[1].index[0] == chunks[0].index[-1]
+    assert list(chunks[0].index) == list(data.index[1:4])
+    assert sum(len(x) for x in chunks) == len(data) - 1 + len(chunks) - 1
+
+    x_values = data.index.astype('int64').values.astype(float)
+    whole = envelope_create(x_values.min(), x_values.max(), bin_count=4)
+    envelope_update(whole, np.column_stack([x_values, data.values[:, 0]]))
+
+    chunked = envelope_create(x_values.min(), x_values.max(), bin_count=4)
+    for chunk in database.iter_datapoints(slug, chunk_rows=2):
+        envelope_update(chunked, np.column_stack([chunk.index.astype('int64').values.astype(float), chunk.values[:, 0]]))
+
+    assert np.array_equal(envelope_finish(whole), envelope_finish(chunked), equal_nan=True)
+
+    with pytest.raises(ArgumentError):
+        list(database.iter_datapoints(slug, chunk_rows=0))
+
+    with pytest.raises(ArgumentError):
+        list(database.iter_datapoints(slug, overlap=-1))
@@ -3,7 +3,9 @@
 import os
 import pytest
 from iotile_analytics.core import AnalysisGroup, CloudSession
-from iotile_analytics.core.exceptions import UsageError
+from typedargs.exceptions import ArgumentError
+from iotile_analytics.core.exceptions import UsageError, CloudError
+from iotile_analytics.offline import OfflineDatabase
 from iotile_analytics.interactive.scripts.analytics_host import main
 
 
@@ -55,3 +57,175 @@ def test_save_directory_check(shipping_group, tmpdir):
 
     with pytest.raises(UsageError):
         shipping_group.save(outfile, 'hdf5')
+
+
+def test_save_incremental(shipping_group, tmpdir):
+    """Make sure incremental saves only append data that is not already saved."""
+
+    outfile = str(tmpdir.join("out.hdf5"))
+    shipping_group.save(outfile, 'hdf5')
+    shipping_group.save(outfile, 'hdf5', incremental=True)
+
+    ingroup = AnalysisGroup.FromSaved(outfile, 'hdf5')
+    assert ingroup.stream_counts == shipping_group.stream_counts
+
+    for slug in shipping_group.streams:
+        if shipping_group.stream_empty(slug):
+            continue
+
+        saved = ingroup.fetch_stream(slug)
+        assert len(saved) == len(shipping_group.fetch_stream(slug))
+        assert saved.index.is_monotonic_increasing
+        assert len(ingroup.fetch_events(slug)) == len(shipping_group.fetch_events(slug))
+
+
+def test_save_incremental_appends(shipping_group, tmpdir):
+    """Make sure incremental saves fetch data newer than a previous save."""
+
+    outfile = str(tmpdir.join("out.hdf5"))
+    slug, data = [(x, shipping_group.fetch_stream(x)) for x in shipping_group.streams
+                  if not shipping_group.stream_empty(x) and len(shipping_group.fetch_stream(x)) > 1][0]
+
+    midpoint = data.index[len(data) // 2]
+
+    db = OfflineDatabase(outfile)
+    db.save_stream(slug, shipping_group.streams[slug], shipping_group.fetch_stream(slug, end=midpoint))
+    db.close()
+
+    db = OfflineDatabase(outfile, append=True)
+    state = db.sync_state(slug)
+    assert state['last_point'] < midpoint
+    assert state['last_event'] is None
+    assert db.sync_state('s--0000-0000-0000-0000') is None
+    db.close()
+
+    shipping_group.save(outfile, 'hdf5', incremental=True)
+
+    ingroup = AnalysisGroup.FromSaved(outfile, 'hdf5')
+    assert ingroup.stream_counts == shipping_group.stream_counts
+    assert list(ingroup.fetch_stream(slug).values) == list(data.values)
+    assert len(ingroup.fetch_events(slug)) == len(shipping_group.fetch_events(slug))
+
+
+def test_save_incremental_missing_file(shipping_group, tmpdir):
+    """Make sure an incremental save to a new file saves everything."""
+
+    outfile = str(tmpdir.join("out.hdf5"))
+    shipping_group.save(outfile, 'hdf5', incremental=True)
+
+    ingroup = AnalysisGroup.FromSaved(outfile, 'hdf5')
+    assert ingroup.stream_counts == shipping_group.stream_counts
+
+
+def test_save_incremental_unsupported(shipping_group, tmpdir, monkeypatch):
+    """Make sure formats without append support are rejected but their own errors are not masked."""
+
+    def _no_append(path, compression=None):
+        raise AssertionError("Save format should not have been called")
+
+    def _broken(path, append=False, **kwargs):
+        raise TypeError("Bug inside the save format")
+
+    outfile = str(tmpdir.join("out.hdf5"))
+
+    monkeypatch.setattr(AnalysisGroup, '_find_save_format', classmethod(lambda cls, name: _no_append))
+    with pytest.raises(ArgumentError):
+        shipping_group.save(outfile, 'custom', incremental=True)
+
+    with pytest.raises(ArgumentError):
+        shipping_group.save(outfile, 'custom', level=5)
+
+    monkeypatch.setattr(AnalysisGroup, '_find_save_format', classmethod(lambda cls, name: _broken))
+    with pytest.raises(TypeError):
+        shipping_group.save(outfile, 'custom', incremental=True)
+
+
+@pytest.mark.parametrize("max_fetches,queue_size", [(1, 1), (8, 2)])
+def test_save_pipelined(shipping_group, tmpdir, max_fetches, queue_size):
+    """Make sure saving gives the same result however many streams are in flight."""
+
+    outfile = str(tmpdir.join("out.hdf5"))
+    shipping_group.save(outfile, 'hdf5', max_fetches=max_fetches, queue_size=queue_size)
+
+    ingroup = AnalysisGroup.FromSaved(outfile, 'hdf5')
+    assert ingroup.stream_counts == shipping_group.stream_counts
+
+    for slug in shipping_group.streams:
+        if shipping_group.stream_empty(slug):
+            continue
+
+        assert list(ingroup.fetch_stream(slug).values) == list(shipping_group.fetch_stream(slug).values)
+
+
+def test_save_fetch_error(shipping_group, tmpdir, monkeypatch):
+    """Make sure an error fetching one stream stops the save and is raised."""
+
+    def _fail(*_args, **_kwargs):
+        raise CloudError("Injected error")
+
+    monkeypatch.setattr(shipping_group, 'fetch_stream', _fail)
+
+    outfile = str(tmpdir.join("out.hdf5"))
+    with pytest.raises(CloudError):
+        shipping_group.save(outfile, 'hdf5', max_fetches=2, queue_size=1)
+
+    with pytest.raises(ArgumentError):
+        shipping_group.save(outfile, 'hdf5', max_fetches=0)
+
+
+def test_frame_cache_offline(shipping_group, tmpdir):
+    """Make sure the frame cache works with saved files."""
+
+    outfile = str(tmpdir.join("out.hdf5"))
+    shipping_group.save(outfile, 'hdf5')
+
+    ingroup = AnalysisGroup.FromSaved(outfile, 'hdf5')
+    ingroup.enable_frame_cache(10*1024*1024)
+
+    slug = [x for x in ingroup.streams if not ingroup.stream_empty(x)][0]
+    data = ingroup.fetch_stream(slug)
+    assert ingroup.fetch_stream(slug).equals(data)
+
+    stats = ingroup.frame_cache_stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+
+
+@pytest.mark.parametrize("compression", ['none', 'zlib', 'lz4', 'zstd', {'complib': 'blosc:lz4', 'complevel': 9, 'bitshuffle': True}])
+def test_save_compression(shipping_group, tmpdir, compression):
+    """Make sure streams saved with any compression setting read back the same."""
+
+    outfile = str(tmpdir.join("out.hdf5"))
+    shipping_group.save(outfile, 'hdf5', compression=compression)
+
+    ingroup = AnalysisGroup.FromSaved(outfile, 'hdf5')
+    assert ingroup.stream_counts == shipping_group.stream_counts
+
+    for slug in shipping_group.streams:
+        if shipping_group.stream_empty(slug):
+            continue
+
+        assert list(ingroup.fetch_stream(slug).values) == list(shipping_group.fetch_stream(slug).values)
+        assert len(ingroup.fetch_events(slug)) == len(shipping_group.fetch_events(slug))
+
+
+def test_compression_settings(tmpdir):
+    """Make sure compression and chunk settings are applied to new streams and checked."""
+
+    outfile = str(tmpdir.join("out.hdf5"))
+    slug = 's--0000-0077--0000-0000-0000-00d2--5001'
+
+    db = OfflineDatabase(outfile, compression='zstd', chunk_rows=512)
+    db.save_stream(slug, None)
+    data = db._file.root.streams.s__0000_0077__0000_0000_0000_00d2__5001.data
+    assert data.filters.complib == 'blosc:zstd'
+    assert data.filters.bitshuffle
+    assert data.chunkshape == (512,)
+    db.close()
+
+    for compression in ['unknown', {'level': 1}, {'complib': 'nolib'}, {'complevel': 20}]:
+        with pytest.raises(ArgumentError):
+            OfflineDatabase(compression=compression)
+
+    with pytest.raises(ArgumentError):
+        OfflineDatabase(chunk_rows=0)
@@ -1 +1 @@
-version = "0.3.0"
+version = "0.4.0"
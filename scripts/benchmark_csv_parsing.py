@@ -0,0 +1,83 @@
+"""Compare the speed of parsing df API responses with the old and new parsers.
+
+The old parser decoded the response to a string, split it into rows and
+columns in python and converted each value and timestamp individually.  The
+new parser is IOTileCloudChannel.parse_datapoint_csv.
+
+Usage: python benchmark_csv_parsing.py [--points N] [--repeat R]
+"""
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+
+import argparse
+import datetime
+import time
+import pandas as pd
+from iotile_analytics.core.stream_series import StreamSeries
+from iotile_analytics.core.channels.cloud_api import IOTileCloudChannel
+
+
+def generate_csv(points):
+    """Generate a df API response with the given number of points."""
+
+    start = datetime.datetime(2017, 4, 11, 22, 7, 25, 972121)
+    step = datetime.timedelta(seconds=10, microseconds=17)
+
+    rows = ['row,int_value,stream_slug']
+    for i in range(0, points):
+        timestamp = (start + i*step).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        rows.append('%s,%d,s--0000-0077--0000-0000-0000-00d2--5001' % (timestamp, i % 1000))
+
+    return "\n".join(rows).encode('utf-8')
+
+
+def legacy_parse(raw_data):
+    """The parser used by fetch_datapoints before it was vectorized."""
+
+    str_data = raw_data.decode('utf-8')
+    rows = str_data.splitlines()
+    data = [x.split(',') for x in rows]
+    data = data[1:]
+
+    dt_index = pd.to_datetime([x[0] for x in data])
+    return StreamSeries([float(x[1]) for x in data], index=dt_index)
+
+
+def best_time(func, raw_data, repeat):
+    """Return the fastest of repeat runs of func(raw_data) in seconds."""
+
+    best = None
+    for _i in range(0, repeat):
+        start = time.time()
+        func(raw_data)
+        elapsed = time.time() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--points', type=int, default=1000000, help="The number of data points to parse")
+    parser.add_argument('--repeat', type=int, default=3, help="The number of runs to take the best time from")
+    args = parser.parse_args()
+
+    raw_data = generate_csv(args.points)
+    size_mb = len(raw_data) / 1e6
+
+    old = legacy_parse(raw_data)
+    new = IOTileCloudChannel.parse_datapoint_csv(raw_data)
+    if not (old.values == new.values).all() or len(old.index) != len(new.index):
+        raise RuntimeError("Parsers did not produce the same data")
+
+    print("Parsing %d points (%.1f MB)" % (args.points, size_mb))
+
+    for name, func in [('legacy', legacy_parse), ('vectorized', IOTileCloudChannel.parse_datapoint_csv)]:
+        elapsed = best_time(func, raw_data, args.repeat)
+        print("%-12s %8.3f s  %10.0f points/s  %8.1f MB/s" % (name, elapsed, args.points / elapsed, size_mb / elapsed))
+
+
+if __name__ == '__main__':
+    main()
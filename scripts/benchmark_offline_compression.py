@@ -0,0 +1,103 @@
+"""Compare file size, save time and load time of offline files across compression settings.
+
+The stream data imitates a sensor that is sampled every 10 seconds with
+some jitter in the sample times and reports a slowly varying, quantized
+value with noise, along with periodic events with a few summary fields.
+
+Usage: python benchmark_offline_compression.py [--points N] [--events E] [--repeat R] [--chunk-rows C]
+"""
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from iotile_analytics.core.stream_series import StreamSeries
+from iotile_analytics.offline import OfflineDatabase
+
+
+SLUG = 's--0000-0077--0000-0000-0000-00d2--5001'
+
+
+def generate_stream(points, events):
+    """Generate realistic looking data points and events."""
+
+    rng = np.random.RandomState(0)
+
+    jitter = rng.randint(-500, 500, size=points).astype('timedelta64[ms]')
+    timestamps = np.datetime64('2017-04-11T22:07:25') + np.arange(0, points) * np.timedelta64(10, 's') + jitter
+    signal = 20.0 + 5.0 * np.sin(np.arange(0, points) / 8640.0 * 2 * np.pi) + rng.normal(0, 0.2, size=points)
+    data = StreamSeries(np.round(signal, 1), index=pd.DatetimeIndex(timestamps).tz_localize('UTC'))
+
+    event_times = pd.date_range('2017-04-11T22:07:25', periods=events, freq='15min', tz='UTC')
+    event_data = pd.DataFrame({'event_id': np.arange(0, events), 'peak': np.round(rng.gamma(2, 1.5, size=events), 2),
+                               'duration': rng.randint(10, 500, size=events),
+                               'axis': np.array(['x', 'y', 'z'])[rng.randint(0, 3, size=events)]}, index=event_times)
+
+    return data, event_data
+
+
+def best_time(func, repeat):
+    """Return the fastest of repeat runs of func in seconds."""
+
+    best = None
+    for _i in range(0, repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--points', type=int, default=2000000, help="The number of data points to save")
+    parser.add_argument('--events', type=int, default=20000, help="The number of events to save")
+    parser.add_argument('--repeat', type=int, default=3, help="The number of runs to take the best time from")
+    parser.add_argument('--chunk-rows', type=int, default=None, help="The number of rows in each HDF5 chunk")
+    args = parser.parse_args()
+
+    data, events = generate_stream(args.points, args.events)
+    folder = tempfile.mkdtemp()
+
+    print("Saving %d points and %d events" % (args.points, args.events))
+    print("%-10s %10s %10s %10s %12s" % ('codec', 'size (MB)', 'save (s)', 'load (s)', 'events (s)'))
+
+    try:
+        for name in [None] + sorted(OfflineDatabase.COMPRESSION_PRESETS):
+            path = os.path.join(folder, '%s.hdf5' % name)
+
+            def _save():
+                if os.path.exists(path):
+                    os.remove(path)
+
+                with OfflineDatabase(path, compression=name, chunk_rows=args.chunk_rows) as db:
+                    db.save_stream(SLUG, None, data, events)
+
+            def _load():
+                with OfflineDatabase(path) as db:
+                    db.fetch_datapoints(SLUG)
+
+            def _load_events():
+                with OfflineDatabase(path) as db:
+                    db.fetch_events(SLUG)
+
+            save_time = best_time(_save, args.repeat)
+            load_time = best_time(_load, args.repeat)
+            event_time = best_time(_load_events, args.repeat)
+            size_mb = os.path.getsize(path) / 1e6
+
+            print("%-10s %10.1f %10.3f %10.3f %12.3f" % (name or 'default', size_mb, save_time, load_time, event_time))
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Compare the speed of saving streams to an OfflineDatabase row by row and in bulk.
+
+The old writer appended each data point and event to its PyTables table
+one row at a time while iterating over the DataFrame with iterrows.  The
+new writer is OfflineDatabase.save_stream, which appends structured arrays.
+
+Usage: python benchmark_offline_writes.py [--points N] [--events E] [--repeat R]
+"""
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from iotile_analytics.core.stream_series import StreamSeries
+from iotile_analytics.offline import OfflineDatabase
+
+
+SLUG = 's--0000-0077--0000-0000-0000-00d2--5001'
+
+
+def generate_stream(points, events):
+    """Generate data points and events spaced 10 seconds apart."""
+
+    index = pd.date_range('2017-04-11T22:07:25.972121', periods=points, freq='10s', tz='UTC')
+    data = StreamSeries(np.arange(0, points) % 1000, index=index)
+
+    event_index = pd.date_range('2017-04-11T22:07:25', periods=events, freq='60s', tz='UTC')
+    event_data = pd.DataFrame({'event_id': np.arange(0, events), 'axis': np.arange(0, events) % 3,
+                               'peak': np.arange(0, events) / 7.0}, index=event_index)
+
+    return data, event_data
+
+
+def legacy_save(db, data, events):
+    """The loops used by save_stream before it appended in bulk."""
+
+    db.save_stream(SLUG, None)
+    group = getattr(db._file.root.streams, SLUG.replace('-', '_'))
+
+    row = group.event_index.row
+    for i, (timestamp, event) in enumerate(events.iterrows()):
+        row['timestamp'] = OfflineDatabase._to_timecol(timestamp)
+        row['event_id'] = event['event_id']
+        row['event_index'] = i
+        row.append()
+
+        group.events.append(OfflineDatabase._encode_json(event.to_dict()))
+
+    group.event_index.flush()
+
+    row = group.data.row
+    for timestamp, point in data.iterrows():
+        row['timestamp'] = OfflineDatabase._to_timecol(timestamp)
+        row['internal_value'] = point[0]
+        row.append()
+
+    group.data.flush()
+
+
+def bulk_save(db, data, events):
+    """The current save_stream."""
+
+    db.save_stream(SLUG, None, data, events)
+
+
+def best_time(func, data, events, repeat):
+    """Return the fastest of repeat runs of func in seconds, each into a new in-memory database."""
+
+    best = None
+    for _i in range(0, repeat):
+        db = OfflineDatabase()
+
+        start = time.time()
+        func(db, data, events)
+        elapsed = time.time() - start
+
+        db.close()
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--points', type=int, default=1000000, help="The number of data points to save")
+    parser.add_argument('--events', type=int, default=10000, help="The number of events to save")
+    parser.add_argument('--repeat', type=int, default=3, help="The number of runs to take the best time from")
+    args = parser.parse_args()
+
+    data, events = generate_stream(args.points, args.events)
+
+    print("Saving %d points and %d events" % (args.points, args.events))
+
+    for name, func in [('legacy', legacy_save), ('bulk', bulk_save)]:
+        elapsed = best_time(func, data, events, args.repeat)
+        print("%-12s %8.3f s  %10.0f points/s" % (name, elapsed, (args.points + args.events) / elapsed))
+
+
+if __name__ == '__main__':
+    main()